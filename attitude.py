@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from decoder import ASSI_ACCEL, ASSI_GYRO, valori_fisici
+from resampler import tempi_crescenti
+
+
+# ---------------------------
+# QUATERNIONI
+# ---------------------------
+# Quaternioni [w, x, y, z] lungo l'ultimo asse; q ruota dal riferimento del sensore a quello
+# terrestre (z verso l'alto): v_terra = q ⊗ v_sensore ⊗ q*
+def _prodotto(p, q):
+    """Prodotto di Hamilton p ⊗ q su quaternioni con le componenti lungo il primo asse (4, ...)."""
+    pw, px, py, pz = p
+    qw, qx, qy, qz = q
+    return np.stack([pw * qw - px * qx - py * qy - pz * qz,
+                     pw * qx + px * qw + py * qz - pz * qy,
+                     pw * qy - px * qz + py * qw + pz * qx,
+                     pw * qz + px * qy - py * qx + pz * qw])
+
+
+def prodotto(p, q):
+    """Prodotto di Hamilton p ⊗ q, elemento per elemento su array (..., 4)."""
+    return np.moveaxis(_prodotto(np.moveaxis(p, -1, 0), np.moveaxis(q, -1, 0)), 0, -1)
+
+
+def verticale(q):
+    """
+    Terza riga della matrice di rotazione di q (n, 4): il prodotto scalare con un vettore del
+    sensore ne dà la componente verticale nel riferimento terrestre.
+    """
+    w, x, y, z = q.T
+    return np.column_stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)])
+
+
+def _scansione(c, blocco=32):
+    """
+    Prodotti cumulativi di quaternioni (4, n) a blocchi: i prodotti dentro i blocchi avanzano
+    insieme per tutti i blocchi (`blocco` passi vettoriali), i totali dei blocchi sono
+    composti ricorsivamente e infine applicati ai blocchi successivi. Lavoro O(n).
+    """
+    n = c.shape[1]
+    if n <= blocco:
+        for k in range(1, n):
+            c[:, k] = _prodotto(c[:, k - 1], c[:, k])
+        return c
+    m = -(-n // blocco)
+    blocchi = np.zeros((4, m * blocco))
+    blocchi[0, n:] = 1  # identità in coda
+    blocchi[:, :n] = c
+    blocchi = np.ascontiguousarray(blocchi.reshape(4, m, blocco).transpose(0, 2, 1))  # (4, blocco, m)
+    for k in range(1, blocco):
+        blocchi[:, k] = _prodotto(blocchi[:, k - 1], blocchi[:, k])
+    totali = _scansione(blocchi[:, -1].copy(), blocco)
+    blocchi[:, :, 1:] = _prodotto(totali[:, np.newaxis, :-1], blocchi[:, :, 1:])
+    return blocchi.transpose(0, 2, 1).reshape(4, -1)[:, :n]
+
+
+def prodotti_cumulativi(q):
+    """Prodotti q_0 ⊗ q_1 ⊗ ... ⊗ q_k per ogni k, su array (n, 4), senza un ciclo per campione."""
+    c = _scansione(np.array(np.asarray(q, dtype=float).T))
+    return (c / np.linalg.norm(c, axis=0)).T
+
+
+def allineamento(direzioni):
+    """
+    Quaternioni (rotazione minima) che portano le direzioni (n, 3) del sensore sull'asse z
+    terrestre: con le direzioni della gravità misurata danno l'assetto a meno dell'imbardata.
+    """
+    u = direzioni / np.linalg.norm(direzioni, axis=-1, keepdims=True)
+    q = np.column_stack([1 + u[:, 2], u[:, 1], -u[:, 0], np.zeros(len(u))])
+    # Direzione opposta a z: mezzo giro attorno all'asse x
+    capovolte = q[:, 0] < 1e-9
+    q[capovolte] = [0.0, 1.0, 0.0, 0.0]
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+# ---------------------------
+# ASSETTO
+# ---------------------------
+def istante_lancio(tempi, accel_g, soglia=2.0, tempo_iniziale=1):
+    """Primo istante dopo `tempo_iniziale` in cui il modulo dell'accelerazione supera `soglia` g (None se mai)."""
+    tempi = np.asarray(tempi)
+    oltre = (np.linalg.norm(accel_g, axis=1) > soglia) & (tempi > tempo_iniziale)
+    return tempi[np.argmax(oltre)] if oltre.any() else None
+
+
+def integra_assetto(tempi, accel_g, gyro_dps, tempo_iniziale=1, fine_pad=None, tau_pad=0.5, soglia_lancio=2.0,
+                    asse_razzo=None):
+    """
+    Assetto dall'IMU: sul pad (fino a `fine_pad`) è l'inclinazione della gravità misurata,
+    filtrata con un passa basso causale di costante `tau_pad` (filtro complementare con i
+    giroscopi fermi); da `fine_pad` in poi è l'assetto sul pad composto con le rotazioni
+    dei giroscopi, meno il bias medio dei primi `tempo_iniziale` secondi. Le rotazioni di
+    ogni passo sono calcolate in blocco e composte con prodotti_cumulativi.
+
+    :param tempi: Tempi [s] crescenti
+    :param accel_g: Accelerometro (n, 3) [g]
+    :param gyro_dps: Giroscopi (n, 3) [°/s]
+    :param fine_pad: Fine della correzione con l'accelerometro [s] (default: istante_lancio;
+                     senza lancio tutto il log è considerato pad)
+    :param asse_razzo: Direzione dell'asse del razzo (verso la punta) nel riferimento del sensore;
+                       default: l'asse del sensore più vicino alla gravità sul pad, col suo verso
+                       (così l'inclinazione della rampa resta nell'inclinazione)
+    :return: (quaternioni (n, 4), inclinazione dell'asse del razzo dalla verticale [°],
+              accelerazione specifica verticale nel riferimento terrestre [g], 1 a riposo)
+    """
+    tempi = np.asarray(tempi, dtype=float)
+    accel_g = np.asarray(accel_g, dtype=float)
+    gyro = np.radians(np.asarray(gyro_dps, dtype=float))
+    n = len(tempi)
+    pad = tempi <= tempo_iniziale
+    if fine_pad is None:
+        fine_pad = istante_lancio(tempi, accel_g, soglia_lancio, tempo_iniziale)
+    fine = n if fine_pad is None else int(np.searchsorted(tempi, fine_pad, side='left'))
+    fine = max(fine, 1)
+
+    # Pad: gravità filtrata (passa basso del primo ordine, partendo dal primo campione)
+    dt = np.median(np.diff(tempi)) if n > 1 else 1.0
+    alfa = 1 - np.exp(-dt / tau_pad)
+    gravita = lfilter([alfa], [1, alfa - 1], accel_g[:fine], axis=0, zi=((1 - alfa) * accel_g[:1]))[0]
+    quaternioni = np.empty((n, 4))
+    quaternioni[:fine] = allineamento(gravita)
+
+    # Volo: rotazioni dei giroscopi passo per passo, composte a partire dall'assetto sul pad
+    if fine < n:
+        omega = gyro[fine - 1:-1] - gyro[pad].mean(axis=0)
+        angoli = omega * np.diff(tempi[fine - 1:])[:, np.newaxis]
+        modulo = np.linalg.norm(angoli, axis=1, keepdims=True)
+        asse = np.divide(angoli, modulo, out=np.zeros_like(angoli), where=modulo > 0)
+        rotazioni = np.column_stack([np.cos(modulo / 2), asse * np.sin(modulo / 2)])
+        rotazioni[0] = prodotto(quaternioni[fine - 1], rotazioni[0])
+        quaternioni[fine:] = prodotti_cumulativi(rotazioni)
+
+    if asse_razzo is None:
+        i = np.argmax(np.abs(gravita[-1]))
+        asse_razzo = np.sign(gravita[-1][i]) * np.eye(3)[i]
+    asse_razzo = np.asarray(asse_razzo, dtype=float) / np.linalg.norm(asse_razzo)
+    riga = verticale(quaternioni)
+    inclinazione = np.degrees(np.arccos(np.clip(riga @ asse_razzo, -1, 1)))
+    return quaternioni, inclinazione, np.einsum('ij,ij->i', riga, accel_g)
+
+
+def assetto_imu(df_imu, tempo_iniziale=1, fine_pad=None, tau_pad=0.5, soglia_lancio=2.0, asse_razzo=None):
+    """
+    integra_assetto su un DataFrame IMU (grezzo o con le colonne ASSI_ACCEL e ASSI_GYRO), con
+    `tempo_iniziale` e `fine_pad` in secondi dal primo campione IMU.
+
+    :return: DataFrame con 'timestamp_sec', 'quat_w'..'quat_z', 'tilt_deg' e 'accel_vertical_g'
+    """
+    tempi = df_imu['timestamp_sec'].to_numpy(dtype=float)
+    crescenti = tempi_crescenti(tempi)
+    tempi = tempi[crescenti]
+    tempo_iniziale += tempi[0]  # tempi IMU nella base micros() del logger
+    if fine_pad is not None:
+        fine_pad += tempi[0]
+    accel = np.column_stack([valori_fisici(df_imu, c)[crescenti] for c in ASSI_ACCEL]).astype(float)
+    gyro = np.column_stack([valori_fisici(df_imu, c)[crescenti] for c in ASSI_GYRO]).astype(float)
+    quaternioni, inclinazione, accel_verticale = integra_assetto(tempi, accel, gyro, tempo_iniziale, fine_pad,
+                                                           tau_pad, soglia_lancio, asse_razzo)
+    return pd.DataFrame({'timestamp_sec': tempi,
+                         'quat_w': quaternioni[:, 0], 'quat_x': quaternioni[:, 1],
+                         'quat_y': quaternioni[:, 2], 'quat_z': quaternioni[:, 3],
+                         'tilt_deg': inclinazione, 'accel_vertical_g': accel_verticale})
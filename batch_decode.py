@@ -0,0 +1,105 @@
+import argparse
+import csv
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from decode_cache import MAX_BYTES_PREDEFINITO, DecodeCache, cartella_cache_predefinita
+from decoder import srotola_micros
+
+CAMPI_RIEPILOGO = ['file', 'RP', 'pacchetti_imu', 'pacchetti_bmp', 'durata_s',
+                   'byte_saltati', 'secondi_decodifica', 'errore']
+
+
+def trova_log(cartella, pattern='log_*_RP*.bin'):
+    """Tutti i log che corrispondono a `pattern` in `cartella` e nelle sue sottocartelle (es. 2bar, 3bar)."""
+    return sorted(glob.glob(os.path.join(cartella, '**', pattern), recursive=True))
+
+
+def _decodifica_log(path, cache_dir, max_bytes, resync):
+    """
+    Lavoro di un processo: decodifica un log nella cache condivisa e ne restituisce il
+    riepilogo e la voce dell'indice (nuova, o None), che solo il processo principale scrive.
+    """
+    match = re.findall(r'\d+', os.path.basename(path))
+    riga = {'file': path, 'RP': match[-1] if match else ''}
+    voce = None
+    t = time.perf_counter()
+    try:
+        cache = DecodeCache(cache_dir, max_bytes)
+        percorso, voce_indice, nuova = cache.voce_indice(path)
+        voce = (percorso, voce_indice) if nuova else None
+        imu_data, bmp_data, report = cache.leggi_log(path, resync, cache.chiave_voce(voce_indice, resync))
+        riga['pacchetti_imu'] = len(imu_data)
+        riga['pacchetti_bmp'] = len(bmp_data)
+        if len(bmp_data):
+            ts = srotola_micros(bmp_data['timestamp'])
+            riga['durata_s'] = round((int(ts.max()) - int(ts.min())) / 1e6, 3)
+        riga['byte_saltati'] = report['byte_saltati']
+    except Exception as e:
+        # Un log illeggibile non deve fermare il resto della campagna
+        riga['errore'] = f"{type(e).__name__}: {e}"
+    riga['secondi_decodifica'] = round(time.perf_counter() - t, 3)
+    return riga, voce
+
+
+def decode_campaign(cartella, output_dir=None, workers=None, pattern='log_*_RP*.bin',
+                    resync=True, max_bytes=MAX_BYTES_PREDEFINITO):
+    """
+    Decodifica in parallelo tutti i log di una campagna (es. LanciRaw) nella cache condivisa
+    `output_dir`, da cui plotter.py li rilegge senza decodificarli di nuovo.
+    Scrive `riepilogo.csv` in `output_dir` e restituisce le righe del riepilogo.
+
+    :param cartella: Cartella radice dei log
+    :param output_dir: Cartella della cache condivisa (default: cartella_cache_predefinita())
+    :param workers: Numero di processi (default: numero di CPU)
+    :param pattern: Pattern dei nomi dei log
+    :param resync: Riprende dopo i tratti corrotti (vedi Decoder.decode)
+    :param max_bytes: Dimensione massima della cache [byte]
+    """
+    output_dir = output_dir or cartella_cache_predefinita()
+    os.makedirs(output_dir, exist_ok=True)
+    files = trova_log(cartella, pattern)
+    print(f"Trovati {len(files)} log in {cartella}")
+
+    righe = []
+    voci = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_decodifica_log, path, output_dir, max_bytes, resync): path for path in files}
+        for future in as_completed(futures):
+            try:
+                riga, voce = future.result()
+                if voce is not None:
+                    voci[voce[0]] = voce[1]
+            except Exception as e:
+                # Processo terminato in modo anomalo (es. memoria esaurita)
+                riga = {'file': futures[future], 'errore': f"{type(e).__name__}: {e}"}
+            righe.append(riga)
+            stato = riga.get('errore') or f"{riga['pacchetti_imu']} IMU, {riga['pacchetti_bmp']} BMP"
+            print(f"[{len(righe)}/{len(files)}] {os.path.basename(riga['file'])}: {stato}")
+
+    # Indice scritto solo qui: scritture concorrenti dei processi perderebbero voci
+    DecodeCache(output_dir, max_bytes).aggiorna_indice(voci)
+    righe.sort(key=lambda r: r['file'])
+    with open(os.path.join(output_dir, 'riepilogo.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CAMPI_RIEPILOGO)
+        writer.writeheader()
+        writer.writerows(righe)
+    return righe
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Decodifica in parallelo una campagna di lanci')
+    parser.add_argument('cartella', help=r'Cartella dei log, es. C:\Users\fanin\Desktop\Dati WR\LanciRaw')
+    parser.add_argument('--output', default=None, help='Cartella della cache condivisa')
+    parser.add_argument('--workers', type=int, default=None, help='Numero di processi')
+    parser.add_argument('--pattern', default='log_*_RP*.bin')
+    parser.add_argument('--no-resync', action='store_true', help='Si ferma al primo tratto corrotto')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    righe = decode_campaign(args.cartella, args.output, args.workers, args.pattern, not args.no_resync)
+    errori = sum(1 for r in righe if r.get('errore'))
+    print(f"Campagna decodificata in {time.perf_counter() - t0:.1f} s ({errori} errori)")
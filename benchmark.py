@@ -0,0 +1,469 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from Filter import (IMUFilter, RocketDataStream, filtro_kalman, process_rocket_baro, process_rocket_columns,
+                    smoother_accelerazione_costante, smoother_kalman, sopprimi_spike)
+from attitude import integra_assetto
+from decoder import COLONNE_FISICHE, Decoder, colonne_fisiche, leggi_log, rimuovi_salti, srotola_micros
+from flight import rileva_eventi, stampa_eventi
+from fusion import G0, fondi
+from pipeline import CONFIGURAZIONI, STADI
+from resampler import allinea, stampa_report
+from riferimenti import (allinea_pandas, assetto_loop, decode_originale, decode_struct, kalman_filter_loop,
+                         process_per_colonna, rimuovi_salti_loop, rimuovi_spike_loop)
+from sintetici import genera_log, volo_imu_sintetico, volo_sintetico
+from sweep import griglia_parametri, sweep
+
+# Solo tempi e speedup: l'equivalenza con i riferimenti è verificata dai test in tests/
+
+
+def _cronometra(funzione, *args, ripetizioni=1):
+    migliore = float('inf')
+    for _ in range(ripetizioni):
+        t = time.perf_counter()
+        funzione(*args)
+        migliore = min(migliore, time.perf_counter() - t)
+    return migliore
+
+
+# ---------------------------
+# BENCHMARK
+# ---------------------------
+# Misura di riferimento (benchmark.py decode --secondi 12000, log da 311 MB, 12M pacchetti IMU):
+# parsing 65.5 s -> 2.0 s (32x), Decoder.decode completo 140.0 s -> 2.95 s (47x). Il riferimento
+# converte i record in DataFrame a blocchi di --blocco pacchetti: con tutte le tuple in memoria
+# come il decoder originale servirebbero più di 4 GB.
+def bench_decode(args):
+    with tempfile.TemporaryDirectory() as cartella:
+        path = genera_log(os.path.join(cartella, 'log_bench_RP0.bin'), args.secondi)
+        mb = os.path.getsize(path) / 1e6
+        print(f"Log sintetico: {mb:.0f} MB, {args.secondi:.0f} s a 1 kHz")
+        t_new = _cronometra(leggi_log, path, ripetizioni=3)
+        print(f"Parsing mmap + numpy (leggi_log):      {t_new:8.2f} s")
+        t_tot = _cronometra(lambda: Decoder(path).decode())
+        print(f"Decoder.decode completo (DataFrame):   {t_tot:8.2f} s")
+        if not args.solo_nuovo:
+            t_old = _cronometra(decode_struct, path, args.blocco)
+            print(f"Parsing f.read + struct.unpack:        {t_old:8.2f} s")
+            t_old_tot = _cronometra(decode_originale, path, args.blocco)
+            print(f"Decoder.decode originale completo:     {t_old_tot:8.2f} s")
+            print(f"Speedup parsing: {t_old / t_new:.1f}x, decode completo: {t_old_tot / t_tot:.1f}x")
+        df_imu = Decoder(path).decode()[2]
+        compatto = df_imu.memory_usage(index=False).sum()
+        completo = colonne_fisiche(df_imu).memory_usage(index=False).sum()
+        print(f"DataFrame IMU: {compatto / 2 ** 20:.0f} MB compatto, {completo / 2 ** 20:.0f} MB "
+              f"con tutte le colonne in unità fisiche")
+
+
+def bench_timeline(args):
+    rng = np.random.default_rng(0)
+    n = int(args.secondi * 100)
+    # BMP a 100 Hz con jitter e un salto ogni ~10 minuti (SD rimontata, reset del sensore)
+    ts = np.cumsum(rng.normal(0.01, 0.0005, n))
+    salti = rng.choice(n, max(1, n // 60_000), replace=False)
+    for i in salti:
+        ts[i:] += rng.uniform(1, 30)
+    df = pd.DataFrame({'timestamp_sec': ts, 'altitude': rng.normal(0, 0.3, n)})
+    print(f"BMP sintetico: {n} campioni, {len(salti)} salti")
+
+    t_new = _cronometra(lambda: rimuovi_salti(df.copy()), ripetizioni=5)
+    print(f"rimuovi_salti vettoriale:              {t_new * 1e3:8.1f} ms")
+    if not args.solo_nuovo:
+        t_old = _cronometra(lambda: rimuovi_salti_loop(df.copy()))
+        print(f"rimuovi_salti ciclo .iloc:             {t_old * 1e3:8.1f} ms")
+        print(f"Speedup: {t_old / t_new:.0f}x")
+
+    # Rollover di micros(): 1 kHz per `secondi`, partendo poco prima del giro
+    raw = ((2 ** 32 - 5_000_000 + np.arange(int(args.secondi * 1000), dtype=np.int64) * 1000) & 0xFFFFFFFF).astype(np.uint32)
+    t_unwrap = _cronometra(srotola_micros, raw, ripetizioni=5)
+    monotono = bool(np.all(np.diff(srotola_micros(raw)) > 0))
+    print(f"srotola_micros su {len(raw)} campioni IMU: {t_unwrap * 1e3:8.1f} ms (monotono: {monotono})")
+
+
+def bench_filtri(args):
+    rng = np.random.default_rng(0)
+    n = int(args.secondi * 1000)
+    dati = rng.normal(0, 0.05, (n, 3)).cumsum(axis=0) * 1e-2 + rng.normal(0, 0.2, (n, 3))
+    imu_filter = IMUFilter(sampling_rate=1000, kalman_q=0.001, kalman_r=0.01)
+    print(f"IMU sintetico: {n} campioni × 3 assi")
+
+    t_new = _cronometra(imu_filter.kalman_filter, dati, ripetizioni=3)
+    print(f"kalman_filter vettoriale (3 assi):     {t_new:8.3f} s")
+    if not args.solo_nuovo:
+        t_old = _cronometra(lambda: [kalman_filter_loop(imu_filter, dati[:, i]) for i in range(3)])
+        print(f"kalman_filter ciclo per campione:      {t_old:8.3f} s")
+        print(f"Speedup: {t_old / t_new:.0f}x")
+
+    # Pipeline completa: matrice float32 (n × 6) contro calibrazione e filtri colonna per colonna
+    df = pd.DataFrame({'timestamp_sec': np.arange(n) / 1000,
+                       **{c: rng.normal(0, 0.2, n) for c in IMUFilter.COLONNE}})
+    t_matrice = _cronometra(imu_filter.process, df, ripetizioni=3)
+    print(f"process su matrice float32 (6 assi):   {t_matrice:8.3f} s")
+    if not args.solo_nuovo:
+        t_colonne = _cronometra(lambda: process_per_colonna(imu_filter, df.copy()), ripetizioni=3)
+        print(f"process colonna per colonna:           {t_colonne:8.3f} s")
+        print(f"Speedup: {t_colonne / t_matrice:.1f}x")
+
+
+def bench_kalman(args):
+    rng = np.random.default_rng(0)
+    n = int(args.secondi * 100)
+    quota = np.cumsum(rng.normal(0, 0.05, n)) + rng.normal(0, 0.3, n)
+    q, r = 0.05, 0.5
+    print(f"BMP sintetico: {n} campioni")
+
+    t_filtro = _cronometra(filtro_kalman, quota, q, r, quota[0], 1, ripetizioni=3)
+    print(f"filtro_kalman:                         {t_filtro:8.3f} s")
+    t_smoother = _cronometra(smoother_kalman, quota, q, r, quota[0], 1, ripetizioni=3)
+    print(f"smoother_kalman:                       {t_smoother:8.3f} s")
+    if args.solo_nuovo:
+        return
+    try:
+        from pykalman import KalmanFilter
+    except ImportError:
+        print("pykalman non installato: confronto saltato")
+        return
+    kf = KalmanFilter(initial_state_mean=float(quota[0]), initial_state_covariance=1,
+                      transition_matrices=[1], observation_matrices=[1],
+                      transition_covariance=q, observation_covariance=r)
+    t_old = _cronometra(kf.filter, quota)
+    print(f"pykalman filter:                       {t_old:8.3f} s")
+    print(f"Speedup filtro: {t_old / t_filtro:.0f}x")
+
+
+def bench_spike(args):
+    rng = np.random.default_rng(0)
+    n = int(args.secondi * 100)
+    # Altitudine BMP a 100 Hz con spike isolati e a raffica
+    dati = np.cumsum(rng.normal(0, 0.05, n)) + rng.normal(0, 0.3, n)
+    spike = rng.choice(n, max(1, n // 500), replace=False)
+    dati[spike] += rng.choice([-1, 1], len(spike)) * rng.uniform(6, 40, len(spike))
+    for i in rng.choice(n - 5, max(1, n // 20_000), replace=False):
+        dati[i:i + 5] += 30
+    print(f"BMP sintetico: {n} campioni, {len(spike)} spike isolati")
+
+    t_seq = _cronometra(sopprimi_spike, dati, ripetizioni=3)
+    print(f"sopprimi_spike sequenziale:            {t_seq:8.3f} s")
+    t_vet = _cronometra(lambda: sopprimi_spike(dati, sequenziale=False), ripetizioni=3)
+    print(f"sopprimi_spike vettoriale:             {t_vet:8.3f} s")
+    if not args.solo_nuovo:
+        t_old = _cronometra(rimuovi_spike_loop, dati)
+        print(f"ciclo np.concatenate + np.median:      {t_old:8.3f} s")
+        print(f"Speedup sequenziale: {t_old / t_seq:.0f}x, vettoriale: {t_old / t_vet:.0f}x")
+
+
+def _filtra_a_blocchi(flusso, df, blocco):
+    uscite = [flusso.process(df.iloc[i:i + blocco]) for i in range(0, len(df), blocco)]
+    return pd.concat(uscite + [flusso.flush()], ignore_index=True)
+
+
+def _filtra_array_a_blocchi(flusso, df, blocco):
+    tempi, quota = df['timestamp_sec'].to_numpy(), df['altitude'].to_numpy()
+    uscite = [flusso.process_array(tempi[i:i + blocco], quota[i:i + blocco]) for i in range(0, len(df), blocco)]
+    return flusso.frame(np.concatenate(uscite + [flusso.flush_array()]))
+
+
+def bench_flusso(args):
+    rng = np.random.default_rng(0)
+    n = int(args.secondi * 100)
+    quota = np.cumsum(rng.normal(0, 0.05, n)) + rng.normal(0, 0.3, n)
+    quota[rng.choice(n, max(1, n // 500), replace=False)] += 30
+    df = pd.DataFrame({'timestamp_sec': np.arange(n) / 100, 'altitude': quota})
+    print(f"BMP sintetico: {n} campioni, blocchi da {args.blocco}, blocco_minimo {args.blocco_minimo}")
+
+    for nome, filtra in (('process (DataFrame)', _filtra_a_blocchi), ('process_array', _filtra_array_a_blocchi)):
+        t = time.perf_counter()
+        filtra(RocketDataStream(blocco_minimo=args.blocco_minimo), df, args.blocco)
+        durata = time.perf_counter() - t
+        print(f"RocketDataStream.{nome:<20} {durata:8.3f} s ({n / durata / 1e3:.0f} k campioni/s)")
+
+
+def bench_allinea(args):
+    with tempfile.TemporaryDirectory() as cartella:
+        path = genera_log(os.path.join(cartella, 'log_bench_RP0.bin'), args.secondi)
+        _, _, df_imu, df_bmp = Decoder(path).decode()
+    df_imu = colonne_fisiche(df_imu)
+    print(f"Log sintetico: {len(df_imu)} campioni IMU, {len(df_bmp)} BMP, griglia a {args.fs:g} Hz")
+
+    t_media = _cronometra(allinea, df_imu, df_bmp, args.fs, ripetizioni=3)
+    print(f"allinea (IMU 'media', BMP 'lineare'):  {t_media:8.3f} s")
+    stampa_report(allinea(df_imu, df_bmp, args.fs)[1])
+    t_nuovo = _cronometra(lambda: allinea(df_imu, df_bmp, args.fs, metodo_imu='lineare', metodo_bmp='asof'), ripetizioni=3)
+    print(f"allinea (IMU 'lineare', BMP 'asof'):   {t_nuovo:8.3f} s")
+    if not args.solo_nuovo:
+        imu = df_imu[['timestamp_sec'] + list(COLONNE_FISICHE)].assign(
+            timestamp_sec=df_imu['timestamp_sec'] - df_bmp.attrs['offset_tempo'])
+        t_old = _cronometra(allinea_pandas, imu, df_bmp, args.fs)
+        print(f"pandas reindex + merge_asof:           {t_old:8.3f} s")
+        print(f"Speedup: {t_old / t_nuovo:.1f}x")
+
+def bench_sweep(args):
+    voli = {f'volo_{i}': volo_sintetico(args.secondi, seed=i) for i in range(args.voli)}
+    griglia = griglia_parametri(cutoff_freq=[1, 1.5, 2, 3], savgol_window_sec=[0.3, 0.6, 0.9],
+                                kalman_q=[0.01, 0.05, 0.1], kalman_r=[0.1, 0.5, 1, 2])
+    print(f"{len(griglia)} combinazioni × {args.voli} voli da {args.secondi:g} s, {args.workers or os.cpu_count()} processi")
+    t = time.perf_counter()
+    tabella = sweep(voli, griglia, workers=args.workers)
+    durata = time.perf_counter() - t
+    print(f"sweep:                                 {durata:8.3f} s ({len(tabella) / durata:.0f} valutazioni/s)")
+
+
+def bench_baro(args):
+    df = volo_sintetico(args.secondi)
+    # Tempi BMP non uniformi come nei log (jitter di ±2 ms)
+    df['timestamp_sec'] += np.random.default_rng(1).uniform(-0.002, 0.002, len(df))
+    print(f"BMP sintetico: {len(df)} campioni")
+
+    t_baro = _cronometra(process_rocket_baro, df, ripetizioni=3)
+    print(f"process_rocket_baro:                   {t_baro:8.3f} s")
+    derivate = {'velocity': lambda d: np.gradient(d['altitude_kalman'].to_numpy(), d['timestamp_sec'].to_numpy())}
+    t_catena = _cronometra(process_rocket_columns, df, ['altitude'], derivate, 1, 1.5, 0.6, 0.05, 0.5, ripetizioni=3)
+    print(f"catena con velocità rifiltrata:        {t_catena:8.3f} s")
+
+    # Errore rispetto al volo senza rumore (arco di seno di volo_sintetico)
+    baro = process_rocket_baro(df)
+    catena = process_rocket_columns(df, ['altitude'], derivate, 1, 1.5, 0.6, 0.05, 0.5)
+    decollo, durata, apogeo = args.secondi / 4, 15.0, 60.0
+    for nome, uscita in (('accelerazione costante', baro), ('catena', catena)):
+        fase = np.pi * (uscita['timestamp_sec'].to_numpy() - decollo) / durata
+        in_volo = (fase > 0) & (fase < np.pi)
+        quota = np.where(in_volo, apogeo * np.sin(fase), 0.0)
+        velocita = np.where(in_volo, apogeo * np.pi / durata * np.cos(fase), 0.0)
+        errore_h = np.sqrt(np.mean((uscita['altitude_kalman'].to_numpy() - quota) ** 2))
+        errore_v = np.sqrt(np.mean((uscita['velocity_kalman'].to_numpy() - velocita) ** 2))
+        print(f"RMS {nome:<23} quota {errore_h:6.3f} m, velocità {errore_v:6.3f} m/s")
+    if args.solo_nuovo:
+        return
+    try:
+        from pykalman import KalmanFilter
+    except ImportError:
+        print("pykalman non installato: confronto saltato")
+        return
+    n = min(len(df), 2000)
+    tempi, quota = df['timestamp_sec'].to_numpy()[:n], df['altitude'].to_numpy()[:n]
+    q, r = 100.0, 0.0625
+    d = np.diff(tempi)[:, np.newaxis, np.newaxis]
+    uno, zero = np.ones_like(d), np.zeros_like(d)
+    f = np.block([[uno, d, d * d / 2], [zero, uno, d], [zero, zero, uno]])
+    rumore = q * np.block([[d ** 5 / 20, d ** 4 / 8, d ** 3 / 6], [d ** 4 / 8, d ** 3 / 3, d ** 2 / 2], [d ** 3 / 6, d ** 2 / 2, d]])
+    kf = KalmanFilter(transition_matrices=f, transition_covariance=rumore, observation_matrices=[[1, 0, 0]],
+                      observation_covariance=r, initial_state_mean=[quota[0], 0, 0],
+                      initial_state_covariance=np.diag([r, 10, 100]))
+    t_old = _cronometra(kf.smooth, quota)
+    t_new = _cronometra(smoother_accelerazione_costante, tempi, quota, q, r, ripetizioni=3)
+    print(f"pykalman smooth ({n} campioni):        {t_old:8.3f} s")
+    print(f"smoother_accelerazione_costante:       {t_new:8.3f} s")
+    print(f"Speedup: {t_old / t_new:.0f}x")
+
+
+def bench_fusione(args):
+    tempi_imu, accelerazione, quota, velocita, tempi_bmp, quota_bmp = volo_imu_sintetico(args.secondi)
+    accelerazione -= accelerazione[tempi_imu <= 1].mean()
+    print(f"Volo sintetico: {len(tempi_imu)} campioni IMU, {len(tempi_bmp)} campioni BMP")
+
+    t_fusione = _cronometra(fondi, tempi_imu, accelerazione, tempi_bmp, quota_bmp)
+    print(f"fondi (BMP + accelerometro):           {t_fusione:8.3f} s")
+    t_baro = _cronometra(lambda: smoother_accelerazione_costante(tempi_bmp, quota_bmp, deviazioni=False))
+    print(f"smoother_accelerazione_costante:       {t_baro:8.3f} s")
+
+    stati, _ = fondi(tempi_imu, accelerazione, tempi_bmp, quota_bmp)
+    baro, _ = smoother_accelerazione_costante(tempi_bmp, quota_bmp)
+    # Errore a 1 kHz; per la sola quota BMP le stime sono interpolate linearmente
+    for nome, h, v in (('fusione', stati[:, 0], stati[:, 1]),
+                       ('solo BMP', np.interp(tempi_imu, tempi_bmp, baro[:, 0]), np.interp(tempi_imu, tempi_bmp, baro[:, 1]))):
+        errore_h = np.sqrt(np.mean((h - quota) ** 2))
+        errore_v = np.sqrt(np.mean((v - velocita) ** 2))
+        print(f"RMS {nome:<23} quota {errore_h:6.3f} m, velocità {errore_v:6.3f} m/s, "
+              f"V+ {v.max():6.2f} m/s (vera {velocita.max():.2f})")
+
+
+def bench_assetto(args):
+    rng = np.random.default_rng(0)
+    n = int(args.secondi * 1000)
+    tempi = np.arange(n) / 1000
+    # Sul pad inclinato di 5°, poi spinta e rotazioni casuali
+    accel = np.tile([0.0, np.sin(np.radians(5)), np.cos(np.radians(5))], (n, 1)) + rng.normal(0, 0.01, (n, 3))
+    lancio = n // 3
+    accel[lancio:lancio + 150] *= 6
+    gyro = rng.normal(0, 0.2, (n, 3))
+    gyro[lancio:] += rng.normal(0, 30, (n - lancio, 3))
+    print(f"IMU sintetico: {n} campioni a 1 kHz")
+
+    t_new = _cronometra(integra_assetto, tempi, accel, gyro, ripetizioni=3)
+    print(f"integra_assetto:                       {t_new:8.3f} s")
+    if args.solo_nuovo:
+        return
+    quaternioni, _, _ = integra_assetto(tempi, accel, gyro)
+    m = min(n - lancio, 20000)
+    tratto = slice(lancio - 1, lancio + m)
+    senza_bias = gyro[tratto] - gyro[tempi <= 1].mean(axis=0)
+    t_old = _cronometra(assetto_loop, tempi[tratto], quaternioni[lancio - 1], senza_bias)
+    print(f"ciclo per campione ({m} campioni):     {t_old:8.3f} s (~{t_old * n / m:.1f} s su tutto il volo)")
+
+
+def bench_eventi(args):
+    tempi_imu, accelerazione, quota, velocita, tempi_bmp, quota_bmp = volo_imu_sintetico(args.secondi)
+    rng = np.random.default_rng(1)
+    # Accelerometro a 3 assi [g]: forza specifica lungo z, rumore sugli assi trasversali
+    accel = np.column_stack([rng.normal(0, 0.02, (len(tempi_imu), 2)), (accelerazione + G0) / G0])
+    print(f"Volo sintetico: {len(tempi_imu)} campioni IMU, {len(tempi_bmp)} campioni BMP")
+
+    t_eventi = _cronometra(rileva_eventi, tempi_imu, accel, tempi_bmp, quota_bmp, ripetizioni=3)
+    print(f"rileva_eventi:                         {t_eventi:8.3f} s")
+    stampa_eventi(rileva_eventi(tempi_imu, accel, tempi_bmp, quota_bmp))
+    decollo = args.secondi / 3
+    print(f"Veri: lancio {decollo:.3f} s, burnout {decollo + 0.15:.3f} s, apogeo {tempi_imu[np.argmax(quota)]:.3f} s, "
+          f"atterraggio {tempi_imu[np.flatnonzero(quota > 0)[-1] + 1]:.3f} s")
+
+
+def esegui_stadi(configurazione, dati):
+    """Stadi di `configurazione` dopo la decodifica, su `dati` già decodificati e senza cache: (uscite, secondi)."""
+    uscite = {'decodifica': dati}
+    t = time.perf_counter()
+    for nome, stadio in configurazione.items():
+        if nome != 'decodifica':
+            uscite[nome] = STADI[stadio.get('funzione', nome)](*(uscite[i] for i in stadio.get('ingressi', [])),
+                                                               **stadio.get('parametri', {}))
+    return uscite, time.perf_counter() - t
+
+
+def senza_ritaglio(configurazione):
+    """La stessa configurazione con i filtri sul log intero (ingressi 'ritaglio' -> 'tempi')."""
+    return OrderedDict((nome, {**stadio, 'ingressi': ['tempi' if i == 'ritaglio' else i for i in stadio.get('ingressi', [])]})
+                       for nome, stadio in configurazione.items() if nome != 'ritaglio')
+
+
+def bench_ritaglio(args):
+    df = volo_sintetico(args.secondi)
+    df['timestamp_sec'] += np.random.default_rng(1).uniform(-0.002, 0.002, len(df))
+    dati = {'bmp': df, 'imu': pd.DataFrame({'timestamp_sec': df['timestamp_sec']})}
+    print(f"BMP sintetico: {len(df)} campioni, volo di 15 s dopo {args.secondi / 4:g} s di pad")
+    for preset in ('accelerazione_costante', 'catena'):
+        configurazione = CONFIGURAZIONI[preset]
+        ritagliato, t_ritaglio = esegui_stadi(configurazione, dati)
+        intero, t_intero = esegui_stadi(senza_ritaglio(configurazione), dati)
+        a, b = ritagliato['taglio'], intero['taglio']
+        print(f"{preset:<24} log intero {t_intero:7.3f} s, ritagliato {t_ritaglio:7.3f} s "
+              f"({len(ritagliato['ritaglio'])} campioni filtrati)")
+        errore = {c: np.abs(a['bmp'][c].to_numpy() - b['bmp'][c].to_numpy()).max() if len(a['bmp']) == len(b['bmp'])
+                  else np.inf for c in ('altitude_kalman', 'velocity_kalman')}
+        print(f"{'':<24} differenze nel volo tagliato: quota {errore['altitude_kalman']:.2e} m, "
+              f"velocità {errore['velocity_kalman']:.2e} m/s, t_start {a['t_start'] - b['t_start']:+.3f} s, "
+              f"t_end {a['t_end'] - b['t_end']:+.3f} s")
+
+
+# Moduli della pipeline senza interfaccia e dipendenze GUI/grafiche che non devono caricare
+MODULI_HEADLESS = ('decoder', 'decode_cache', 'batch_decode', 'Filter', 'file_saver', 'resampler', 'flight', 'pipeline', 'sweep', 'fusion', 'attitude')
+MODULI_GUI = ('pandasgui', 'matplotlib', 'plotly', 'fontTools', 'pykalman', 'PyQt5')
+
+
+def _tempo_import(modulo):
+    """Importa `modulo` in un interprete nuovo; restituisce (secondi, moduli GUI caricati)."""
+    codice = (f"import sys, time; t = time.perf_counter(); import {modulo}; t = time.perf_counter() - t; "
+              f"print(t); print(','.join(m for m in {MODULI_GUI!r} if m in sys.modules))")
+    uscita = subprocess.run([sys.executable, '-c', codice], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.splitlines()
+    return float(uscita[-2]), [m for m in uscita[-1].split(',') if m]
+
+
+def bench_import(args):
+    superati = False
+    for modulo in MODULI_HEADLESS:
+        tempo, gui = min(_tempo_import(modulo) for _ in range(args.ripetizioni))
+        esito = 'ok'
+        if gui:
+            esito = f"carica {', '.join(gui)}"
+        elif tempo > args.budget:
+            esito = f"oltre il budget di {args.budget:.2f} s"
+        superati |= esito != 'ok'
+        print(f"import {modulo:<14} {tempo:6.2f} s   {esito}")
+    if superati:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark della pipeline RocketDataInterpreter')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('decode', help='Decodifica del log binario')
+    p.add_argument('--secondi', type=float, default=3600, help='Durata del log sintetico [s]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue la lettura di riferimento (lenta)')
+    p.add_argument('--blocco', type=int, default=1_000_000,
+                   help='Pacchetti convertiti in DataFrame per volta dal riferimento (limita la memoria)')
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser('timeline', help='Riparazione della timeline (salti e rollover di micros())')
+    p.add_argument('--secondi', type=float, default=3600, help='Durata del volo sintetico [s]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue il ciclo originale (lento)')
+    p.set_defaults(func=bench_timeline)
+
+    p = sub.add_parser('filtri', help='Filtro di Kalman di IMUFilter su dati IMU a 1 kHz')
+    p.add_argument('--secondi', type=float, default=3600, help='Durata dei dati sintetici [s]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue il ciclo originale (lento)')
+    p.set_defaults(func=bench_filtri)
+
+    p = sub.add_parser('kalman', help='Kalman scalare di process_rocket_data su altitudine a 100 Hz')
+    p.add_argument('--secondi', type=float, default=3600, help='Durata dei dati sintetici [s]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue pykalman (lento)')
+    p.set_defaults(func=bench_kalman)
+
+    p = sub.add_parser('spike', help='Filtro anti-spike di process_rocket_data su altitudine a 100 Hz')
+    p.add_argument('--secondi', type=float, default=3600, help='Durata dei dati sintetici [s]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue il ciclo originale (lento)')
+    p.set_defaults(func=bench_spike)
+
+    p = sub.add_parser('flusso', help='Filtri causali a blocchi (RocketDataStream) su altitudine a 100 Hz')
+    p.add_argument('--secondi', type=float, default=3600, help='Durata dei dati sintetici [s]')
+    p.add_argument('--blocco-minimo', type=int, default=1, help='blocco_minimo di RocketDataStream')
+    p.add_argument('--blocco', type=int, default=10, help='Campioni per blocco (10 = 0.1 s di BMP)')
+    p.set_defaults(func=bench_flusso)
+
+    p = sub.add_parser('allinea', help='Ricampionamento e allineamento IMU/BMP su griglia uniforme')
+    p.add_argument('--secondi', type=float, default=600, help='Durata del log sintetico [s]')
+    p.add_argument('--fs', type=float, default=100, help='Frequenza della griglia comune [Hz]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue il riferimento pandas')
+    p.set_defaults(func=bench_allinea)
+
+    p = sub.add_parser('sweep', help='Sweep parallelo dei parametri dei filtri di altitudine e velocità')
+    p.add_argument('--secondi', type=float, default=60, help='Durata di ogni volo sintetico [s]')
+    p.add_argument('--voli', type=int, default=4, help='Numero di voli')
+    p.add_argument('--workers', type=int, default=None, help='Numero di processi (0 = nel processo corrente)')
+    p.set_defaults(func=bench_sweep)
+
+    p = sub.add_parser('baro', help='Kalman ad accelerazione costante (process_rocket_baro) contro la catena a due passaggi')
+    p.add_argument('--secondi', type=float, default=600, help='Durata del volo sintetico [s]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue il confronto con pykalman (lento)')
+    p.set_defaults(func=bench_baro)
+
+    p = sub.add_parser('fusione', help='Fusione di accelerometro a 1 kHz e altitudine BMP (fusion.fondi)')
+    p.add_argument('--secondi', type=float, default=3600, help='Durata del volo sintetico [s]')
+    p.set_defaults(func=bench_fusione)
+
+    p = sub.add_parser('assetto', help='Integrazione vettoriale dei giroscopi (attitude.integra_assetto)')
+    p.add_argument('--secondi', type=float, default=600, help='Durata dei dati sintetici [s]')
+    p.add_argument('--solo-nuovo', action='store_true', help='Non esegue il ciclo per campione (lento)')
+    p.set_defaults(func=bench_assetto)
+
+    p = sub.add_parser('eventi', help='Rilevamento di lancio, burnout, apogeo e atterraggio (flight.rileva_eventi)')
+    p.add_argument('--secondi', type=float, default=600, help='Durata del volo sintetico [s]')
+    p.set_defaults(func=bench_eventi)
+
+    p = sub.add_parser('ritaglio', help='Ritaglio grezzo del volo prima dei filtri contro i filtri sul log intero')
+    p.add_argument('--secondi', type=float, default=1200, help='Durata del log sintetico [s]')
+    p.set_defaults(func=bench_ritaglio)
+
+    p = sub.add_parser('import', help='Tempo di avvio: fallisce se un modulo headless supera il budget')
+    p.add_argument('--budget', type=float, default=2.0, help='Tempo massimo di import per modulo [s]')
+    p.add_argument('--ripetizioni', type=int, default=3, help='Import ripetuti (si tiene il migliore)')
+    p.set_defaults(func=bench_import)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from decoder import BMP_DTYPE, DECODER_VERSION, IMU_DTYPE, leggi_log, nuovo_report_danni, report_danni
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Dimensione massima predefinita della cache [byte], la stessa per plotter, pipeline, sweep
+# e batch_decode: chi la apre con un limite più piccolo svuoterebbe la campagna decodificata
+MAX_BYTES_PREDEFINITO = 20 * 2 ** 30
+# Formato delle voci su disco (un .npy per colonna): cambia la chiave, le voci vecchie escono per LRU
+FORMATO_CACHE = 2
+
+
+def cartella_cache_predefinita():
+    """Cartella della cache: variabile RDI_CACHE_DIR oppure ~/.cache/RocketDataInterpreter."""
+    return os.environ.get('RDI_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'RocketDataInterpreter')
+
+
+def hash_contenuto(path, blocco=1 << 23):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            dati = f.read(blocco)
+            if not dati:
+                break
+            h.update(dati)
+    return h.hexdigest()
+
+
+@contextmanager
+def blocco_file(path):
+    """Lock esclusivo fra processi sul file `path` (fcntl.flock, msvcrt.locking su Windows)."""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK rinuncia dopo ~10 s: si continua ad aspettare
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# ---------------------------
+# CLASSE Colonne
+# ---------------------------
+class Colonne:
+    """
+    Pacchetti di un flusso come colonne separate (es. mappate in memoria dalla cache).
+    Si indicizzano per nome e hanno len() come gli array strutturati di decoder.leggi_log.
+    """
+
+    def __init__(self, colonne, dtype):
+        """
+        :param colonne: dizionario nome -> array 1D, tutti della stessa lunghezza
+        :param dtype: dtype strutturato dei pacchetti (IMU_DTYPE o BMP_DTYPE)
+        """
+        self.colonne = colonne
+        self.dtype = dtype
+
+    def __getitem__(self, nome):
+        return self.colonne[nome]
+
+    def __len__(self):
+        return len(self.colonne[self.dtype.names[0]])
+
+
+# ---------------------------
+# CLASSE DecodeCache
+# ---------------------------
+class DecodeCache:
+    """
+    Cache su disco dei pacchetti decodificati, un .npy per colonna di ogni flusso (IMU/BMP).
+
+    Ogni voce è indicizzata da hash del contenuto, dimensione, mtime del log e DECODER_VERSION:
+    qualsiasi modifica al log o al decoder porta a una chiave nuova, le voci vecchie escono
+    per LRU quando la cache supera `max_bytes`. Una lettura dalla cache mappa in memoria
+    le colonne (contigue) invece di copiarle. L'indice percorso -> hash è letto e riscritto
+    sotto un lock su file, così più processi (batch_decode, sweep) possono condividerlo.
+    """
+    INDICE = 'index.json'
+    LOCK = 'index.lock'
+
+    def __init__(self, cache_dir=None, max_bytes=MAX_BYTES_PREDEFINITO):
+        """
+        :param cache_dir: Cartella della cache (default: cartella_cache_predefinita())
+        :param max_bytes: Dimensione massima della cache [byte]
+        """
+        self.cache_dir = cache_dir or cartella_cache_predefinita()
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ---------------------------
+    # CHIAVI
+    # ---------------------------
+    def _leggi_indice(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.INDICE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _scrivi_indice(self, indice):
+        """Scrittura atomica (file temporaneo + os.replace): da chiamare con il lock dell'indice."""
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(indice, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, os.path.join(self.cache_dir, self.INDICE))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _lock_indice(self):
+        return blocco_file(os.path.join(self.cache_dir, self.LOCK))
+
+    def voce_indice(self, path, indice=None):
+        """
+        (percorso assoluto, [dimensione, mtime, hash del contenuto], nuova) per `path`, senza
+        scrivere l'indice: l'hash viene ricalcolato (nuova = True) solo se dimensione o mtime
+        del file sono cambiati dall'ultima volta.
+        """
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        if indice is None:
+            with self._lock_indice():
+                indice = self._leggi_indice()
+        voce = indice.get(path)
+        if voce and voce[0] == stat.st_size and voce[1] == stat.st_mtime_ns:
+            return path, voce, False
+        return path, [stat.st_size, stat.st_mtime_ns, hash_contenuto(path)], True
+
+    def aggiorna_indice(self, voci):
+        """
+        Aggiunge all'indice le voci percorso -> [dimensione, mtime, hash] in una sola scrittura.
+        L'indice viene riletto sotto il lock: le voci scritte nel frattempo da altri processi restano.
+        """
+        if voci:
+            with self._lock_indice():
+                indice = self._leggi_indice()
+                indice.update(voci)
+                self._scrivi_indice(indice)
+
+    @staticmethod
+    def chiave_voce(voce, resync=True):
+        dimensione, mtime, digest = voce
+        return f"{digest}-{dimensione}-{mtime}-v{DECODER_VERSION}-c{FORMATO_CACHE}-{'r' if resync else 's'}"
+
+    def key(self, path, resync=True, aggiorna_indice=True):
+        """
+        Chiave della voce per `path` (vedi voce_indice). Con `aggiorna_indice` False l'indice
+        non viene scritto: processi paralleli restituiscono le voci a chi lo aggiorna una volta sola.
+        """
+        path, voce, nuova = self.voce_indice(path)
+        if nuova and aggiorna_indice:
+            self.aggiorna_indice({path: voce})
+        return self.chiave_voce(voce, resync)
+
+    # ---------------------------
+    # LETTURA / SCRITTURA
+    # ---------------------------
+    @staticmethod
+    def _file_colonna(cartella, flusso, nome):
+        return os.path.join(cartella, f'{flusso}_{nome}.npy')
+
+    def load(self, key):
+        """
+        Restituisce (imu_data, bmp_data, report), o None se assente: imu_data e bmp_data sono
+        Colonne di array mappati in memoria in sola lettura, senza copie.
+        """
+        cartella = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(cartella, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            flussi = [Colonne({nome: np.load(self._file_colonna(cartella, flusso, nome), mmap_mode='r')
+                               for nome in dtype.names}, dtype)
+                      for flusso, dtype in (('imu', IMU_DTYPE), ('bmp', BMP_DTYPE))]
+        except (OSError, ValueError):
+            return None
+        os.utime(os.path.join(cartella, 'meta.json'))  # ultimo accesso, per la LRU
+        meta['report']['intervalli_saltati'] = [tuple(r) for r in meta['report']['intervalli_saltati']]
+        return flussi[0], flussi[1], meta['report']
+
+    def store(self, key, imu_data, bmp_data, report):
+        cartella = os.path.join(self.cache_dir, key)
+        if os.path.isdir(cartella):
+            return
+        tmp = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            for flusso, dati in (('imu', imu_data), ('bmp', bmp_data)):
+                for nome in dati.dtype.names:
+                    np.save(self._file_colonna(tmp, flusso, nome), np.ascontiguousarray(dati[nome]))
+            with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'decoder_version': DECODER_VERSION, 'creato': time.time(), 'report': report}, f)
+            os.replace(tmp, cartella)
+        except OSError:
+            # Un altro processo ha già scritto la stessa voce
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def leggi_log(self, path, resync=True, key=None):
+        """
+        Come decoder.leggi_log, passando dalla cache. Restituisce (imu_data, bmp_data, report).
+        `key` se già calcolata (es. da voce_indice in un processo che non scrive l'indice).
+        """
+        key = key or self.key(path, resync)
+        trovato = self.load(key)
+        if trovato is not None:
+            return trovato
+        stato = nuovo_report_danni()
+        imu_data, bmp_data = leggi_log(path, resync, stato)
+        report = report_danni(stato)
+        self.store(key, imu_data, bmp_data, report)
+        # Dalla voce appena scritta: le colonne sono mappate e contigue anche alla prima lettura
+        trovato = self.load(key)
+        return trovato if trovato is not None else (imu_data, bmp_data, report)
+
+    # ---------------------------
+    # PULIZIA
+    # ---------------------------
+    def voci(self):
+        """Elenco (ultimo accesso, byte, cartella) delle voci presenti."""
+        elenco = []
+        for nome in os.listdir(self.cache_dir):
+            cartella = os.path.join(self.cache_dir, nome)
+            meta = os.path.join(cartella, 'meta.json')
+            if nome.startswith('.') or not os.path.isfile(meta):
+                continue
+            dimensione = sum(os.path.getsize(os.path.join(cartella, f)) for f in os.listdir(cartella))
+            elenco.append((os.path.getmtime(meta), dimensione, cartella))
+        return elenco
+
+    def evict(self):
+        """Elimina le voci usate meno di recente finché la cache sta sotto `max_bytes`."""
+        elenco = sorted(self.voci())
+        totale = sum(v[1] for v in elenco)
+        for _, dimensione, cartella in elenco:
+            if totale <= self.max_bytes:
+                break
+            shutil.rmtree(cartella, ignore_errors=True)
+            totale -= dimensione
+
+    def clear(self):
+        for _, _, cartella in self.voci():
+            shutil.rmtree(cartella, ignore_errors=True)
@@ -1,30 +1,481 @@
+import mmap
 import os
 import re
-import struct
 from collections import namedtuple
-from pandasgui import show
 
+import numpy as np
 import pandas as pd
 
+# ---------------------------
+# FORMATO DEL LOG M510
+# ---------------------------
+# Dopo l'header 'M510' il file è una sequenza di pacchetti impacchettati (#pragma pack(1)):
+#   'I' + '<10hI'  (accel, gyro, mag, temp, timestamp)  -> 25 byte
+#   'B' + '<fI'    (altitudine, timestamp)               ->  9 byte
+HEADER = b'M510'
+# Da incrementare quando cambia il risultato della lettura dei pacchetti (invalida la cache)
+DECODER_VERSION = 1
+IMU_MARKER = ord('I')
+BMP_MARKER = ord('B')
+IMU_DTYPE = np.dtype([
+    ('accel_x', '<i2'), ('accel_y', '<i2'), ('accel_z', '<i2'),
+    ('gyro_x', '<i2'), ('gyro_y', '<i2'), ('gyro_z', '<i2'),
+    ('mag_x', '<i2'), ('mag_y', '<i2'), ('mag_z', '<i2'),
+    ('temp', '<i2'),
+    ('timestamp', '<u4'),
+])
+BMP_DTYPE = np.dtype([('altitude', '<f4'), ('timestamp', '<u4')])
+IMU_PACKET_SIZE = 1 + IMU_DTYPE.itemsize  # 25
+BMP_PACKET_SIZE = 1 + BMP_DTYPE.itemsize  # 9
+# Colonne IMU in unità fisiche (vedi COLONNE_FISICHE)
+ASSI_ACCEL = ('accel_x_g', 'accel_y_g', 'accel_z_g')
+ASSI_GYRO = ('gyro_x_dps', 'gyro_y_dps', 'gyro_z_dps')
 
-def rimuovi_salti(df_bmp):
-    diffs = df_bmp['timestamp_sec'].diff().fillna(0)
-    soglia_salto = 0.5
-    delta_corretto = 0.02
+# Avanzamento in byte per ogni valore del marker (1 = marker sconosciuto)
+_PASSO = np.ones(256, dtype=np.int64)
+_PASSO[IMU_MARKER] = IMU_PACKET_SIZE
+_PASSO[BMP_MARKER] = BMP_PACKET_SIZE
 
-    # Copia della colonna
-    corrected_ts = df_bmp['timestamp_sec'].copy()
-    correzione_cumulativa = 0.0
+# Dimensione dei blocchi percorsi in parallelo da trova_pacchetti
+BLOCCO_SCANSIONE = 1 << 16
+# Byte letti per volta dalla decodifica a blocchi
+FINESTRA_LETTURA = 1 << 22
 
-    for i in range(1, len(corrected_ts)):
-        if diffs.iloc[i] > soglia_salto:
-            eccesso = diffs.iloc[i] - delta_corretto
-            correzione_cumulativa += eccesso
-        corrected_ts.iloc[i] -= correzione_cumulativa
+# Ripresa dopo dati corrotti: un candidato è plausibile se apre una catena di
+# RIPRESA_PACCHETTI pacchetti validi, con timestamp monotoni e valori nel range fisico
+RIPRESA_PACCHETTI = 4
+RIPRESA_FINESTRA = 1 << 20             # byte esaminati per volta durante la ricerca
+RIPRESA_MAX_PASSO_US = 100_000         # fra pacchetti consecutivi dello stesso tipo
+RIPRESA_TOLLERANZA_US = 100_000        # arretramento ammesso (timestamp BMP ricostruiti dal FIFO)
+ALTITUDINE_MAX = 10_000.0              # [m]
+TEMP_RAW_RANGE = (-21_300, 19_700)     # -40..85 °C per MPU6886 (326.8 LSB/°C, 0 = 25 °C)
 
-    df_bmp['timestamp_sec'] = corrected_ts
-    return df_bmp
 
+def show(*dataframes, **kwargs):
+    """pandasgui.show, importato solo quando viene chiamato: la decodifica non richiede la GUI."""
+    from pandasgui import show as _show
+    return _show(*dataframes, **kwargs)
+
+
+def _percorri_blocchi(buf, start, stop, blocco):
+    """
+    Percorre in parallelo (un "cursore" per blocco) la catena marker -> pacchetto successivo
+    fra `start` e `stop`. Il cursore 0 parte dall'inizio esatto, gli altri dall'inizio del
+    proprio blocco. Un cursore disallineato può avanzare di un byte alla volta: dopo
+    `blocco // BMP_PACKET_SIZE` passi viene fermato e il resto del blocco è lasciato a trova_pacchetti.
+    Restituisce le posizioni visitate (ordinate), i limiti dei blocchi e le posizioni raggiunte.
+    """
+    inizi = np.arange(start, stop, blocco, dtype=np.int64)
+    fini = np.append(inizi[1:], stop)
+    pos = inizi.copy()
+    attivi = np.arange(len(inizi))
+    visitate = []
+    for _ in range(blocco // BMP_PACKET_SIZE + 1):
+        if not attivi.size:
+            break
+        p = pos[attivi]
+        visitate.append(p)
+        p = p + _PASSO[buf[p]]
+        pos[attivi] = p
+        attivi = attivi[p < fini[attivi]]
+    visitate = np.sort(np.concatenate(visitate)) if visitate else np.empty(0, dtype=np.int64)
+    return visitate, inizi, fini, pos
+
+
+def _segui_catena(buf, start, stop, blocco):
+    """
+    Segue la catena vera da `start` fino a `stop` usando i cursori di _percorri_blocchi.
+    Restituisce (inizi dei pacchetti, posizione raggiunta, True se fermata da un marker sconosciuto).
+    """
+    visitate, inizi, fini, uscite = _percorri_blocchi(buf, start, stop, blocco)
+    catena = []
+    x = start
+    for b in range(len(inizi)):
+        if x >= fini[b]:
+            continue
+        lo, hi = np.searchsorted(visitate, [inizi[b], fini[b]])
+        traccia = visitate[lo:hi]
+        prefisso = []
+        p = x
+        while p < fini[b]:
+            k = np.searchsorted(traccia, p)
+            if k < len(traccia) and traccia[k] == p:
+                # Il cursore del blocco è allineato da qui in poi: si riprende da dove si è fermato
+                catena.append(np.asarray(prefisso, dtype=np.int64))
+                prefisso = []
+                tratto = traccia[k:]
+                marker = buf[tratto]
+                sconosciuti = np.flatnonzero((marker != IMU_MARKER) & (marker != BMP_MARKER))
+                if sconosciuti.size:
+                    catena.append(tratto[:sconosciuti[0]])
+                    return np.concatenate(catena), int(tratto[sconosciuti[0]]), True
+                catena.append(tratto)
+                traccia = traccia[:0]
+                p = int(uscite[b])
+                continue
+            if buf[p] != IMU_MARKER and buf[p] != BMP_MARKER:
+                catena.append(np.asarray(prefisso, dtype=np.int64))
+                return np.concatenate(catena), p, True
+            prefisso.append(p)
+            p += int(_PASSO[buf[p]])
+        catena.append(np.asarray(prefisso, dtype=np.int64))
+        x = p
+    catena = np.concatenate(catena) if catena else np.empty(0, dtype=np.int64)
+    return catena, x, False
+
+
+def trova_pacchetti(buf, start=0, blocco=BLOCCO_SCANSIONE):
+    """
+    Trova in blocco gli inizi dei pacchetti 'I'/'B' a partire da `start`.
+
+    I cursori dei blocchi successivi al primo partono da una posizione arbitraria, ma la catena
+    dei marker si risincronizza in pochi pacchetti: il tratto iniziale non ancora allineato
+    viene ripercorso in Python a partire dall'uscita reale del blocco precedente.
+    Il buffer è percorso a tratti di lunghezza crescente, così una catena che si interrompe
+    presto non costa una scansione dell'intero file.
+
+    :param buf: array uint8 con il contenuto del log (anche una vista su mmap)
+    :param start: offset del primo pacchetto
+    :param blocco: dimensione [byte] dei blocchi percorsi in parallelo
+    :return: (inizi dei pacchetti completi, offset dove la lettura si è fermata).
+             L'offset è len(buf), l'inizio di un pacchetto troncato o un marker sconosciuto.
+    """
+    n = len(buf)
+    blocco = max(int(blocco), IMU_PACKET_SIZE)
+    pezzi = []
+    x = start
+    tratto = 16 * blocco
+    interrotta = False
+    while x < n and not interrotta:
+        catena, x, interrotta = _segui_catena(buf, x, min(n, x + tratto), blocco)
+        pezzi.append(catena)
+        tratto *= 4
+    catena = np.concatenate(pezzi) if pezzi else np.empty(0, dtype=np.int64)
+    fine = x if interrotta else n
+
+    # Ultimo pacchetto troncato (fine file o fine del buffer)
+    if not interrotta and catena.size:
+        ultimo = int(catena[-1])
+        if ultimo + int(_PASSO[buf[ultimo]]) > n:
+            fine = ultimo
+            catena = catena[:-1]
+    return catena, fine
+
+
+def _u32(buf, idx):
+    return (buf[idx].astype(np.uint32) | buf[idx + 1].astype(np.uint32) << 8 |
+            buf[idx + 2].astype(np.uint32) << 16 | buf[idx + 3].astype(np.uint32) << 24)
+
+
+def _delta_us(ts, precedente):
+    # Differenza con segno fra timestamp uint32 di micros(), robusta al rollover
+    return (ts - precedente + (1 << 31)) % (1 << 32) - (1 << 31)
+
+
+def _candidati_plausibili(buf, cand, ultimi, eof):
+    """
+    Verifica in blocco le posizioni `cand` come punti di ripresa.
+    Restituisce (plausibile, indeciso): indeciso vale per i candidati la cui verifica
+    richiede byte oltre la fine del buffer quando non siamo a fine file.
+    """
+    n = len(buf)
+    ok = np.ones(len(cand), dtype=bool)
+    indeciso = np.zeros(len(cand), dtype=bool)
+    finito = np.zeros(len(cand), dtype=bool)
+    precedenti = {m: np.full(len(cand), ultimi.get(m, -1), dtype=np.int64) for m in (IMU_MARKER, BMP_MARKER)}
+    da_catena = {m: np.zeros(len(cand), dtype=bool) for m in (IMU_MARKER, BMP_MARKER)}
+    p = cand.astype(np.int64)
+    for livello in range(RIPRESA_PACCHETTI):
+        attivo = ok & ~indeciso & ~finito
+        marker = buf[np.minimum(p, n - 1)]
+        lunghezza = _PASSO[marker]
+        fuori = attivo & (p + lunghezza > n)
+        if eof and livello > 0:
+            finito |= fuori  # la catena arriva alla fine del file
+        elif eof:
+            ok &= ~fuori
+        else:
+            indeciso |= fuori
+        attivo &= ~fuori
+        ok &= ~(attivo & (marker != IMU_MARKER) & (marker != BMP_MARKER))
+        attivo &= ok
+
+        q = np.where(attivo, p, 0)
+        ts = _u32(buf, np.minimum(q + lunghezza - 4, n - 4)).astype(np.int64)
+        for m in (IMU_MARKER, BMP_MARKER):
+            sel = attivo & (marker == m)
+            delta = _delta_us(ts, precedenti[m])
+            # Dopo un tratto perso il tempo può essere avanzato di molto: rispetto all'ultimo
+            # pacchetto buono si richiede solo che non torni indietro
+            limite = np.where(da_catena[m], RIPRESA_MAX_PASSO_US, (1 << 31) - 1)
+            ok &= ~(sel & (precedenti[m] >= 0) & ((delta < -RIPRESA_TOLLERANZA_US) | (delta > limite)))
+            precedenti[m] = np.where(sel, ts, precedenti[m])
+            da_catena[m] |= sel
+
+        # Valori fuori dal range fisico
+        t_idx = np.minimum(q + 19, n - 2)
+        temp = (buf[t_idx].astype(np.uint16) | buf[t_idx + 1].astype(np.uint16) << 8).view(np.int16)
+        ok &= ~(attivo & (marker == IMU_MARKER) & ((temp < TEMP_RAW_RANGE[0]) | (temp > TEMP_RAW_RANGE[1])))
+        altitudine = _u32(buf, np.minimum(q + 1, n - 4)).view(np.float32)
+        with np.errstate(invalid='ignore'):
+            ok &= ~(attivo & (marker == BMP_MARKER) & ~(np.abs(altitudine) <= ALTITUDINE_MAX))
+
+        p = np.where(attivo, p + lunghezza, p)
+    return ok & ~indeciso, indeciso
+
+
+def _coda_plausibile(buf, catena, ultimi, coda=16):
+    """
+    Controlla gli ultimi `coda` pacchetti di una catena interrotta da un marker sconosciuto
+    e restituisce quanti pacchetti della catena tenere.
+    """
+    precedenti = dict(ultimi)
+    inizio = max(0, len(catena) - coda)
+    for i in range(max(0, inizio - coda), inizio):
+        m = int(buf[catena[i]])
+        precedenti[m] = int(_u32(buf, catena[i] + _PASSO[m] - 4))
+    for i in range(inizio, len(catena)):
+        p = int(catena[i])
+        m = int(buf[p])
+        ts = int(_u32(buf, p + _PASSO[m] - 4))
+        if m in precedenti and not -RIPRESA_TOLLERANZA_US <= _delta_us(ts, precedenti[m]) <= RIPRESA_MAX_PASSO_US:
+            return i
+        if m == IMU_MARKER:
+            temp = int(buf[p + 19]) | int(buf[p + 20]) << 8
+            temp = temp - (1 << 16) if temp >= 1 << 15 else temp
+            if not TEMP_RAW_RANGE[0] <= temp <= TEMP_RAW_RANGE[1]:
+                return i
+        elif not abs(float(_u32(buf, p + 1).view(np.float32))) <= ALTITUDINE_MAX:
+            return i
+        precedenti[m] = ts
+    return len(catena)
+
+
+def _cerca_ripresa(buf, da, ultimi, eof):
+    """
+    Cerca, una finestra di RIPRESA_FINESTRA byte alla volta, il primo pacchetto plausibile
+    a partire da `da`. Restituisce (posizione, indeciso); len(buf) se non ce ne sono.
+    """
+    n = len(buf)
+    for w0 in range(da, n, RIPRESA_FINESTRA):
+        segmento = buf[w0:w0 + RIPRESA_FINESTRA]
+        cand = w0 + np.flatnonzero((segmento == IMU_MARKER) | (segmento == BMP_MARKER))
+        ok, indeciso = _candidati_plausibili(buf, cand, ultimi, eof)
+        primo = np.flatnonzero(ok | indeciso)
+        if primo.size:
+            return int(cand[primo[0]]), bool(indeciso[primo[0]])
+    return n, False
+
+
+def nuovo_report_danni():
+    """Stato della ripresa condiviso fra chiamate a trova_pacchetti_con_ripresa."""
+    return {
+        'intervalli_saltati': [],   # (inizio, fine) in byte dall'inizio del file
+        'byte_saltati': 0,
+        'pacchetti_recuperati': 0,  # pacchetti letti dopo la prima zona corrotta
+        'offset': 0,                # posizione nel file di buf[0]
+        'ultimi_timestamp': {},
+        'in_ripresa': False,
+    }
+
+
+def report_danni(report):
+    """Parte pubblica del report: intervalli di byte saltati e pacchetti recuperati."""
+    return {k: report[k] for k in ('intervalli_saltati', 'byte_saltati', 'pacchetti_recuperati')}
+
+
+def trova_pacchetti_con_ripresa(buf, start, report, eof=True, blocco=BLOCCO_SCANSIONE):
+    """
+    Come trova_pacchetti, ma su un marker sconosciuto non si ferma: cerca il primo pacchetto
+    plausibile successivo e riprende da lì, annotando in `report` i byte saltati.
+
+    :param report: dizionario di nuovo_report_danni(), aggiornato sul posto
+    :param eof: False se `buf` è una finestra di un file più lungo; in quel caso un
+                candidato non verificabile entro il buffer ferma la lettura al candidato stesso
+    :return: (inizi dei pacchetti, offset dove la lettura si è fermata)
+    """
+    n = len(buf)
+    pezzi = []
+    pos = start
+    while True:
+        if report['in_ripresa']:
+            ripresa, indeciso = _cerca_ripresa(buf, pos, report['ultimi_timestamp'], eof)
+            if ripresa > pos:
+                inizio, fine = report['offset'] + pos, report['offset'] + ripresa
+                saltati = report['intervalli_saltati']
+                if saltati and saltati[-1][1] == inizio:
+                    inizio = saltati.pop()[0]
+                saltati.append((inizio, fine))
+                report['byte_saltati'] += ripresa - pos
+            if indeciso or ripresa >= n:
+                break
+            report['in_ripresa'] = False
+            pos = ripresa
+
+        catena, pos = trova_pacchetti(buf, pos, blocco)
+        corrotto = pos < n and buf[pos] not in (IMU_MARKER, BMP_MARKER)
+        if corrotto:
+            # Gli ultimi pacchetti prima del marker sconosciuto possono essere già spazzatura
+            buoni = _coda_plausibile(buf, catena, report['ultimi_timestamp'])
+            if buoni < len(catena):
+                pos = int(catena[buoni])
+                catena = catena[:buoni]
+        pezzi.append(catena)
+        if report['intervalli_saltati']:
+            report['pacchetti_recuperati'] += len(catena)
+        marker = buf[catena]
+        for m in (IMU_MARKER, BMP_MARKER):
+            ultimo = np.flatnonzero(marker == m)
+            if ultimo.size:
+                report['ultimi_timestamp'][m] = int(_u32(buf, catena[ultimo[-1]] + _PASSO[m] - 4))
+
+        if not corrotto:
+            ripresa = pos
+            break  # fine del buffer o pacchetto troncato
+        report['in_ripresa'] = True
+
+    catena = np.concatenate(pezzi) if pezzi else np.empty(0, dtype=np.int64)
+    return catena, ripresa
+
+
+def estrai_pacchetti(buf, inizi):
+    """
+    Copia i payload dei pacchetti in due array strutturati (IMU_DTYPE, BMP_DTYPE)
+    senza creare oggetti Python per pacchetto.
+    """
+    marker = buf[inizi]
+    return (_estrai_payload(buf, inizi[marker == IMU_MARKER], IMU_DTYPE),
+            _estrai_payload(buf, inizi[marker == BMP_MARKER], BMP_DTYPE))
+
+
+def _estrai_payload(buf, inizi, dtype):
+    if inizi.size == 0:
+        return np.empty(0, dtype=dtype)
+    finestre = np.lib.stride_tricks.sliding_window_view(buf, dtype.itemsize)
+    return np.ascontiguousarray(finestre[inizi + 1]).view(dtype).reshape(-1)
+
+
+def leggi_log(path, resync=True, report=None):
+    """
+    Legge un log M510 mappandolo in memoria.
+    Restituisce due array strutturati (IMU_DTYPE, BMP_DTYPE) nell'ordine del file.
+
+    :param resync: se True, dopo un tratto corrotto riprende dal primo pacchetto plausibile
+                   invece di fermarsi al primo marker sconosciuto
+    :param report: dizionario di nuovo_report_danni() da aggiornare (opzionale)
+    """
+    report = nuovo_report_danni() if report is None else report
+    with open(path, 'rb') as f:
+        header = f.read(4)  # 'M510' header check
+        if header != HEADER:
+            raise ValueError('Invalid log file header!')
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = np.frombuffer(mm, dtype=np.uint8)
+            try:
+                if resync:
+                    inizi, _ = trova_pacchetti_con_ripresa(buf, len(HEADER), report)
+                else:
+                    inizi, _ = trova_pacchetti(buf, len(HEADER))
+                return estrai_pacchetti(buf, inizi)
+            finally:
+                # Nessuna vista deve sopravvivere alla chiusura della mmap
+                del buf
+
+
+def leggi_log_a_blocchi(path, finestra=FINESTRA_LETTURA, resync=True, report=None):
+    """
+    Legge un log M510 a finestre di `finestra` byte, con memoria indipendente dalla
+    lunghezza del file. Un pacchetto a cavallo di due finestre viene completato con la
+    finestra successiva. Genera coppie di array strutturati (IMU_DTYPE, BMP_DTYPE).
+    """
+    report = nuovo_report_danni() if report is None else report
+    with open(path, 'rb') as f:
+        header = f.read(4)  # 'M510' header check
+        if header != HEADER:
+            raise ValueError('Invalid log file header!')
+
+        resto = b''
+        report['offset'] = len(HEADER)
+        while True:
+            dati = f.read(finestra)
+            if not dati and not (resync and report['in_ripresa'] and resto):
+                break
+            buf = np.frombuffer(resto + dati, dtype=np.uint8)
+            if resync:
+                inizi, fine = trova_pacchetti_con_ripresa(buf, 0, report, eof=not dati)
+            else:
+                inizi, fine = trova_pacchetti(buf)
+            yield estrai_pacchetti(buf, inizi)
+            if not dati:
+                break
+            if not resync and fine < len(buf) and buf[fine] not in (IMU_MARKER, BMP_MARKER):
+                break  # Header sconosciuto: interrompe la lettura
+            resto = buf[fine:].tobytes()
+            report['offset'] += fine
+
+
+# ---------------------------
+# RIPARAZIONE DELLA TIMELINE
+# ---------------------------
+SOGLIA_SALTO = 0.5      # [s] intervallo oltre il quale si considera un salto
+DELTA_CORRETTO = 0.02   # [s] durata a cui viene ridotto un salto
+GIRO_MICROS = 1 << 32   # micros() in uint32_t: rollover ogni ~71.6 minuti
+
+
+def srotola_micros(ts, stato=None):
+    """
+    Converte i timestamp uint32 di micros() in int64 monotoni sommando 2^32 a ogni rollover
+    (un passo all'indietro di oltre mezzo giro). `stato` conserva ultimo valore e giri
+    fra blocchi successivi; un 'precedente' iniziale permette di allineare due flussi.
+    """
+    stato = {} if stato is None else stato
+    ts = np.asarray(ts, dtype=np.int64)
+    if not len(ts):
+        return ts
+    precedente = stato.get('precedente', ts[0])
+    giri = np.cumsum(np.diff(ts, prepend=precedente) < -(GIRO_MICROS // 2)) + stato.get('giri', 0)
+    stato['precedente'] = ts[-1]
+    stato['giri'] = giri[-1]
+    return ts + giri * GIRO_MICROS
+
+
+def _correggi_salti(ts, stato, soglia_salto=SOGLIA_SALTO, delta_corretto=DELTA_CORRETTO):
+    """
+    Compressione dei salti temporali (stessa regola di rimuovi_salti) su un blocco di
+    timestamp [s]. `stato` conserva l'ultimo timestamp e la correzione accumulata fra blocchi.
+    """
+    if not len(ts):
+        return ts
+    precedente = stato.get('precedente', ts[0])
+    diffs = np.diff(ts, prepend=precedente)
+    eccesso = np.where(diffs > soglia_salto, diffs - delta_corretto, 0.0)
+    correzione = np.cumsum(np.concatenate(([stato.get('correzione', 0.0)], eccesso)))[1:]
+    stato['precedente'] = ts[-1]
+    stato['correzione'] = correzione[-1]
+    return ts - correzione
+
+
+def rimuovi_salti(df, soglia_salto=SOGLIA_SALTO, delta_corretto=DELTA_CORRETTO):
+    """
+    Ogni intervallo di 'timestamp_sec' oltre `soglia_salto` viene ridotto a `delta_corretto`
+    e i campioni successivi sono traslati indietro dell'eccesso accumulato (somma cumulativa).
+    """
+    df['timestamp_sec'] = _correggi_salti(df['timestamp_sec'].to_numpy(), {}, soglia_salto, delta_corretto)
+    return df
+
+
+def _stati_timeline(imu_ts, bmp_ts):
+    """
+    Stati iniziali di srotola_micros per i due flussi: ognuno parte dal primo timestamp
+    dell'altro, così un rollover fra il primo pacchetto IMU e il primo BMP viene contato
+    in un solo flusso.
+    """
+    stati = {'imu': {}, 'bmp': {}}
+    if len(imu_ts) and len(bmp_ts):
+        stati['imu']['precedente'] = int(bmp_ts[0])
+        stati['bmp']['precedente'] = int(imu_ts[0])
+    return stati
 
 
 class Decoder:
@@ -58,58 +509,110 @@ class Decoder:
         'timestamp'
     ])
     BinaryBMPData = namedtuple('BinaryBMPData', ['altitude', 'timestamp'])
-    def decode(self):
+
+    def _imu_frame(self, imu_data, stato_giri=None, stato_salti=None):
+        # Solo accelerometro, giroscopio e tempo: mag/temp non vengono usati a valle
+        imu_records = {name: np.ascontiguousarray(imu_data[name]) for name in COLONNE_GREZZE}
+        imu_records['timestamp'] = srotola_micros(imu_data['timestamp'], stato_giri)
+        imu_records['timestamp_sec'] = _correggi_salti(imu_records['timestamp'] / 1e6,
+                                                       {} if stato_salti is None else stato_salti)
+        return pd.DataFrame(imu_records, copy=False)
+
+    def _bmp_frame(self, bmp_data, stato_giri=None):
+        bmp_records = {'altitude': bmp_data['altitude'].astype(np.float64),
+                       'timestamp': srotola_micros(bmp_data['timestamp'], stato_giri)}
+        df_bmp = pd.DataFrame(bmp_records, columns=self.BinaryBMPData._fields)
+        df_bmp['timestamp_sec'] = df_bmp['timestamp'] / 1e6
+        return df_bmp
+
+    def _converti_blocco(self, tipo, dati, stati_giri, stati_salti):
+        """
+        DataFrame di un blocco di pacchetti ('imu' o 'bmp') con le colonne di decode_chunks().
+        `stati_giri` (da _stati_timeline) e `stati_salti` portano rollover e salti da un blocco
+        al successivo; il tempo BMP parte dal primo campione del primo blocco.
+        """
+        if tipo == 'imu':
+            return self._imu_frame(dati, stati_giri['imu'], stati_salti['imu'])
+        df_bmp = self._bmp_frame(dati, stati_giri['bmp'])[['timestamp_sec', 'altitude']]
+        stato = stati_salti['bmp']
+        stato.setdefault('offset', df_bmp['timestamp_sec'].iloc[0])
+        df_bmp['timestamp_sec'] = df_bmp['timestamp_sec'] - stato['offset']
+        df_bmp['timestamp_sec'] = _correggi_salti(df_bmp['timestamp_sec'].to_numpy(), stato)
+        df_bmp.attrs['offset_tempo'] = stato['offset']
+        return df_bmp
+
+    def decode_chunks(self, chunk_size=100_000, finestra=FINESTRA_LETTURA, resync=True, report=None):
+        """
+        Variante a memoria costante di decode(): legge il log a finestre e genera coppie
+        (tipo, DataFrame) con tipo 'imu' o 'bmp', nell'ordine in cui i blocchi si completano.
+        Ogni DataFrame ha `chunk_size` righe (solo l'ultimo di ogni tipo può averne meno)
+        e le stesse colonne di decode(). Il tempo BMP parte dal primo campione ed è corretto
+        dai salti come in decode(), ma senza riordino; rollover di micros() e salti
+        IMU sono gestiti con stato fra un blocco e il successivo.
+
+        :param chunk_size: Numero di campioni per blocco
+        :param finestra: Byte letti dal file per volta
+        :param resync: Riprende dopo i tratti corrotti invece di fermarsi (vedi decode)
+        :param report: Dizionario di nuovo_report_danni() aggiornato durante la lettura
+        """
+        in_attesa = {'imu': [], 'bmp': []}
+        stati_giri = None
+        stati_salti = {'imu': {}, 'bmp': {}}
+
+        def converti(tipo, dati):
+            return self._converti_blocco(tipo, dati, stati_giri, stati_salti)
+
+        for imu_data, bmp_data in leggi_log_a_blocchi(self.file_paths, finestra, resync, report):
+            if stati_giri is None:
+                stati_giri = _stati_timeline(imu_data['timestamp'], bmp_data['timestamp'])
+            for tipo, dati in (('imu', imu_data), ('bmp', bmp_data)):
+                in_attesa[tipo].append(dati)
+                disponibili = sum(len(d) for d in in_attesa[tipo])
+                if disponibili < chunk_size:
+                    continue
+                dati = np.concatenate(in_attesa[tipo])
+                pieni = len(dati) - len(dati) % chunk_size
+                for i in range(0, pieni, chunk_size):
+                    yield tipo, converti(tipo, dati[i:i + chunk_size])
+                in_attesa[tipo] = [dati[pieni:]]
+
+        for tipo in ('imu', 'bmp'):
+            dati = np.concatenate(in_attesa[tipo]) if in_attesa[tipo] else np.empty(0)
+            if len(dati):
+                yield tipo, converti(tipo, dati)
+
+    def decode(self, resync=True, return_report=False, cache=None):
+            """
+            Decodifica il log. Con `resync` un tratto corrotto (es. SD spenta durante la
+            scrittura) viene saltato fino al primo pacchetto plausibile invece di troncare
+            la lettura; con `return_report` restituisce anche il report dei danni
+            (intervalli di byte saltati e pacchetti recuperati).
+            Con `cache` (una decode_cache.DecodeCache) i pacchetti di un log già letto
+            vengono mappati dalla cache invece di essere decodificati di nuovo: le colonne
+            grezze di df_imu restano allora mappate sui .npy della cache, senza copie.
+            df_imu è compatto (dati grezzi int16, vedi COLONNE_FISICHE): colonne_fisiche(df_imu)
+            restituisce accel_*_g e gyro_*_dps in float32.
+            """
             RP_id, folder_path = self.findRP_id()
-            imu_records = []
-            bmp_records = []
-
-            with open(self.file_paths, 'rb') as f:
-                header = f.read(4)  # 'M510' header check
-                if header != b'M510':
-                    raise ValueError('Invalid log file header!')
-
-                while True:
-                    marker = f.read(1)
-                    if not marker:
-                        break  # EOF
-
-                    if marker == b'I':
-                        # Legge i 24 byte successivi (10hI) dopo l'header
-                        data = f.read(24)
-                        if len(data) < 24:
-                            break
-                        accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z, val7, val8, val9, temp, timestamp = struct.unpack(                            '<10hI', data)
-                        imu_records.append(self.BinaryIMUData(accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z, val7, val8, val9, temp, timestamp))
-
-
-                    elif marker == b'B':
-                        # Legge i 8 byte successivi (fI) dopo l'header
-                        data = f.read(8)
-                        if len(data) < 8:
-                            break
-                        altitude, timestamp = struct.unpack('<fI', data)
-                        bmp_records.append(self.BinaryBMPData(altitude, timestamp))
-                    else:
-                        # Header sconosciuto: interrompe la lettura
-                        break
+
+            if cache is not None:
+                imu_data, bmp_data, report = cache.leggi_log(self.file_paths, resync)
+            else:
+                stato = nuovo_report_danni()
+                imu_data, bmp_data = leggi_log(self.file_paths, resync, stato)
+                report = report_danni(stato)
+            if report['intervalli_saltati']:
+                print(f"⚠️ Log danneggiato: saltati {report['byte_saltati']} byte in "
+                      f"{len(report['intervalli_saltati'])} tratti, recuperati {report['pacchetti_recuperati']} pacchetti")
+
+            # Timeline: rollover di micros() allineato fra i due flussi
+            stati_giri = _stati_timeline(imu_data['timestamp'], bmp_data['timestamp'])
 
             # Convert IMU data to DataFrame
-            df_imu = pd.DataFrame(imu_records, columns=self.BinaryIMUData._fields)
-            df_imu['accel_x_g'] = df_imu['accel_x'] * self.ACCEL_SCALE
-            df_imu['accel_y_g'] = df_imu['accel_y'] * self.ACCEL_SCALE
-            df_imu['accel_z_g'] = df_imu['accel_z'] * self.ACCEL_SCALE
-            df_imu['gyro_x_dps'] = df_imu['gyro_x'] * self.GYRO_SCALE
-            df_imu['gyro_y_dps'] = df_imu['gyro_y'] * self.GYRO_SCALE
-            df_imu['gyro_z_dps'] = df_imu['gyro_z'] * self.GYRO_SCALE
-            df_imu['timestamp_sec'] = df_imu['timestamp'] / 1e6
-            df_imu.drop(columns=[ 'accel_x', 'accel_y', 'accel_z',
-                              'gyro_x', 'gyro_y', 'gyro_z',
-                              'mag_x', 'mag_y', 'mag_z',
-                              'temp'], inplace=True)
+            df_imu = self._imu_frame(imu_data, stati_giri['imu'])
 
             # Convert BMP data to DataFrame
-            df_bmp = pd.DataFrame(bmp_records, columns=self.BinaryBMPData._fields)
-            df_bmp['timestamp_sec'] = df_bmp['timestamp'] / 1e6
+            df_bmp = self._bmp_frame(bmp_data, stati_giri['bmp'])
 
             '''
             # === Ordinamento ===
@@ -128,10 +631,118 @@ class Decoder:
             time_offset = df_bmp['timestamp_sec'].iloc[0]  # primo elemento della colonna
             df_bmp['timestamp_sec'] = df_bmp['timestamp_sec'] - time_offset
             df_bmp = rimuovi_salti(df_bmp)
+            # Tempo micros() [s] del primo campione BMP: riporta il BMP sulla base dei tempi IMU
+            df_bmp.attrs['offset_tempo'] = time_offset
             #show(df_bmp)
 
+            if return_report:
+                return RP_id, folder_path, df_imu, df_bmp, report
             return RP_id, folder_path, df_imu, df_bmp
 
 
+# ---------------------------
+# COLONNE IN UNITÀ FISICHE
+# ---------------------------
+# I DataFrame IMU decodificati tengono i dati del sensore in int16 (COLONNE_GREZZE), 'timestamp'
+# di micros() srotolato in int64 e 'timestamp_sec' in float64: le colonne in unità fisiche
+# (nome -> (colonna grezza, scala)) si ottengono esplicitamente con colonne_fisiche()/valori_fisici().
+COLONNE_GREZZE = ('accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z')
+COLONNE_FISICHE = {
+    'accel_x_g': ('accel_x', Decoder.ACCEL_SCALE),
+    'accel_y_g': ('accel_y', Decoder.ACCEL_SCALE),
+    'accel_z_g': ('accel_z', Decoder.ACCEL_SCALE),
+    'gyro_x_dps': ('gyro_x', Decoder.GYRO_SCALE),
+    'gyro_y_dps': ('gyro_y', Decoder.GYRO_SCALE),
+    'gyro_z_dps': ('gyro_z', Decoder.GYRO_SCALE),
+}
+
+
+def valori_fisici(df_imu, colonna):
+    """
+    Array float32 della colonna in unità fisiche `colonna` (una di COLONNE_FISICHE): letta da
+    `df_imu` se c'è già, altrimenti calcolata dalla colonna grezza int16 senza modificare il frame.
+    """
+    if colonna in df_imu.columns:
+        return df_imu[colonna].to_numpy(dtype=np.float32)
+    grezza, scala = COLONNE_FISICHE[colonna]
+    return np.multiply(df_imu[grezza].to_numpy(), np.float32(scala), dtype=np.float32)
+
+
+def colonne_fisiche(df_imu):
+    """
+    Nuovo DataFrame IMU con le colonne grezze sostituite da quelle in unità fisiche (float32,
+    ACCEL_SCALE/GYRO_SCALE); le altre colonne restano. Un frame che le ha già è restituito così com'è.
+
+    :param df_imu: DataFrame IMU di Decoder.decode()/decode_chunks()
+    :return: DataFrame con 'timestamp', 'timestamp_sec' e le colonne di COLONNE_FISICHE
+    """
+    if all(colonna in df_imu.columns for colonna in COLONNE_FISICHE):
+        return df_imu
+    colonne = {c: df_imu[c].to_numpy() for c in df_imu.columns if c not in COLONNE_GREZZE}
+    colonne.update((colonna, valori_fisici(df_imu, colonna)) for colonna in COLONNE_FISICHE)
+    return pd.DataFrame(colonne, index=df_imu.index, copy=False)
+
+
+# ---------------------------
+# CLASSE DecodificaFlusso
+# ---------------------------
+class DecodificaFlusso:
+    """
+    Decodifica incrementale di un flusso M510 (log che cresce, porta seriale): riceve i byte
+    a pezzi di qualsiasi lunghezza con feed() e conserva fra una chiamata e l'altra il
+    pacchetto troncato in coda, lo stato della ripresa e quello della timeline.
+    I DataFrame prodotti hanno le colonne di Decoder.decode_chunks().
+    """
+
+    def __init__(self, resync=True, header=True):
+        """
+        :param resync: Riprende dopo i tratti corrotti (vedi Decoder.decode)
+        :param header: True se il flusso inizia con 'M510'; False per agganciarsi a un flusso
+                       già avviato (con resync si parte dal primo pacchetto plausibile)
+        """
+        self.resync = resync
+        self.report = nuovo_report_danni()
+        self.report['offset'] = 0
+        self.report['in_ripresa'] = resync and not header
+        self.interrotto = False      # senza resync: marker sconosciuto, il flusso è finito
+        self._attendi_header = header
+        self._resto = b''
+        self._stati_giri = None
+        self._stati_salti = {'imu': {}, 'bmp': {}}
+        self._decoder = Decoder(None)
+
+    def feed(self, dati):
+        """
+        Decodifica i byte `dati` che seguono quelli già ricevuti.
+        Restituisce (df_imu, df_bmp) con i nuovi campioni; None per un flusso senza campioni nuovi.
+        """
+        if self.interrotto:
+            return None, None
+        dati = self._resto + bytes(dati)
+        if self._attendi_header:
+            if len(dati) < len(HEADER):
+                self._resto = dati
+                return None, None
+            if dati[:len(HEADER)] != HEADER:
+                raise ValueError('Invalid log file header!')
+            self._attendi_header = False
+            dati = dati[len(HEADER):]
+            self.report['offset'] += len(HEADER)
 
+        buf = np.frombuffer(dati, dtype=np.uint8)
+        if self.resync:
+            inizi, fine = trova_pacchetti_con_ripresa(buf, 0, self.report, eof=False)
+        else:
+            inizi, fine = trova_pacchetti(buf)
+            self.interrotto = fine < len(buf) and buf[fine] not in (IMU_MARKER, BMP_MARKER)
+        imu_data, bmp_data = estrai_pacchetti(buf, inizi)
+        self._resto = buf[fine:].tobytes()
+        self.report['offset'] += fine
 
+        if self._stati_giri is None:
+            if not len(imu_data) and not len(bmp_data):
+                return None, None
+            self._stati_giri = _stati_timeline(imu_data['timestamp'], bmp_data['timestamp'])
+        return tuple(self._decoder._converti_blocco(tipo, pacchetti, self._stati_giri, self._stati_salti)
+                     if len(pacchetti) else None
+                     for tipo, pacchetti in (('imu', imu_data), ('bmp', bmp_data)))
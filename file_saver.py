@@ -3,11 +3,14 @@ import os
 import numpy as np
 import pandas as pd
 
+from decoder import colonne_fisiche
+
 
 class file_saver:
     def __init__(self, RP_id, folder_path, dataframe, df_bmp, time_start, time_stop, offset):
         self.folder_path = folder_path
-        self.dataframe = dataframe
+        # DataFrame compatto di Decoder.decode(): colonne in unità fisiche per i file salvati
+        self.dataframe = colonne_fisiche(dataframe)
         self.df_bmp = df_bmp
         self.RP_id = RP_id
         self.time_start = time_start
@@ -0,0 +1,258 @@
+import numpy as np
+
+from decoder import ASSI_ACCEL, valori_fisici
+from resampler import tempi_crescenti
+
+
+# ---------------------------
+# TAGLIO AUTOMATICO INTERVALLO VOLO
+# ---------------------------
+def intervallo_volo(tempi, quota, threshold_start=1.0, threshold_end=0.5, margin=3.0, centratura_hmax=True):
+    """
+    Nucleo numpy di get_flight_interval_strict: (t_start, t_end) del volo con i margini,
+    o None se la quota non supera mai `threshold_start`.
+    """
+    tempi = np.asarray(tempi, dtype=float)
+    quota = np.asarray(quota, dtype=float)
+
+    # Trova t_start (primo punto sopra threshold_start)
+    above_start = quota > threshold_start
+    if not above_start.any():
+        return None
+    t_start_flight = tempi[np.argmax(above_start)]
+
+    # Trova il massimo di altitudine
+    t_hmax = tempi[np.nanargmax(quota)]
+
+    # Trova t_end (primo punto dopo il max in cui scende sotto threshold_end)
+    below_end = (quota < threshold_end) & (tempi > t_hmax)
+    t_end_flight = tempi[np.argmax(below_end)] if below_end.any() else tempi[-1]
+
+    # Applica margini
+    t_end = min(tempi[-1], t_end_flight + margin)
+    if not centratura_hmax:
+        t_start = max(tempi[0], t_start_flight - margin)
+    else:
+        # Nuovo t_start centrato: stessa durata prima e dopo Hmax
+        t_start = max(tempi[0], t_hmax - (t_end - t_hmax))
+    return t_start, t_end
+
+
+def get_flight_interval_strict(df, threshold_start=1.0, threshold_end=0.5, margin=3.0, centratura_hmax=True):
+    """
+    Determina l'intervallo del volo e aggiunge un margine prima e dopo.
+    Se centratura_hmax=True, taglia a sinistra in modo che Hmax sia centrato.
+    """
+    time = df['timestamp_sec']
+    intervallo = intervallo_volo(time, df['altitude_kalman'], threshold_start, threshold_end, margin, centratura_hmax)
+    if intervallo is None:
+        return df, time.iloc[0], time.iloc[-1]
+    t_start, t_end = intervallo
+
+    # Taglia il dataframe
+    df_cut = df[(time >= t_start) & (time <= t_end)].copy()
+
+    # Riporta il tempo a partire da zero
+    df_cut['timestamp_sec'] = df_cut['timestamp_sec'] - t_start
+
+    return df_cut, t_start, t_end
+
+
+def taglia_intervallo(df, t_start, t_end, offset_tempo=0.0):
+    """
+    Righe di `df` con tempo in [t_start, t_end], con il tempo riportato a partire da zero.
+    `offset_tempo` [s] è sottratto prima da 'timestamp_sec' (es. per portare l'IMU sulla
+    base dei tempi BMP, vedi resampler.allinea).
+    """
+    tempi = df['timestamp_sec'].to_numpy() - offset_tempo
+    dentro = (tempi >= t_start) & (tempi <= t_end)
+    df_cut = df[dentro].copy()
+    df_cut['timestamp_sec'] = tempi[dentro] - t_start
+    return df_cut
+
+
+def intervallo_grezzo(tempi, quota, tempo_iniziale=1, margine=10.0, finestra_mediana=0.5, threshold_start=1.0,
+                      threshold_end=0.5, margin=3.0, centratura_hmax=True):
+    """
+    Stima economica dell'intervallo del volo dalla quota grezza, per ritagliare il log prima
+    dei filtri: mediane a blocchi di `finestra_mediana` s (contro spike e rumore) meno quella
+    dei primi `tempo_iniziale` secondi, intervallo_volo con gli stessi parametri del taglio e
+    `margine` secondi in più per parte, che assorbono i transitori ai bordi dei filtri e lo
+    scarto fra la quota grezza e quella filtrata.
+
+    :return: (t_inizio, t_fine) entro i tempi del log, o None se il volo non è riconosciuto
+    """
+    tempi = np.asarray(tempi, dtype=float)
+    quota = np.asarray(quota, dtype=float)
+    if len(tempi) < 2:
+        return None
+    blocco = max(1, int(round(finestra_mediana / np.median(np.diff(tempi)))))
+    m = max(1, len(tempi) // blocco)
+    mediane = np.median(quota[:m * blocco].reshape(m, -1), axis=1)
+    centri = tempi[:m * blocco].reshape(m, -1).mean(axis=1)
+    pad = centri <= tempo_iniziale
+    mediane -= np.median(mediane[pad]) if pad.any() else mediane[0]
+    intervallo = intervallo_volo(centri, mediane, threshold_start, threshold_end, margin, centratura_hmax)
+    if intervallo is None:
+        return None
+    return max(tempi[0], intervallo[0] - margine), min(tempi[-1], intervallo[1] + margine)
+
+
+# ---------------------------
+# RILEVAMENTO EVENTI DEL VOLO
+# ---------------------------
+EVENTI = ('lancio', 'burnout', 'apogeo', 'atterraggio')
+
+
+def isteresi(segnale, alta, bassa):
+    """
+    Stato con isteresi: si accende quando `segnale` supera `alta` e resta acceso finché non
+    scende sotto `bassa` (spento all'inizio). Vettoriale: ogni campione prende lo stato
+    dell'ultimo attraversamento di una delle due soglie.
+    """
+    segnale = np.asarray(segnale)
+    scatti = np.where(segnale > alta, 1, np.where(segnale < bassa, 0, -1))
+    ultimo = np.maximum.accumulate(np.where(scatti >= 0, np.arange(len(segnale)), -1))
+    return (ultimo >= 0) & (scatti[np.maximum(ultimo, 0)] == 1)
+
+
+def tratti(maschera, minimo=1):
+    """Inizi e fini (esclusi) dei tratti consecutivi True lunghi almeno `minimo` campioni."""
+    bordi = np.diff(np.concatenate([[0], np.asarray(maschera, dtype=np.int8), [0]]))
+    inizi, fini = np.flatnonzero(bordi == 1), np.flatnonzero(bordi == -1)
+    lunghi = fini - inizi >= minimo
+    return inizi[lunghi], fini[lunghi]
+
+
+def mediana_mobile(valori, finestra):
+    """Mediana su `finestra` campioni centrata su ogni campione (bordi ripetuti)."""
+    valori = np.asarray(valori, dtype=float)
+    if finestra < 2:
+        return valori.copy()
+    estesi = np.pad(valori, (finestra // 2, (finestra - 1) // 2), mode='edge')
+    return np.median(np.lib.stride_tricks.sliding_window_view(estesi, finestra), axis=1)
+
+
+def media_mobile(valori, finestra):
+    """Media su `finestra` campioni centrata su ogni campione (somme cumulative, bordi ripetuti)."""
+    estesi = np.pad(np.asarray(valori, dtype=float), (finestra // 2, (finestra - 1) // 2), mode='edge')
+    somme = np.concatenate([[0.0], np.cumsum(estesi)])
+    return (somme[finestra:] - somme[:-finestra]) / finestra
+
+
+def _confidenza(salto, rumore):
+    """Da 0 a 1 con il rapporto segnale/rumore del salto (0.63 a 5 volte il rumore)."""
+    return float(1 - np.exp(-max(salto, 0) / (5 * max(rumore, 1e-6))))
+
+
+def rileva_eventi(tempi_imu, accel_g, tempi_bmp=None, quota=None, tempo_iniziale=1, soglia_spinta=2.0,
+                  soglia_fine_spinta=1.5, durata_spinta=0.02, soglia_quiete=0.05, durata_quiete=1.0,
+                  salita_minima=2.0, finestra_salita=3.0, finestra_mediana=0.2, finestra_quiete=0.1,
+                  quota_atterraggio=2.0):
+    """
+    Eventi del volo dai dati grezzi, senza la catena dei filtri:
+    - lancio: primo tratto con |a| oltre `soglia_spinta` g (isteresi fino a `soglia_fine_spinta`)
+      lungo almeno `durata_spinta` s e, con il BMP, seguito entro `finestra_salita` s da una
+      salita di `salita_minima` m; l'istante è l'ultimo attraversamento di `soglia_fine_spinta`
+      prima del tratto
+    - burnout: fine dello stesso tratto (gradino dell'accelerazione)
+    - apogeo: massimo della quota BMP (mediana mobile di `finestra_mediana` s) dopo il lancio
+    - atterraggio: inizio del primo tratto dopo l'apogeo (o dopo il burnout senza BMP) con la
+      media di |a| su `finestra_quiete` s entro `soglia_quiete` g da 1 g per almeno
+      `durata_quiete` s (razzo fermo) e, con il BMP, la quota entro `quota_atterraggio` m da
+      quella del lancio (esclude la discesa col paracadute, anch'essa a circa 1 g)
+    La confidenza (0-1) cresce con il salto del segnale rispetto al rumore: sul pad per
+    lancio, burnout e apogeo, nel tratto fermo per l'atterraggio.
+
+    :param tempi_imu: Tempi IMU [s] crescenti, nella base dei tempi BMP
+    :param accel_g: Accelerometro (n, 3) o modulo (n,) [g]
+    :param tempi_bmp: Tempi BMP [s] (facoltativi, come `quota`)
+    :param quota: Altitudine BMP grezza [m]
+    :return: Dizionario evento -> {'t': istante [s] o None, 'confidenza': 0-1}
+    """
+    tempi_imu = np.asarray(tempi_imu, dtype=float)
+    accel = np.asarray(accel_g, dtype=float)
+    modulo = np.linalg.norm(accel, axis=1) if accel.ndim == 2 else np.abs(accel)
+    pad = tempi_imu <= tempi_imu[0] + tempo_iniziale
+    rumore_imu = modulo[pad].std() if pad.any() else 0.0
+    con_bmp = tempi_bmp is not None and quota is not None and len(tempi_bmp) > 1
+    eventi = {nome: {'t': None, 'confidenza': 0.0} for nome in EVENTI}
+
+    if con_bmp:
+        tempi_bmp = np.asarray(tempi_bmp, dtype=float)
+        dt_bmp = np.median(np.diff(tempi_bmp))
+        quota = mediana_mobile(quota, max(1, int(round(finestra_mediana / dt_bmp))))
+        pad_bmp = tempi_bmp <= tempi_bmp[0] + tempo_iniziale
+        rumore_bmp = quota[pad_bmp].std() if pad_bmp.any() else 0.0
+
+    # Lancio e burnout: tratti di spinta con isteresi e durata minima
+    dt_imu = np.median(np.diff(tempi_imu)) if len(tempi_imu) > 1 else 1.0
+    inizi, fini = tratti(isteresi(modulo, soglia_spinta, soglia_fine_spinta) & ~pad,
+                         max(1, int(round(durata_spinta / dt_imu))))
+    if con_bmp and len(inizi):
+        # Solo i tratti seguiti da una salita della quota
+        t0 = tempi_imu[inizi]
+        prima = np.interp(t0, tempi_bmp, quota)
+        finestre = zip(np.searchsorted(tempi_bmp, t0), np.searchsorted(tempi_bmp, t0 + finestra_salita, side='right'))
+        salita = np.array([quota[a:b].max() if b > a else -np.inf for a, b in finestre]) - prima
+        buoni = salita >= salita_minima
+        inizi, fini = inizi[buoni], fini[buoni]
+    if not len(inizi):
+        return eventi
+    inizio, fine = inizi[0], min(fini[0], len(modulo) - 1)
+    sotto = np.flatnonzero(modulo[:inizio] < soglia_fine_spinta)
+    lancio = sotto[-1] + 1 if len(sotto) else inizio
+    spinta = modulo[inizio:fine].mean()
+    eventi['lancio'] = {'t': tempi_imu[lancio], 'confidenza': _confidenza(spinta - 1, rumore_imu)}
+    dopo = modulo[fine:fine + max(1, fine - inizio)].mean()
+    eventi['burnout'] = {'t': tempi_imu[fine], 'confidenza': _confidenza(spinta - dopo, rumore_imu)}
+
+    # Apogeo: massimo della quota dopo il lancio
+    riferimento = tempi_imu[fine]
+    if con_bmp:
+        dal_lancio = np.searchsorted(tempi_bmp, tempi_imu[lancio])
+        if dal_lancio < len(quota):
+            i = dal_lancio + np.argmax(quota[dal_lancio:])
+            eventi['apogeo'] = {'t': tempi_bmp[i],
+                                'confidenza': _confidenza(quota[i] - quota[max(dal_lancio - 1, 0)], rumore_bmp)}
+            riferimento = tempi_bmp[i]
+
+    # Atterraggio: primo tratto fermo (|a| ≈ 1 g) abbastanza lungo dopo l'apogeo
+    fermo = (np.abs(media_mobile(modulo, max(1, int(round(finestra_quiete / dt_imu)))) - 1) < soglia_quiete)
+    fermo &= tempi_imu > riferimento
+    if con_bmp:
+        fermo &= np.interp(tempi_imu, tempi_bmp, quota) < np.interp(tempi_imu[lancio], tempi_bmp, quota) + quota_atterraggio
+    lunghezza = max(1, int(round(durata_quiete / dt_imu)))
+    inizi_fermo, _ = tratti(fermo, lunghezza)
+    if len(inizi_fermo):
+        # Movimento in volo rispetto alla quiete a terra
+        i = inizi_fermo[0]
+        in_volo = modulo[fine:i]
+        movimento = in_volo.std() if len(in_volo) else 0.0
+        eventi['atterraggio'] = {'t': tempi_imu[i],
+                                 'confidenza': _confidenza(movimento, modulo[i:i + lunghezza].std())}
+    return eventi
+
+
+def eventi_volo(df_imu, df_bmp=None, offset_bmp=None, **parametri):
+    """
+    rileva_eventi su DataFrame IMU (accel_*_g) e BMP ('altitude', facoltativo), con i tempi
+    IMU riportati sulla base BMP (vedi resampler.allinea); i parametri sono quelli di rileva_eventi.
+    """
+    if offset_bmp is None:
+        offset_bmp = df_bmp.attrs.get('offset_tempo', 0.0) if df_bmp is not None else 0.0
+    tempi_imu = df_imu['timestamp_sec'].to_numpy(dtype=float) - offset_bmp
+    crescenti = tempi_crescenti(tempi_imu)
+    accel = np.column_stack([valori_fisici(df_imu, c)[crescenti] for c in ASSI_ACCEL]).astype(float)
+    tempi_bmp = quota = None
+    if df_bmp is not None:
+        df = df_bmp[df_bmp['timestamp_sec'].diff() > 0]
+        tempi_bmp, quota = df['timestamp_sec'].to_numpy(dtype=float), df['altitude'].to_numpy(dtype=float)
+    return rileva_eventi(tempi_imu[crescenti], accel, tempi_bmp, quota, **parametri)
+
+
+def stampa_eventi(eventi):
+    """Riassunto a terminale di rileva_eventi()."""
+    for nome, evento in eventi.items():
+        t = '-' if evento['t'] is None else f"{evento['t']:.3f} s"
+        print(f"{nome:<12} {t:>12}   confidenza {evento['confidenza']:.2f}")
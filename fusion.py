@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+from Filter import smoother_accelerazione_costante, sopprimi_spike
+from attitude import integra_assetto
+from decoder import ASSI_ACCEL, ASSI_GYRO, valori_fisici
+from resampler import tempi_crescenti
+
+G0 = 9.80665  # [m/s²] accelerazione di gravità standard
+
+
+# ---------------------------
+# ACCELERAZIONE VERTICALE
+# ---------------------------
+def accelerazione_verticale(tempi, accel_g, tempo_iniziale=1):
+    """
+    Accelerazione verticale [m/s²] dall'asse dell'accelerometro allineato al razzo: sottrae
+    la media dei primi `tempo_iniziale` secondi (gravità e bias sul pad) e orienta il segno
+    con quello della media, così è positiva verso l'alto qualunque sia il verso di montaggio.
+    Vale finché il razzo resta vicino alla verticale.
+    """
+    accel_g = np.asarray(accel_g, dtype=float)
+    pad = accel_g[np.asarray(tempi) <= tempo_iniziale].mean()
+    return (accel_g - pad) * (G0 * np.sign(pad))
+
+
+def asse_razzo(df_imu, offset_bmp=0.0, colonna_accel='accel_z_g', tempo_iniziale=1, assetto=False):
+    """
+    Tempi IMU crescenti nella base dei tempi BMP e accelerazione [g] lungo l'asse usato dalla
+    fusione: `colonna_accel`, o con `assetto` la verticale terrestre di attitude.integra_assetto.
+    """
+    tempi_imu = df_imu['timestamp_sec'].to_numpy(dtype=float) - offset_bmp
+    crescenti = tempi_crescenti(tempi_imu)
+    tempi_imu = tempi_imu[crescenti]
+    if assetto:
+        accel = np.column_stack([valori_fisici(df_imu, c)[crescenti] for c in ASSI_ACCEL]).astype(float)
+        gyro = np.column_stack([valori_fisici(df_imu, c)[crescenti] for c in ASSI_GYRO]).astype(float)
+        return tempi_imu, integra_assetto(tempi_imu, accel, gyro, tempo_iniziale)[2]
+    return tempi_imu, valori_fisici(df_imu, colonna_accel)[crescenti].astype(float)
+
+
+# ---------------------------
+# INTEGRAZIONE FRA LE MISURE BMP
+# ---------------------------
+def _integrali(tempi_imu, accelerazione, tempi):
+    """
+    Velocità e quota dovute alla sola accelerazione (tenuta costante fino al campione IMU
+    successivo), integrate dall'inizio sulla griglia unione di tempi IMU e `tempi`, e
+    restituite agli istanti `tempi`: (V, H) con V(t) = ∫a e H(t) = ∫∫a.
+    """
+    griglia = np.concatenate([tempi_imu, tempi])
+    ordine = np.argsort(griglia, kind='stable')
+    griglia = griglia[ordine]
+    a = accelerazione[np.maximum(np.searchsorted(tempi_imu, griglia[:-1], side='right') - 1, 0)]
+    dt = np.diff(griglia)
+    v = np.concatenate([[0.0], np.cumsum(a * dt)])
+    h = np.concatenate([[0.0], np.cumsum(v[:-1] * dt + 0.5 * a * dt * dt)])
+    posizioni = np.empty(len(griglia), dtype=np.int64)
+    posizioni[ordine] = np.arange(len(griglia))
+    richiesti = posizioni[len(tempi_imu):]
+    return v[richiesti], h[richiesti]
+
+
+# ---------------------------
+# FUSIONE BMP + ACCELEROMETRO
+# ---------------------------
+def fondi(tempi_imu, accelerazione, tempi_bmp, quota, q_bias=0.01, q_accelerazione=0.5, r=0.0625,
+          smoother=True):
+    """
+    Quota e velocità alla frequenza dell'IMU: l'accelerazione verticale è l'ingresso delle
+    predizioni e la quota BMP la misura (smoother_accelerazione_costante con `controllo`).
+    Le predizioni fra due misure BMP sono integrate in blocco con somme cumulative e il Kalman
+    gira solo agli istanti BMP; la traccia a 1 kHz è poi ricostruita integrando l'accelerazione
+    da ogni stato stimato e, con lo smoother, distribuendo linearmente nel tratto lo scarto
+    dallo stato stimato successivo (traccia continua).
+
+    :param tempi_imu: Tempi IMU [s] crescenti, nella base dei tempi BMP
+    :param accelerazione: Accelerazione verticale [m/s²] senza gravità (accelerazione_verticale)
+    :param tempi_bmp: Tempi BMP [s] strettamente crescenti
+    :param quota: Altitudine BMP [m]
+    :param q_bias: Densità della deriva del bias dell'accelerometro [m²/s⁵]
+    :param q_accelerazione: Densità del rumore dell'accelerometro [m²/s³]
+    :param r: Varianza della misura di quota [m²]
+    :param smoother: False per il solo filtro in avanti (causale)
+    :return: (stati (n_imu, 3): quota, velocità, accelerazione corretta dal bias;
+              stati agli istanti BMP (n_bmp, 3): quota, velocità, correzione del bias)
+    """
+    tempi_imu = np.asarray(tempi_imu, dtype=float)
+    accelerazione = np.asarray(accelerazione, dtype=float)
+    tempi_bmp = np.asarray(tempi_bmp, dtype=float)
+    # Integrali con la stessa origine agli istanti BMP e IMU
+    v, h = _integrali(tempi_imu, accelerazione, np.concatenate([tempi_bmp, tempi_imu]))
+    v, v_imu = v[:len(tempi_bmp)], v[len(tempi_bmp):]
+    h, h_imu = h[:len(tempi_bmp)], h[len(tempi_bmp):]
+    incrementi = np.zeros((len(tempi_bmp), 2))
+    incrementi[1:, 0] = np.diff(h) - v[:-1] * np.diff(tempi_bmp)
+    incrementi[1:, 1] = np.diff(v)
+    stati_bmp, _ = smoother_accelerazione_costante(tempi_bmp, quota, q_bias, r, smoother=smoother, deviazioni=False,
+                                                   controllo=incrementi, q_controllo=q_accelerazione)
+
+    # Traccia IMU: stato del tratto BMP precedente propagato con l'accelerazione misurata
+    k = np.maximum(np.searchsorted(tempi_bmp, tempi_imu, side='right') - 1, 0)
+    tau = tempi_imu - tempi_bmp[k]
+    quota_k, velocita_k, correzione_k = stati_bmp[k].T
+    stati = np.empty((len(tempi_imu), 3))
+    stati[:, 0] = quota_k + velocita_k * tau + 0.5 * correzione_k * tau * tau + h_imu - h[k] - v[k] * tau
+    stati[:, 1] = velocita_k + correzione_k * tau + v_imu - v[k]
+    stati[:, 2] = accelerazione + correzione_k
+    if smoother and len(tempi_bmp) > 1:
+        # Scarto fra lo stato smussato successivo e quello propagato, ripartito nel tratto
+        durata = np.diff(tempi_bmp)
+        propagati_quota = (stati_bmp[:-1, 0] + stati_bmp[:-1, 1] * durata + 0.5 * stati_bmp[:-1, 2] * durata ** 2
+                           + incrementi[1:, 0])
+        propagati_velocita = stati_bmp[:-1, 1] + stati_bmp[:-1, 2] * durata + incrementi[1:, 1]
+        dentro = tempi_imu < tempi_bmp[-1]
+        kd = k[dentro]
+        frazione = tau[dentro] / durata[kd]
+        stati[dentro, 0] += frazione * (stati_bmp[kd + 1, 0] - propagati_quota[kd])
+        stati[dentro, 1] += frazione * (stati_bmp[kd + 1, 1] - propagati_velocita[kd])
+    return stati, stati_bmp
+
+
+def fusione_baro_imu(df_imu, df_bmp, colonna_accel='accel_z_g', column='altitude', tempo_iniziale=1,
+                     q_bias=0.01, q_accelerazione=0.5, r=0.0625, spike_finestra=10, spike_soglia=5,
+                     spike_sequenziale=True, smoother=True, offset_bmp=None, assetto=False):
+    """
+    Fusione di accelerometro IMU (1 kHz) e altitudine BMP (100 Hz) con fondi(). La quota BMP
+    passa per anti-spike e offset come in process_rocket_baro; i tempi IMU sono riportati
+    sulla base BMP (vedi resampler.allinea) e la traccia copre il tratto comune ai due flussi.
+
+    Le colonne hanno i nomi di process_rocket_baro ('altitude_kalman', 'velocity_kalman',
+    'acceleration_kalman', 'velocity' derivata da 'altitude_kalman'), così l'uscita può
+    sostituire il DataFrame BMP (es. in get_flight_interval_strict e nei grafici); 'altitude'
+    è la quota BMP interpolata e 'acceleration' l'accelerazione verticale misurata.
+
+    :param colonna_accel: Asse dell'accelerometro allineato al razzo [g]
+    :param assetto: True per usare l'accelerazione verticale nel riferimento terrestre di
+                    attitude.integra_assetto (giroscopi) invece di `colonna_accel`: più corretta
+                    nei voli non verticali
+    :param offset_bmp: Tempo micros() [s] del primo campione BMP (default: attrs['offset_tempo'] di df_bmp)
+    :return: DataFrame a 1 kHz
+    """
+    if offset_bmp is None:
+        offset_bmp = df_bmp.attrs.get('offset_tempo', 0.0)
+    df = df_bmp.drop_duplicates(subset='timestamp_sec')
+    df = df[df['timestamp_sec'].diff() > 0]
+    tempi_bmp = df['timestamp_sec'].to_numpy(dtype=float)
+    quota, spike = sopprimi_spike(df[column].to_numpy(dtype=float), spike_finestra, spike_soglia, spike_sequenziale)
+    if len(spike):
+        print(f"⚠️ Rimossi {len(spike)} spike in '{column}' agli indici {spike[:10].tolist()}{'...' if len(spike) > 10 else ''}")
+    quota -= quota[tempi_bmp <= tempo_iniziale].mean()
+
+    tempi_imu, asse = asse_razzo(df_imu, offset_bmp, colonna_accel, tempo_iniziale, assetto)
+    accelerazione = accelerazione_verticale(tempi_imu, asse, tempo_iniziale)
+    comune = (tempi_imu >= tempi_bmp[0]) & (tempi_imu <= tempi_bmp[-1])
+
+    stati, _ = fondi(tempi_imu, accelerazione, tempi_bmp, quota, q_bias, q_accelerazione, r, smoother)
+    tempi_imu, stati = tempi_imu[comune], stati[comune]
+    return pd.DataFrame({
+        'timestamp_sec': tempi_imu,
+        'altitude': np.interp(tempi_imu, tempi_bmp, quota),
+        'altitude_kalman': stati[:, 0],
+        'velocity': np.gradient(stati[:, 0], tempi_imu),
+        'velocity_kalman': stati[:, 1],
+        'acceleration': accelerazione[comune],
+        'acceleration_kalman': stati[:, 2],
+    })
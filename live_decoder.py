@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import errno
+import os
+import threading
+import time
+
+from decoder import DecodificaFlusso, report_danni
+
+# 1 kHz IMU (25 byte) + 100 Hz BMP (9 byte): ~26 kB/s, servono almeno ~260 kbaud
+BAUDRATE = 921_600
+BYTE_AL_SECONDO = 1000 * 25 + 100 * 9
+
+
+async def apri_seriale(device, baudrate=BAUDRATE):
+    """
+    Apre `device` in sola lettura e restituisce un asyncio.StreamReader.
+    Usa pyserial-asyncio se installato (necessario su Windows); altrimenti apre il device
+    come terminale POSIX in modalità raw (porta seriale o pty).
+    """
+    try:
+        import serial_asyncio
+    except ImportError:
+        serial_asyncio = None
+    if serial_asyncio is not None:
+        reader, _ = await serial_asyncio.open_serial_connection(url=device, baudrate=baudrate)
+        return reader
+
+    import termios
+    import tty
+    fd = os.open(device, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+    tty.setraw(fd)
+    velocita = getattr(termios, f'B{baudrate}', None)
+    if velocita is not None:
+        attributi = termios.tcgetattr(fd)
+        attributi[4] = attributi[5] = velocita
+        termios.tcsetattr(fd, termios.TCSANOW, attributi)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=1 << 20)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, 'rb', 0))
+    return reader
+
+
+# ---------------------------
+# CLASSE LiveDecoder
+# ---------------------------
+class LiveDecoder:
+    """
+    Decodifica dal vivo il flusso M510 ('M510', poi pacchetti 'I'/'B') letto da una porta
+    seriale o da un pty e distribuisce i blocchi decodificati agli iscritti.
+
+    Ogni iscritto riceve da una coda limitata tuple (tipo, DataFrame) con tipo 'imu' o 'bmp'
+    (colonne di Decoder.decode_chunks()) e None alla fine del flusso. Con una coda piena la
+    lettura si ferma finché l'iscritto non la svuota (backpressure); con `scarta_vecchi`
+    si scarta invece il blocco più vecchio di quella coda, contandolo in `scartati`.
+    Il None finale non attende mai: con una coda piena prende il posto del blocco più vecchio
+    (anch'esso contato in `scartati`), così run() termina anche se l'iscritto non legge più.
+    """
+
+    def __init__(self, device=None, baudrate=BAUDRATE, header=False, resync=True,
+                 lettura=4096, scarta_vecchi=False):
+        """
+        :param device: Porta seriale o pty (es. /dev/ttyUSB0, COM3)
+        :param baudrate: Velocità della seriale
+        :param header: True se la lettura parte dall'inizio del flusso ('M510');
+                       False per agganciarsi a un flusso già avviato
+        :param resync: Riprende dopo i tratti corrotti (vedi Decoder.decode)
+        :param lettura: Byte massimi letti per volta dalla porta
+        :param scarta_vecchi: Con una coda piena scarta il blocco più vecchio invece di attendere
+        """
+        self.device = device
+        self.baudrate = baudrate
+        self.lettura = lettura
+        self.scarta_vecchi = scarta_vecchi
+        self.flusso = DecodificaFlusso(resync, header)
+        self.iscritti = []
+        self.byte_letti = 0
+        self.campioni = {'imu': 0, 'bmp': 0}
+        self.scartati = 0
+
+    @property
+    def report(self):
+        return report_danni(self.flusso.report)
+
+    def subscribe(self, maxsize=64):
+        """Restituisce una nuova coda di al massimo `maxsize` blocchi."""
+        coda = asyncio.Queue(maxsize)
+        self.iscritti.append(coda)
+        return coda
+
+    def unsubscribe(self, coda):
+        self.iscritti.remove(coda)
+
+    async def _pubblica(self, elemento):
+        for coda in list(self.iscritti):
+            if self.scarta_vecchi and coda.full():
+                coda.get_nowait()
+                self.scartati += 1
+            await coda.put(elemento)
+
+    async def run(self, reader=None):
+        """
+        Legge fino alla fine del flusso (o a un marker sconosciuto senza resync).
+        `reader` è un asyncio.StreamReader già aperto; se manca viene aperto `device`.
+        """
+        reader = reader or await apri_seriale(self.device, self.baudrate)
+        try:
+            while not self.flusso.interrotto:
+                try:
+                    dati = await reader.read(self.lettura)
+                except OSError as e:
+                    if e.errno != errno.EIO:
+                        raise
+                    dati = b''  # pty: l'altro lato è stato chiuso
+                if not dati:
+                    break
+                self.byte_letti += len(dati)
+                for tipo, df in zip(('imu', 'bmp'), self.flusso.feed(dati)):
+                    if df is not None:
+                        self.campioni[tipo] += len(df)
+                        await self._pubblica((tipo, df))
+        finally:
+            for coda in list(self.iscritti):
+                if coda.full():
+                    coda.get_nowait()
+                    self.scartati += 1
+                coda.put_nowait(None)
+
+
+# ---------------------------
+# PTY DI PROVA
+# ---------------------------
+class ReplayPty:
+    """
+    Sostituto locale del logger per le prove: riscrive un log registrato su un pty a
+    `byte_al_secondo` (default: la velocità reale di 1 kHz IMU + 100 Hz BMP), da un thread
+    separato come farebbe il dispositivo. `device` è il lato da aprire con LiveDecoder.
+    Solo POSIX.
+    """
+
+    def __init__(self, path, byte_al_secondo=BYTE_AL_SECONDO, blocco=512):
+        import pty
+        import tty
+        self.path = path
+        self.byte_al_secondo = byte_al_secondo
+        self.blocco = blocco
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)  # niente echo né conversioni di fine riga
+        self.device = os.ttyname(self._slave)
+        self._thread = threading.Thread(target=self._scrivi, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._thread.join()
+        os.close(self._slave)
+
+    def _scrivi(self):
+        inizio = time.perf_counter()
+        scritti = 0
+        try:
+            with open(self.path, 'rb') as f:
+                while True:
+                    dati = f.read(self.blocco)
+                    if not dati:
+                        break
+                    ritardo = inizio + scritti / self.byte_al_secondo - time.perf_counter()
+                    if ritardo > 0:
+                        time.sleep(ritardo)
+                    os.write(self._master, dati)
+                    scritti += len(dati)
+            # Chiudendo il master i byte non ancora letti andrebbero persi: si attende che il lettore li consumi
+            while self._in_attesa():
+                time.sleep(0.01)
+        finally:
+            # Chiudendo il master il lettore riceve EOF (EIO) a fine flusso
+            os.close(self._master)
+
+    def _in_attesa(self):
+        import fcntl
+        import struct
+        import termios
+        return struct.unpack('i', fcntl.ioctl(self._slave, termios.FIONREAD, b'\0\0\0\0'))[0]
+
+
+async def _stampa_blocchi(decoder, coda):
+    while True:
+        elemento = await coda.get()
+        if elemento is None:
+            break
+        tipo, df = elemento
+        if tipo == 'bmp':
+            print(f"t = {df['timestamp_sec'].iloc[-1]:8.2f} s  altitudine {df['altitude'].iloc[-1]:7.2f} m  "
+                  f"({decoder.campioni['imu']} IMU, {decoder.campioni['bmp']} BMP)")
+
+
+async def _main(args):
+    if args.replay:
+        with ReplayPty(args.replay, args.velocita * BYTE_AL_SECONDO) as replay:
+            decoder = LiveDecoder(replay.device, header=True, resync=not args.no_resync)
+            coda = decoder.subscribe()
+            t = time.perf_counter()
+            await asyncio.gather(decoder.run(), _stampa_blocchi(decoder, coda))
+            durata = time.perf_counter() - t
+        atteso = os.path.getsize(args.replay) / (args.velocita * BYTE_AL_SECONDO)
+        print(f"Replay: {decoder.byte_letti} byte in {durata:.1f} s (atteso {atteso:.1f} s), "
+              f"{decoder.campioni['imu']} IMU, {decoder.campioni['bmp']} BMP, {decoder.scartati} blocchi scartati")
+    else:
+        decoder = LiveDecoder(args.device, args.baudrate, resync=not args.no_resync)
+        coda = decoder.subscribe()
+        await asyncio.gather(decoder.run(), _stampa_blocchi(decoder, coda))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Decodifica dal vivo il flusso M510 da seriale o pty')
+    parser.add_argument('device', nargs='?', help='Porta seriale, es. /dev/ttyUSB0 o COM3')
+    parser.add_argument('--baudrate', type=int, default=BAUDRATE)
+    parser.add_argument('--replay', default=None, help='Riproduce un log registrato su un pty locale')
+    parser.add_argument('--velocita', type=float, default=1.0, help='Velocità del replay (1 = tempo reale)')
+    parser.add_argument('--no-resync', action='store_true', help='Si ferma al primo tratto corrotto')
+    args = parser.parse_args()
+    if not args.device and not args.replay:
+        parser.error('serve un device o --replay')
+    asyncio.run(_main(args))
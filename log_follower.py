@@ -0,0 +1,146 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from decoder import FINESTRA_LETTURA, DecodificaFlusso, report_danni
+
+
+class _Colonne:
+    """Colonne numpy a cui si aggiungono righe in coda, con capacità raddoppiata quando serve."""
+
+    def __init__(self):
+        self.dati = {}
+        self.n = 0
+
+    def aggiungi(self, df):
+        nuove = len(df)
+        if not nuove:
+            return
+        for nome in df.columns:
+            valori = df[nome].to_numpy()
+            colonna = self.dati.get(nome)
+            if colonna is None:
+                colonna = np.empty(max(nuove, 1024), dtype=valori.dtype)
+            elif self.n + nuove > len(colonna):
+                colonna = np.resize(colonna, max(2 * len(colonna), self.n + nuove))
+            colonna[self.n:self.n + nuove] = valori
+            self.dati[nome] = colonna
+        self.n += nuove
+
+    def viste(self):
+        return {nome: colonna[:self.n] for nome, colonna in self.dati.items()}
+
+
+# ---------------------------
+# CLASSE LogFollower
+# ---------------------------
+class LogFollower:
+    """
+    Decodifica incrementale di un log M510 che cresce (logger che scrive su una SD montata,
+    copia in corso dalla scheda). Ricorda l'ultimo byte letto e il pacchetto troncato in coda:
+    ogni poll() legge solo i byte aggiunti e li accoda alle colonne in memoria, con un costo
+    proporzionale ai dati nuovi e non alla dimensione del file.
+
+    Le colonne sono quelle di Decoder.decode_chunks(): il tempo BMP parte dal primo campione
+    ed è corretto dai salti, ma non viene riordinato come in decode().
+    Se il file si accorcia (log sostituito o riscritto) la lettura riparte da zero.
+    """
+
+    def __init__(self, path, resync=True, finestra=FINESTRA_LETTURA):
+        """
+        :param path: Percorso del log
+        :param resync: Riprende dopo i tratti corrotti (vedi Decoder.decode)
+        :param finestra: Byte letti dal file per volta
+        """
+        self.path = path
+        self.resync = resync
+        self.finestra = finestra
+        self.reset()
+
+    def reset(self):
+        self._letti = 0              # byte del file già letti (header compreso)
+        self._flusso = DecodificaFlusso(self.resync)
+        self._colonne = {'imu': _Colonne(), 'bmp': _Colonne()}
+
+    @property
+    def interrotto(self):
+        """Senza resync: marker sconosciuto, la lettura è finita."""
+        return self._flusso.interrotto
+
+    @property
+    def byte_letti(self):
+        return self._letti
+
+    @property
+    def report(self):
+        return report_danni(self._flusso.report)
+
+    @property
+    def imu(self):
+        """DataFrame IMU compatto (vedi decoder.colonne_fisiche) con tutti i campioni letti finora."""
+        return pd.DataFrame(self._colonne['imu'].viste(), copy=False)
+
+    @property
+    def bmp(self):
+        """DataFrame ('timestamp_sec', 'altitude') con tutti i campioni BMP letti finora."""
+        return pd.DataFrame(self._colonne['bmp'].viste(), columns=['timestamp_sec', 'altitude'])
+
+    def poll(self):
+        """
+        Legge i byte aggiunti dall'ultima chiamata.
+        Restituisce il numero di nuovi campioni (imu, bmp).
+        """
+        nuovi = {'imu': 0, 'bmp': 0}
+        if self.interrotto:
+            return nuovi['imu'], nuovi['bmp']
+        if os.path.getsize(self.path) < self._letti:
+            self.reset()
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._letti)
+            while not self.interrotto:
+                dati = f.read(self.finestra)
+                if not dati:
+                    break
+                self._letti += len(dati)
+                for tipo, df in zip(('imu', 'bmp'), self._flusso.feed(dati)):
+                    if df is not None:
+                        self._colonne[tipo].aggiungi(df)
+                        nuovi[tipo] += len(df)
+        return nuovi['imu'], nuovi['bmp']
+
+    def follow(self, intervallo=0.5, timeout=None):
+        """
+        Richiama poll() ogni `intervallo` secondi e genera (nuovi imu, nuovi bmp) quando
+        arrivano dati. Termina dopo `timeout` secondi senza dati nuovi (None = mai).
+        """
+        ultimo = time.monotonic()
+        while not self.interrotto:
+            nuovi = self.poll()
+            if any(nuovi):
+                ultimo = time.monotonic()
+                yield nuovi
+            elif timeout is not None and time.monotonic() - ultimo > timeout:
+                break
+            else:
+                time.sleep(intervallo)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Segue un log M510 mentre viene scritto')
+    parser.add_argument('log', help='Percorso del log')
+    parser.add_argument('--intervallo', type=float, default=0.5, help='Secondi fra due letture')
+    parser.add_argument('--timeout', type=float, default=None, help='Termina dopo TIMEOUT secondi senza dati')
+    parser.add_argument('--no-resync', action='store_true', help='Si ferma al primo tratto corrotto')
+    args = parser.parse_args()
+
+    follower = LogFollower(args.log, resync=not args.no_resync)
+    totale_imu = totale_bmp = 0
+    for nuovi_imu, nuovi_bmp in follower.follow(args.intervallo, args.timeout):
+        totale_imu += nuovi_imu
+        totale_bmp += nuovi_bmp
+        print(f"+{nuovi_imu} IMU, +{nuovi_bmp} BMP (totale {totale_imu} IMU, {totale_bmp} BMP, "
+              f"{follower.byte_letti / 2 ** 20:.1f} MB letti)")
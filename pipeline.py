@@ -0,0 +1,508 @@
+import argparse
+import copy
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import sosfiltfilt
+
+from Filter import (filtro_kalman, finestra_savgol, progetto_butter, savgol_cache, smoother_accelerazione_costante,
+                    smoother_kalman, sopprimi_spike)
+from decode_cache import DecodeCache, cartella_cache_predefinita
+from decoder import DECODER_VERSION, Decoder
+from flight import eventi_volo, get_flight_interval_strict, intervallo_grezzo, taglia_intervallo
+from fusion import fusione_baro_imu
+
+# Da incrementare quando cambia il risultato di uno stadio senza cambiarne il codice né quello
+# dei MODULI_STADI (es. in un helper di questo file o in una libreria): invalida la cache su disco.
+# Le modifiche al codice della funzione dello stadio e dei MODULI_STADI cambiano già la chiave
+PIPELINE_VERSION = 2
+# Moduli chiamati dagli stadi: il loro sorgente intero entra nella chiave (impronta_moduli).
+# Limite: cambiano la chiave anche modifiche che non toccano gli stadi, mentre non la cambiano
+# gli helper di questo file chiamati dagli stadi, gli altri moduli e le versioni di numpy/scipy
+MODULI_STADI = ('Filter', 'decoder', 'flight', 'fusion', 'attitude', 'resampler')
+
+
+@lru_cache(maxsize=None)
+def impronta_codice(funzione):
+    """Hash del sorgente della funzione (del bytecode e delle costanti se il sorgente non è disponibile)."""
+    try:
+        codice = inspect.getsource(funzione).encode('utf-8')
+    except (OSError, TypeError):
+        codice = funzione.__code__.co_code + repr(funzione.__code__.co_consts).encode('utf-8')
+    return hashlib.blake2b(codice, digest_size=8).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def impronta_moduli(moduli=MODULI_STADI):
+    """Hash dei file sorgente dei moduli `moduli`, letti una volta per processo."""
+    h = hashlib.blake2b(digest_size=8)
+    for nome in moduli:
+        with open(importlib.import_module(nome).__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+# ---------------------------
+# STADI
+# ---------------------------
+# Ogni stadio riceve le uscite degli stadi in `ingressi` e i propri parametri, e restituisce
+# un nuovo oggetto senza modificare gli ingressi (che possono stare in cache).
+def stadio_decodifica(path, resync=True, cache=True):
+    """Decoder.decode(): dizionario con 'imu', 'bmp', 'report', 'RP_id', 'folder_path'."""
+    RP_id, folder_path, df_imu, df_bmp, report = Decoder(path).decode(
+        resync, return_report=True, cache=DecodeCache() if cache else None)
+    return {'imu': df_imu, 'bmp': df_bmp, 'report': report, 'RP_id': RP_id, 'folder_path': folder_path}
+
+
+def stadio_tempi(dati, flusso='bmp'):
+    """
+    Tempi come in process_rocket_data: senza duplicati né tempi non crescenti; la frequenza
+    di campionamento stimata è in attrs['fs'].
+    """
+    df = dati[flusso].drop_duplicates(subset='timestamp_sec')
+    df = df[df['timestamp_sec'].diff() > 0].copy()
+    df.attrs['fs'] = 1 / df['timestamp_sec'].diff().mean()
+    return df
+
+
+def stadio_ritaglio(df, colonna='altitude', tempo_iniziale=1, margine=10.0, finestra_mediana=0.5, threshold_start=1.0,
+                    threshold_end=0.5, margin=3.0, centratura_hmax=True):
+    """
+    Ritaglio grezzo prima dei filtri (flight.intervallo_grezzo su `colonna`): restano il volo
+    con `margine` secondi per parte e i primi `tempo_iniziale` secondi, da cui gli stadi
+    successivi prendono gli offset. I tempi non cambiano e attrs['fs'] resta quella del log
+    intero; l'intervallo è in attrs['ritaglio']. Se il volo non è riconosciuto il log resta intero.
+    Fra il pad iniziale e il volo resta un salto nei tempi: i filtri successivi (Butterworth,
+    Savitzky-Golay, Kalman) lo attraversano come se i campioni fossero consecutivi, e il loro
+    transitorio all'inizio della finestra cade nel `margine`, prima del lancio.
+    """
+    tempi = df['timestamp_sec'].to_numpy(dtype=float)
+    intervallo = intervallo_grezzo(tempi, df[colonna].to_numpy(dtype=float), tempo_iniziale, margine,
+                                   finestra_mediana, threshold_start, threshold_end, margin, centratura_hmax)
+    if intervallo is None:
+        return df.copy()
+    tenuti = (tempi <= tempo_iniziale) | ((tempi >= intervallo[0]) & (tempi <= intervallo[1]))
+    ritagliato = df[tenuti].copy()
+    ritagliato.attrs = {**df.attrs, 'ritaglio': intervallo}
+    return ritagliato
+
+
+def stadio_spike(df, colonne, finestra=10, soglia=5, sequenziale=True):
+    """sopprimi_spike su ogni colonna; gli originali restano in '<colonna>_raw'."""
+    df = df.copy()
+    for colonna in colonne:
+        if colonna + '_raw' not in df:
+            df[colonna + '_raw'] = df[colonna]
+        df[colonna], _ = sopprimi_spike(df[colonna].to_numpy(dtype=float), finestra, soglia, sequenziale)
+    return df
+
+
+def stadio_offset(df, colonne, tempo_iniziale=1):
+    """Sottrae a ogni colonna la media dei campioni entro `tempo_iniziale` secondi."""
+    df = df.copy()
+    finestra = (df['timestamp_sec'] <= tempo_iniziale).to_numpy()
+    dati = np.array(df[colonne], dtype=float)
+    dati -= dati[finestra].mean(axis=0)
+    for i, colonna in enumerate(colonne):
+        df[colonna] = dati[:, i]
+    return df
+
+
+def stadio_butterworth(df, colonne, cutoff=1.5, ordine=4):
+    """Passa basso a fase zero (sosfiltfilt) in '<colonna>_butter'."""
+    df = df.copy()
+    sos = progetto_butter(ordine, cutoff, df.attrs['fs'])
+    filtrati = sosfiltfilt(sos, np.array(df[colonne], dtype=float), axis=0)
+    for i, colonna in enumerate(colonne):
+        df[colonna + '_butter'] = filtrati[:, i]
+    return df
+
+
+def stadio_savgol(df, colonne, finestra_sec=0.6, polyorder=2):
+    """Savitzky-Golay di '<colonna>_butter' in '<colonna>_savgol'."""
+    df = df.copy()
+    window_length = finestra_savgol(finestra_sec, df.attrs['fs'])
+    filtrati = savgol_cache(np.array(df[[c + '_butter' for c in colonne]], dtype=float), window_length, polyorder)
+    for i, colonna in enumerate(colonne):
+        df[colonna + '_savgol'] = filtrati[:, i]
+    return df
+
+
+def stadio_kalman(df, colonne, q=0.01, r=0.1, smoother=False):
+    """Kalman (o smoother RTS) di '<colonna>_savgol' in '<colonna>_kalman'."""
+    df = df.copy()
+    dati = np.array(df[[c + '_savgol' for c in colonne]], dtype=float)
+    kalman = smoother_kalman if smoother else filtro_kalman
+    filtrati, _ = kalman(dati, q, r, dati[0], 1)
+    for i, colonna in enumerate(colonne):
+        df[colonna + '_kalman'] = filtrati[:, i]
+    return df
+
+
+def stadio_accelerazione_costante(df, colonna='altitude', q=100.0, r=0.0625, smoother=True):
+    """
+    Kalman ad accelerazione costante (smoother_accelerazione_costante) di `colonna`: stima in
+    '<colonna>_kalman', 'velocity_kalman' e 'acceleration_kalman', con 'velocity' e
+    'velocity_raw' derivate da '<colonna>_kalman' come in stadio_derivata.
+    """
+    df = df.copy()
+    tempi = df['timestamp_sec'].to_numpy(dtype=float)
+    stati, _ = smoother_accelerazione_costante(tempi, df[colonna].to_numpy(dtype=float), q, r,
+                                               smoother=smoother, deviazioni=False)
+    df[colonna + '_kalman'] = stati[:, 0]
+    df['velocity'] = np.gradient(stati[:, 0], tempi)
+    df['velocity_raw'] = df['velocity']
+    df['velocity_kalman'] = stati[:, 1]
+    df['acceleration_kalman'] = stati[:, 2]
+    return df
+
+
+def stadio_fusione(df, dati, colonna_accel='accel_z_g', tempo_iniziale=1, q_bias=0.01, q_accelerazione=0.5,
+                   r=0.0625, spike_finestra=10, spike_soglia=5, spike_sequenziale=True, smoother=True,
+                   assetto=False):
+    """Fusione di accelerometro e altitudine BMP (fusion.fusione_baro_imu): DataFrame a 1 kHz."""
+    return fusione_baro_imu(dati['imu'], df, colonna_accel, 'altitude', tempo_iniziale, q_bias, q_accelerazione, r,
+                            spike_finestra, spike_soglia, spike_sequenziale, smoother,
+                            offset_bmp=dati['bmp'].attrs.get('offset_tempo', 0.0), assetto=assetto)
+
+
+def stadio_derivata(df, colonna='altitude_kalman', nome='velocity'):
+    """Derivata di `colonna` nel tempo (np.gradient) in `nome` e '<nome>_raw'."""
+    df = df.copy()
+    df[nome] = np.gradient(df[colonna].to_numpy(dtype=float), df['timestamp_sec'].to_numpy(dtype=float))
+    df[nome + '_raw'] = df[nome]
+    return df
+
+
+def stadio_taglio(df_bmp, dati, threshold_start=1.0, threshold_end=0.5, margin=3.0, centratura_hmax=True):
+    """
+    Taglio automatico del volo (get_flight_interval_strict) applicato anche all'IMU, con i
+    tempi IMU riportati sulla base BMP.
+    """
+    df_bmp, t_start, t_end = get_flight_interval_strict(df_bmp, threshold_start, threshold_end, margin, centratura_hmax)
+    df_imu = taglia_intervallo(dati['imu'], t_start, t_end, dati['bmp'].attrs.get('offset_tempo', 0.0))
+    return {'bmp': df_bmp, 'imu': df_imu, 't_start': t_start, 't_end': t_end}
+
+
+def stadio_eventi(dati, tempo_iniziale=1, soglia_spinta=2.0, soglia_quiete=0.05, durata_quiete=1.0):
+    """Eventi del volo dai dati grezzi (flight.eventi_volo): evento -> {'t', 'confidenza'}."""
+    return eventi_volo(dati['imu'], dati['bmp'], tempo_iniziale=tempo_iniziale, soglia_spinta=soglia_spinta,
+                       soglia_quiete=soglia_quiete, durata_quiete=durata_quiete)
+
+
+STADI = {
+    'decodifica': stadio_decodifica,
+    'tempi': stadio_tempi,
+    'ritaglio': stadio_ritaglio,
+    'spike': stadio_spike,
+    'offset': stadio_offset,
+    'butterworth': stadio_butterworth,
+    'savgol': stadio_savgol,
+    'kalman': stadio_kalman,
+    'accelerazione_costante': stadio_accelerazione_costante,
+    'fusione': stadio_fusione,
+    'derivata': stadio_derivata,
+    'taglio': stadio_taglio,
+    'eventi': stadio_eventi,
+}
+
+
+def _catena_filtri(prefisso, ingresso, colonne, kalman_q, kalman_r):
+    """Stadi 1-5 di process_rocket_data su `colonne`, a partire dallo stadio `ingresso`."""
+    stadi = OrderedDict()
+    for funzione, parametri in (('spike', {'finestra': 10, 'soglia': 5, 'sequenziale': True}),
+                                ('offset', {'tempo_iniziale': 1}),
+                                ('butterworth', {'cutoff': 1.5, 'ordine': 4}),
+                                ('savgol', {'finestra_sec': 0.6, 'polyorder': 2}),
+                                ('kalman', {'q': kalman_q, 'r': kalman_r, 'smoother': False})):
+        nome = prefisso + funzione
+        stadi[nome] = {'funzione': funzione, 'ingressi': [ingresso], 'parametri': {'colonne': colonne, **parametri}}
+        ingresso = nome
+    return stadi
+
+
+_DECODIFICA = OrderedDict([
+    ('decodifica', {'parametri': {'path': None, 'resync': True, 'cache': True}}),
+    ('tempi', {'ingressi': ['decodifica'], 'parametri': {'flusso': 'bmp'}}),
+])
+_TAGLIO = {'threshold_start': 1.0, 'threshold_end': 0.5, 'margin': 3.0, 'centratura_hmax': True}
+# Volo ritagliato dalla quota grezza prima dei filtri, con gli stessi parametri del taglio
+_RITAGLIO = ('ritaglio', {'ingressi': ['tempi'], 'parametri': {'colonna': 'altitude', 'tempo_iniziale': 1,
+                                                               'margine': 10.0, 'finestra_mediana': 0.5, **_TAGLIO}})
+
+CONFIGURAZIONI = {
+    # Altitudine, velocità e accelerazione insieme dal Kalman ad accelerazione costante
+    'accelerazione_costante': OrderedDict([
+        *_DECODIFICA.items(),
+        _RITAGLIO,
+        ('spike', {'ingressi': ['ritaglio'],
+                   'parametri': {'colonne': ['altitude'], 'finestra': 10, 'soglia': 5, 'sequenziale': True}}),
+        ('offset', {'ingressi': ['spike'], 'parametri': {'colonne': ['altitude'], 'tempo_iniziale': 1}}),
+        ('stima', {'funzione': 'accelerazione_costante', 'ingressi': ['offset'],
+                   'parametri': {'colonna': 'altitude', 'q': 100.0, 'r': 0.0625, 'smoother': True}}),
+        ('taglio', {'ingressi': ['stima', 'decodifica'], 'parametri': dict(_TAGLIO)}),
+    ]),
+    # Altitudine e velocità a 1 kHz dalla fusione di accelerometro e BMP (senza ritaglio:
+    # l'integrazione dell'accelerometro vuole il log continuo)
+    'fusione': OrderedDict([
+        *_DECODIFICA.items(),
+        ('stima', {'funzione': 'fusione', 'ingressi': ['tempi', 'decodifica'],
+                   'parametri': {'colonna_accel': 'accel_z_g', 'tempo_iniziale': 1, 'q_bias': 0.01,
+                                 'q_accelerazione': 0.5, 'r': 0.0625, 'spike_finestra': 10, 'spike_soglia': 5,
+                                 'spike_sequenziale': True, 'smoother': True, 'assetto': False}}),
+        ('taglio', {'ingressi': ['stima', 'decodifica'], 'parametri': dict(_TAGLIO)}),
+    ]),
+    # Catena di process_rocket_data: altitudine e velocità (derivata dall'altitudine
+    # filtrata e rifiltrata con la stessa catena)
+    'catena': OrderedDict([
+        *_DECODIFICA.items(),
+        _RITAGLIO,
+        *_catena_filtri('', 'ritaglio', ['altitude'], 0.05, 0.5).items(),
+        ('velocita', {'funzione': 'derivata', 'ingressi': ['kalman'],
+                      'parametri': {'colonna': 'altitude_kalman', 'nome': 'velocity'}}),
+        *_catena_filtri('velocita_', 'velocita', ['velocity'], 0.05, 0.5).items(),
+        ('taglio', {'ingressi': ['velocita_kalman', 'decodifica'], 'parametri': dict(_TAGLIO)}),
+    ]),
+}
+# Configurazione di plotter.py: la catena, con cui sono state calcolate le metriche dei voli
+# già analizzati (l'accelerazione costante dà V+ diverse di qualche decimo di m/s)
+CONFIGURAZIONE_PREDEFINITA = CONFIGURAZIONI['catena']
+
+
+def carica_configurazione(path=None):
+    """
+    Configurazione da un file JSON (stessa struttura di CONFIGURAZIONE_PREDEFINITA), per nome
+    da CONFIGURAZIONI o quella predefinita.
+    """
+    if path is None:
+        return copy.deepcopy(CONFIGURAZIONE_PREDEFINITA)
+    if path in CONFIGURAZIONI:
+        return copy.deepcopy(CONFIGURAZIONI[path])
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+# ---------------------------
+# CLASSE Pipeline
+# ---------------------------
+class Pipeline:
+    """
+    Catena di elaborazione dichiarativa: ogni stadio ha un nome, una funzione di STADI
+    (default: il nome stesso), gli stadi in ingresso e parametri espliciti.
+
+    L'uscita di ogni stadio è in cache con chiave l'hash di funzione (nome e codice), sorgente
+    dei MODULI_STADI, parametri e chiavi degli ingressi (per 'decodifica' anche dimensione e mtime del log):
+    cambiando un parametro si riesegue solo quello stadio e i successivi. La cache è in memoria (ultime `max_voci`
+    uscite) e, con `cartella_cache`, anche su disco, dove le voci usate meno di recente
+    escono quando si superano `max_bytes` (la decodifica resta solo in memoria: su disco
+    c'è già DecodeCache). In `tempi` si accumulano i secondi di ogni stadio dal primo
+    esegui() dopo azzera_tempi() (o dalla creazione) e in `da_cache` gli stadi letti dalla cache.
+    Le uscite in cache sono condivise: non vanno modificate sul posto.
+    """
+
+    def __init__(self, configurazione=None, cartella_cache=None, max_voci=64, max_bytes=2 * 2 ** 30):
+        """
+        :param configurazione: Dizionario nome -> {'funzione', 'ingressi', 'parametri'}
+                               (default: CONFIGURAZIONE_PREDEFINITA)
+        :param cartella_cache: Cartella della cache su disco (None = solo in memoria)
+        :param max_voci: Uscite tenute in memoria
+        :param max_bytes: Dimensione massima della cache su disco [byte]
+        """
+        configurazione = carica_configurazione() if configurazione is None else configurazione
+        self.stadi = OrderedDict()
+        for nome, stadio in configurazione.items():
+            funzione = stadio.get('funzione', nome)
+            if funzione not in STADI:
+                raise ValueError(f"Stadio '{nome}': funzione sconosciuta '{funzione}'")
+            ingressi = list(stadio.get('ingressi', []))
+            mancanti = [i for i in ingressi if i not in self.stadi]
+            if mancanti:
+                raise ValueError(f"Stadio '{nome}': ingressi non definiti prima: {', '.join(mancanti)}")
+            self.stadi[nome] = {'funzione': funzione, 'ingressi': ingressi,
+                                'parametri': dict(stadio.get('parametri', {}))}
+        self.cartella_cache = cartella_cache
+        if cartella_cache:
+            os.makedirs(cartella_cache, exist_ok=True)
+        self.max_voci = max_voci
+        self.max_bytes = max_bytes
+        self._memoria = OrderedDict()
+        self.tempi = {}
+        self.da_cache = set()
+
+    @classmethod
+    def da_file(cls, path, **kwargs):
+        return cls(carica_configurazione(path), **kwargs)
+
+    def imposta(self, nome, **parametri):
+        """Cambia i parametri di uno stadio (es. pipeline.imposta('stima', q=10))."""
+        self.stadi[nome]['parametri'].update(parametri)
+
+    # ---------------------------
+    # CHIAVI
+    # ---------------------------
+    def chiave(self, nome, _chiavi=None):
+        """Hash di funzione (nome e codice), parametri e chiavi degli ingressi dello stadio `nome`."""
+        _chiavi = {} if _chiavi is None else _chiavi
+        if nome in _chiavi:
+            return _chiavi[nome]
+        stadio = self.stadi[nome]
+        parametri = dict(stadio['parametri'])
+        if stadio['funzione'] == 'decodifica' and parametri.get('path'):
+            stat = os.stat(parametri['path'])
+            parametri['_log'] = [os.path.abspath(parametri['path']), stat.st_size, stat.st_mtime_ns, DECODER_VERSION]
+        descrizione = json.dumps([PIPELINE_VERSION, impronta_moduli(), stadio['funzione'],
+                                  impronta_codice(STADI[stadio['funzione']]), parametri, [self.chiave(i, _chiavi) for i in stadio['ingressi']]],
+                                 sort_keys=True, default=str)
+        _chiavi[nome] = hashlib.blake2b(descrizione.encode('utf-8'), digest_size=16).hexdigest()
+        return _chiavi[nome]
+
+    # ---------------------------
+    # CACHE
+    # ---------------------------
+    def _leggi_cache(self, chiave):
+        if chiave in self._memoria:
+            self._memoria.move_to_end(chiave)
+            return True, self._memoria[chiave]
+        if self.cartella_cache:
+            path = os.path.join(self.cartella_cache, chiave + '.pkl')
+            try:
+                with open(path, 'rb') as f:
+                    uscita = pickle.load(f)
+            except OSError:
+                return False, None
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, TypeError, ValueError):
+                # File troncato o scritto da una versione del codice con classi diverse
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                return False, None
+            os.utime(path)  # ultimo accesso, per la LRU
+            self._memorizza(chiave, uscita)
+            return True, uscita
+        return False, None
+
+    def _memorizza(self, chiave, uscita):
+        self._memoria[chiave] = uscita
+        self._memoria.move_to_end(chiave)
+        while len(self._memoria) > self.max_voci:
+            self._memoria.popitem(last=False)
+
+    def _scrivi_cache(self, chiave, uscita, su_disco=True):
+        self._memorizza(chiave, uscita)
+        if self.cartella_cache and su_disco:
+            fd, tmp = tempfile.mkstemp(dir=self.cartella_cache, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(uscita, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, os.path.join(self.cartella_cache, chiave + '.pkl'))
+            self.evict()
+
+    def voci_disco(self):
+        """Elenco (ultimo accesso, byte, file) delle uscite in cache su disco."""
+        elenco = []
+        for nome in os.listdir(self.cartella_cache):
+            path = os.path.join(self.cartella_cache, nome)
+            if nome.endswith('.pkl'):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # eliminato da un altro processo
+                elenco.append((stat.st_mtime, stat.st_size, path))
+        return elenco
+
+    def evict(self):
+        """Elimina le uscite su disco usate meno di recente finché la cache sta sotto `max_bytes`."""
+        elenco = sorted(self.voci_disco())
+        totale = sum(v[1] for v in elenco)
+        for _, dimensione, path in elenco:
+            if totale <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            totale -= dimensione
+
+    def svuota_cache(self):
+        self._memoria.clear()
+        if self.cartella_cache:
+            for nome in os.listdir(self.cartella_cache):
+                if nome.endswith('.pkl'):
+                    os.remove(os.path.join(self.cartella_cache, nome))
+
+    # ---------------------------
+    # ESECUZIONE
+    # ---------------------------
+    def esegui(self, nome=None):
+        """
+        Restituisce l'uscita dello stadio `nome` (default: l'ultimo), eseguendo solo gli
+        stadi necessari la cui uscita non è già in cache. I tempi si sommano a quelli delle
+        chiamate precedenti: uno stadio già in `tempi` non viene registrato di nuovo.
+        """
+        nome = nome or next(reversed(self.stadi))
+        return self._esegui(nome, {}, {})
+
+    def azzera_tempi(self):
+        """Dimentica `tempi` e `da_cache` (es. prima di rieseguire con parametri nuovi)."""
+        self.tempi = {}
+        self.da_cache = set()
+
+    def _registra(self, nome, secondi, da_cache=False):
+        if nome not in self.tempi:
+            self.tempi[nome] = secondi
+            if da_cache:
+                self.da_cache.add(nome)
+
+    def _esegui(self, nome, chiavi, uscite):
+        # `uscite`: stadi già ottenuti in questa esecuzione (uno stadio può alimentarne più d'uno)
+        if nome in uscite:
+            return uscite[nome]
+        chiave = self.chiave(nome, chiavi)
+        t = time.perf_counter()
+        trovato, uscita = self._leggi_cache(chiave)
+        if trovato:
+            self._registra(nome, time.perf_counter() - t, da_cache=True)
+        else:
+            stadio = self.stadi[nome]
+            ingressi = [self._esegui(i, chiavi, uscite) for i in stadio['ingressi']]
+            t = time.perf_counter()
+            uscita = STADI[stadio['funzione']](*ingressi, **stadio['parametri'])
+            self._registra(nome, time.perf_counter() - t)
+            self._scrivi_cache(chiave, uscita, su_disco=stadio['funzione'] != 'decodifica')
+        uscite[nome] = uscita
+        return uscita
+
+    def riepilogo(self):
+        """Stampa i tempi per stadio accumulati dall'ultimo azzera_tempi()."""
+        for nome, secondi in self.tempi.items():
+            print(f"{nome:<24} {secondi * 1e3:9.1f} ms{'   (cache)' if nome in self.da_cache else ''}")
+        print(f"{'totale':<24} {sum(self.tempi.values()) * 1e3:9.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Esegue la pipeline di elaborazione su un log')
+    parser.add_argument('log', help='Percorso del log')
+    parser.add_argument('--config', default=None,
+                        help=f"Configurazione JSON o uno fra {', '.join(CONFIGURAZIONI)} (default: quella di plotter.py)")
+    parser.add_argument('--stadio', default=None, help="Stadio da calcolare (default: l'ultimo)")
+    parser.add_argument('--cache', default=os.path.join(cartella_cache_predefinita(), 'pipeline'),
+                        help='Cartella della cache degli stadi')
+    parser.add_argument('--salva-config', default=None, help='Scrive la configurazione usata in un file JSON')
+    args = parser.parse_args()
+
+    pipeline = Pipeline(carica_configurazione(args.config), cartella_cache=args.cache)
+    pipeline.imposta('decodifica', path=args.log)
+    if args.salva_config:
+        with open(args.salva_config, 'w', encoding='utf-8') as f:
+            json.dump(pipeline.stadi, f, indent=2)
+    pipeline.esegui(args.stadio)
+    pipeline.riepilogo()
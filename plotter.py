@@ -1,14 +1,20 @@
 import os
+import sys
 import glob
 import webbrowser
-import numpy as np
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
-from fontTools.misc.cython import returns
-from plotly.subplots import make_subplots
-from Filter import IMUFilter, process_rocket_data
-from decoder import Decoder
-from file_saver import file_saver
+from decode_cache import cartella_cache_predefinita
+from decoder import valori_fisici
+from flight import get_flight_interval_strict
+from pipeline import Pipeline, carica_configurazione
+
+# Modalità headless (--headless o RDI_HEADLESS=1): taglio automatico e metriche a terminale,
+# senza anteprime, grafici né prompt; plotly e matplotlib non vengono mai importati
+HEADLESS = '--headless' in sys.argv or os.environ.get('RDI_HEADLESS') == '1'
+# Configurazione della pipeline (--pipeline FILE.json o un nome di pipeline.CONFIGURAZIONI);
+# default: pipeline.CONFIGURAZIONE_PREDEFINITA
+CONFIG_PIPELINE = sys.argv[sys.argv.index('--pipeline') + 1] if '--pipeline' in sys.argv[:-1] else None
+# Numero del lancio (--rp N o RDI_RP=N); senza, chiesto a terminale (obbligatorio in headless)
+RP_ARGOMENTO = sys.argv[sys.argv.index('--rp') + 1] if '--rp' in sys.argv[:-1] else os.environ.get('RDI_RP')
 
 
 # ---------------------------
@@ -28,7 +34,12 @@ def find_log_file(rp_code_value, search_folder):
 # ---------------------------
 # RICERCA DEL FILE
 # ---------------------------
-RP = input("RP?")
+if RP_ARGOMENTO is not None:
+    RP = RP_ARGOMENTO
+elif HEADLESS:
+    sys.exit("Modalità headless: indicare il lancio con --rp N o RDI_RP=N")
+else:
+    RP = input("RP?")
 RP_CODE_VALUE = "RP" + RP
 DATA_FOLDER_PATH = r"C:\Users\fanin\Desktop\Dati WR\LanciRaw\3bar"
 
@@ -36,14 +47,23 @@ selected_file_path = find_log_file(RP_CODE_VALUE, DATA_FOLDER_PATH)
 print(f"File selezionato: {selected_file_path}")
 
 # ---------------------------
-# DECODIFICA
+# DECODIFICA E FILTRI
 # ---------------------------
-decoder_instance = Decoder(selected_file_path)
-RP_id, folder_path, df_imu, df_bmp = decoder_instance.decode()
+# Altitudine e velocità dalla pipeline (default: la catena di process_rocket_data; il Kalman ad
+# accelerazione costante è --pipeline accelerazione_costante, la fusione con l'accelerometro
+# a 1 kHz --pipeline fusione):
+# gli stadi già calcolati con gli stessi parametri sono riletti dalla cache
+pipeline = Pipeline(carica_configurazione(CONFIG_PIPELINE),
+                    cartella_cache=os.path.join(cartella_cache_predefinita(), 'pipeline'))
+pipeline.imposta('decodifica', path=selected_file_path)
+decodifica = pipeline.esegui('decodifica')
+RP_id, folder_path, df_imu = decodifica['RP_id'], decodifica['folder_path'], decodifica['imu']
+# Lo stadio con altitudine e velocità filtrate è quello che alimenta il taglio del volo
+df_bmp = pipeline.esegui(pipeline.stadi['taglio']['ingressi'][0])
+# Log BMP intero, prima del ritaglio grezzo dei filtri: lo mostra la preview del taglio manuale
+df_bmp_intero = pipeline.esegui('tempi') if 'tempi' in pipeline.stadi else df_bmp
+pipeline.riepilogo()
 
-# ---------------------------
-# FILTRI
-# ---------------------------
 '''
 imu_filter = IMUFilter(
     sampling_rate=100, cutoff_frequency=5,
@@ -52,98 +72,55 @@ imu_filter = IMUFilter(
 )
 df_imu = imu_filter.process(df_imu)'''
 
-df_bmp = process_rocket_data(
-    df_bmp,
-    column='altitude', tempo_iniziale=1,
-    cutoff_freq=1.5, savgol_window_sec=0.6,
-    kalman_q=0.05, kalman_r=0.5)
-
-#Genera colonna velocità
-df_bmp['velocity'] = np.gradient(
-        df_bmp['altitude_kalman'],df_bmp['timestamp_sec'])
-
-df_bmp = process_rocket_data(
-    df_bmp,
-    column='velocity', tempo_iniziale=1,
-    cutoff_freq=1.5, savgol_window_sec=0.6,
-    kalman_q=0.05, kalman_r=0.5)
-
 # ---------------------------
 # TAGLIO AUTOMATICO o MANUALE INTERVALLO VOLO
 # ---------------------------
-def get_flight_interval_strict(df, threshold_start=1.0, threshold_end=0.5, margin=3.0, centratura_hmax=True):
-    """
-    Determina l'intervallo del volo e aggiunge un margine prima e dopo.
-    Se centratura_hmax=True, taglia a sinistra in modo che Hmax sia centrato.
-    """
-    alt = df['altitude_kalman']
-    time = df['timestamp_sec']
-
-    # Trova t_start (primo punto sopra threshold_start)
-    above_start = alt > threshold_start
-    if not above_start.any():
-        return df, time.iloc[0], time.iloc[-1]
-
-    t_start_flight = time.loc[above_start].iloc[0]
-
-    # Trova il massimo di altitudine
-    idx_max = alt.idxmax()
-    t_hmax = time.loc[idx_max]
-
-    # Trova t_end (primo punto dopo il max in cui scende sotto threshold_end)
-    below_end = (alt < threshold_end) & (time > t_hmax)
-    if not below_end.any():
-        t_end_flight = time.iloc[-1]
-    else:
-        t_end_flight = time.loc[below_end].iloc[0]
-
-    # Applica margini
-    t_end = min(time.iloc[-1], t_end_flight + margin)
-
-    if not centratura_hmax:
-        t_start = max(time.iloc[0], t_start_flight - margin)
-    else:
-        # Durata dopo Hmax
-        durata_dopo = t_end - t_hmax
-        # Nuovo t_start centrato
-        t_start = max(time.iloc[0], t_hmax - durata_dopo)
-
-    # Taglia il dataframe
-    df_cut = df[(time >= t_start) & (time <= t_end)].copy()
-
-    # Riporta il tempo a partire da zero
-    df_cut['timestamp_sec'] = df_cut['timestamp_sec'] - t_start
-
-    return df_cut, t_start, t_end
-def preview_untrimmed_data(df_bmp_local):
+def preview_untrimmed_data(df_bmp_local, df_bmp_intero):
     """
     Mostra altitudine e velocità prima del taglio per aiutare nella scelta manuale.
+    L'altitudine grezza è quella del log intero; le tracce filtrate esistono solo nella
+    finestra del ritaglio grezzo (attrs['ritaglio'], evidenziata) e nel pad iniziale,
+    e restano interrotte fra i due invece di unirli con un segmento.
     """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     fig = make_subplots(
         rows=2, cols=1,
         subplot_titles=("Altitudine", "Velocità")
     )
+    # Tracce filtrate sui tempi del log intero: NaN (linea interrotta) fuori dal ritaglio
+    filtrati = df_bmp_intero[['timestamp_sec']].merge(
+        df_bmp_local[['timestamp_sec', 'altitude_kalman', 'velocity', 'velocity_kalman']],
+        on='timestamp_sec', how='left')
 
     fig.add_trace(go.Scatter(
-        x=df_bmp_local['timestamp_sec'], y=df_bmp_local['altitude'],
+        x=df_bmp_intero['timestamp_sec'], y=df_bmp_intero['altitude'],
         name='Altitudine Grezza', line=dict(color='gray')
     ), row=1, col=1)
 
     fig.add_trace(go.Scatter(
-        x=df_bmp_local['timestamp_sec'], y=df_bmp_local['altitude_kalman'],
+        x=filtrati['timestamp_sec'], y=filtrati['altitude_kalman'],
         name='Altitudine Kalman', line=dict(color='blue')
     ), row=1, col=1)
 
     fig.add_trace(go.Scatter(
-        x=df_bmp_local['timestamp_sec'], y=df_bmp_local['velocity'],
+        x=filtrati['timestamp_sec'], y=filtrati['velocity'],
         name='Velocità Grezza', line=dict(color='orange')
     ), row=2, col=1)
 
     fig.add_trace(go.Scatter(
-        x=df_bmp_local['timestamp_sec'], y=df_bmp_local['velocity_kalman'],
+        x=filtrati['timestamp_sec'], y=filtrati['velocity_kalman'],
         name='Velocità Kalman', line=dict(color='red')
     ), row=2, col=1)
 
+    ritaglio = df_bmp_local.attrs.get('ritaglio')
+    if ritaglio is not None:
+        fig.add_vrect(x0=ritaglio[0], x1=ritaglio[1], row='all', col=1, fillcolor='green', opacity=0.1,
+                      line_width=0, layer='below')
+        fig.add_annotation(x=ritaglio[0], y=1, yref='paper', xanchor='left', showarrow=False,
+                           text=f"Ritaglio filtri {ritaglio[0]:.1f}-{ritaglio[1]:.1f} s")
+
     fig.update_layout(height=800, title_text="Preview Altitudine e Velocità (non tagliati)")
     fig.update_xaxes(title_text="Tempo (s)", row=2, col=1)
     fig.update_yaxes(title_text="Altitudine (m)", row=1, col=1)
@@ -153,11 +130,11 @@ def preview_untrimmed_data(df_bmp_local):
     fig.write_html(file_path)
     webbrowser.open('file://' + os.path.realpath(file_path))
 
-manual_cut = input("Vuoi tagliare manualmente il segmento di volo? (s/n): ").strip().lower()
+manual_cut = "n" if HEADLESS else input("Vuoi tagliare manualmente il segmento di volo? (s/n): ").strip().lower()
 
 if manual_cut == "s":
-    # Mostra preview per taglio manuale
-    preview_untrimmed_data(df_bmp)
+    # Mostra preview per taglio manuale: log intero, con evidenziata la finestra filtrata
+    preview_untrimmed_data(df_bmp, df_bmp_intero)
     flag = input("Vuoi effettivamente tagliare e salvare (s/n): ").strip().lower()
     if flag == "n":
         exit(1)
@@ -221,14 +198,13 @@ delta_max, altitude_max_val, vmax_val, t_vmax_val, vmin_val, t_vmin_val = comput
 #saver_instance = file_saver(RP_id, folder_path, df_imu, df_bmp, 0, 0, 0)
 #saver_instance.save_data()
 
-import matplotlib.pyplot as plt
-import os
-
 def save_altitude_velocity_plot(df_bmp, altitude_max_val, vmax_val, t_vmax_val, vmin_val, t_vmin_val, pressure, ratio):
     """
     Salva un grafico PNG con altitudine e velocità (2 pannelli),
     usando i valori massimi/minimi già calcolati.
     """
+    import matplotlib.pyplot as plt
+
     t = df_bmp['timestamp_sec']
     h = df_bmp['altitude_kalman']
     v = df_bmp['velocity_kalman']
@@ -332,6 +308,9 @@ def save_altitude_velocity_plot(df_bmp, altitude_max_val, vmax_val, t_vmax_val,
 # PLOTTING
 # ---------------------------
 def plot_altitude_and_velocity(df_bmp_local, altitude_max_val, vmax_val, t_vmax_val, vmin_val, t_vmin_val):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     fig_plot = make_subplots(
         rows=3, cols=1,
         subplot_titles=("Altitudine", "Velocità", "Accelerometro (filtrato)")
@@ -400,10 +379,12 @@ def plot_altitude_and_velocity(df_bmp_local, altitude_max_val, vmax_val, t_vmax_
     return fig_plot
 
 def add_accelerometer_traces(fig_plot, df_imu_local):
+    import plotly.graph_objects as go
+
     axes_colors = {'accel_x_g': 'yellow', 'accel_y_g': 'green', 'accel_z_g': 'red'}
     for axis, color in axes_colors.items():
         fig_plot.add_trace(go.Scatter(
-            x=df_imu_local['timestamp_sec'], y=df_imu_local[axis],
+            x=df_imu_local['timestamp_sec'], y=valori_fisici(df_imu_local, axis),
             name=f'{axis} (filt)', line=dict(color=color)
         ), row=3, col=1)
     return fig_plot
@@ -416,6 +397,9 @@ def finalize_plot(fig_plot):
     fig_plot.update_xaxes(title_text="Tempo (s)", row=3, col=1)
     return fig_plot
 
+if HEADLESS:
+    sys.exit(0)
+
 plot_figure = plot_altitude_and_velocity(df_bmp, altitude_max_val, vmax_val, t_vmax_val, vmin_val, t_vmin_val)
 plot_figure = add_accelerometer_traces(plot_figure, df_imu)
 plot_figure = finalize_plot(plot_figure)
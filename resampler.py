@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+from decoder import COLONNE_FISICHE, valori_fisici
+
+# lineare: interpolazione fra i due campioni vicini; vicino: campione più vicino;
+# asof: ultimo campione non successivo (come merge_asof); media: media dei campioni nella
+# cella di ±1/(2 fs) attorno al punto (decimazione, es. IMU 1 kHz -> 100 Hz)
+METODI = ('lineare', 'vicino', 'asof', 'media')
+
+
+# ---------------------------
+# GRIGLIA E RICAMPIONAMENTO
+# ---------------------------
+def griglia_uniforme(t_inizio, t_fine, fs):
+    """
+    Istanti k / fs (k intero) compresi in [t_inizio, t_fine]: due griglie con la stessa
+    `fs` hanno gli stessi punti nel tratto comune.
+    """
+    primo = np.ceil(t_inizio * fs - 1e-9)
+    ultimo = np.floor(t_fine * fs + 1e-9)
+    return np.arange(primo, ultimo + 1) / fs + 0.0  # niente -0.0
+
+
+def tempi_crescenti(tempi):
+    """Maschera dei campioni con tempo strettamente maggiore di tutti i precedenti."""
+    tempi = np.asarray(tempi, dtype=float)
+    maschera = np.ones(len(tempi), dtype=bool)
+    maschera[1:] = tempi[1:] > np.maximum.accumulate(tempi)[:-1]
+    return maschera
+
+
+def _interpola(tempi, valori, griglia):
+    """Interpolazione lineare colonna per colonna (np.interp); agli estremi il valore del bordo."""
+    uscita = np.empty((len(griglia), valori.shape[1]))
+    for j in range(valori.shape[1]):
+        uscita[:, j] = np.interp(griglia, tempi, valori[:, j])
+    return uscita
+
+
+def _ricampiona_valori(tempi, valori, griglia, metodo, fs):
+    if metodo == 'lineare':
+        return _interpola(tempi, valori, griglia)
+    dopo = np.searchsorted(tempi, griglia, side='right')
+    if metodo == 'asof':
+        return valori[np.maximum(dopo - 1, 0)]
+    if metodo == 'vicino':
+        prima = np.maximum(dopo - 1, 0)
+        dopo = np.minimum(dopo, len(tempi) - 1)
+        return valori[np.where(griglia - tempi[prima] <= tempi[dopo] - griglia, prima, dopo)]
+    if metodo == 'media':
+        somme = np.concatenate([np.zeros((1, valori.shape[1])), np.cumsum(valori, axis=0)])
+        a = np.searchsorted(tempi, griglia - 0.5 / fs, side='left')
+        b = np.searchsorted(tempi, griglia + 0.5 / fs, side='left')
+        conteggi = (b - a)[:, np.newaxis]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            medie = (somme[b] - somme[a]) / conteggi
+        # Celle senza campioni (buchi nel log): interpolazione lineare
+        vuote = conteggi[:, 0] == 0
+        if vuote.any():
+            medie[vuote] = _interpola(tempi, valori, griglia[vuote])
+        return medie
+    raise ValueError(f"Metodo di ricampionamento sconosciuto: {metodo!r} (ammessi: {', '.join(METODI)})")
+
+
+def ricampiona(tempi, valori, fs, metodo='lineare', t_inizio=None, t_fine=None):
+    """
+    Ricampiona un flusso su una griglia uniforme a `fs` Hz.
+
+    :param tempi: Tempi [s] dei campioni; quelli non strettamente crescenti sono scartati
+    :param valori: Array (n,) o (n, colonne)
+    :param fs: Frequenza della griglia [Hz]
+    :param metodo: Uno di METODI
+    :param t_inizio: Inizio della griglia [s] (default: primo campione)
+    :param t_fine: Fine della griglia [s] (default: ultimo campione)
+    :return: (griglia, valori ricampionati (punti, colonne), report dell'errore)
+    """
+    tempi = np.asarray(tempi, dtype=float)
+    valori = np.asarray(valori, dtype=float)
+    valori = valori.reshape(len(valori), -1)
+    crescenti = tempi_crescenti(tempi)
+    if not crescenti.all():
+        tempi, valori = tempi[crescenti], valori[crescenti]
+    if not len(tempi):
+        raise ValueError("Nessun campione da ricampionare")
+
+    t_inizio = tempi[0] if t_inizio is None else t_inizio
+    t_fine = tempi[-1] if t_fine is None else t_fine
+    griglia = griglia_uniforme(t_inizio, t_fine, fs)
+    ricampionati = _ricampiona_valori(tempi, valori, griglia, metodo, fs)
+    return griglia, ricampionati, _report_errore(tempi, valori, griglia, ricampionati, int(np.count_nonzero(~crescenti)))
+
+
+def _report_errore(tempi, valori, griglia, ricampionati, scartati):
+    """
+    Errore del ricampionamento: irregolarità dei tempi originali, distanza dei punti della
+    griglia dal campione più vicino e scarto fra i campioni originali e la griglia
+    reinterpolata linearmente ai loro tempi (andata e ritorno).
+    """
+    report = {'campioni': len(tempi), 'scartati': scartati, 'punti': len(griglia)}
+    deltas = np.diff(tempi)
+    if len(deltas):
+        periodo = np.median(deltas)
+        report.update(fs_sorgente=1 / periodo, jitter_dt=float(deltas.std()), buco_massimo=float(deltas.max()))
+    if len(griglia):
+        prima = np.clip(np.searchsorted(tempi, griglia, side='right') - 1, 0, len(tempi) - 1)
+        dopo = np.minimum(prima + 1, len(tempi) - 1)
+        distanza = np.minimum(np.abs(griglia - tempi[prima]), np.abs(tempi[dopo] - griglia))
+        report['distanza_massima'] = float(distanza.max())
+        if len(deltas):
+            report['punti_in_buco'] = int(np.count_nonzero(distanza > periodo))
+    if len(griglia) > 1:
+        a = np.searchsorted(tempi, griglia[0], side='left')
+        b = np.searchsorted(tempi, griglia[-1], side='right')
+        report['errore_rms'] = np.full(valori.shape[1], np.nan)
+        report['errore_max'] = np.full(valori.shape[1], np.nan)
+        if b > a:
+            for j in range(valori.shape[1]):
+                scarto = np.interp(tempi[a:b], griglia, ricampionati[:, j]) - valori[a:b, j]
+                report['errore_rms'][j] = np.sqrt(np.dot(scarto, scarto) / len(scarto))
+                report['errore_max'][j] = np.abs(scarto).max()
+    return report
+
+
+# ---------------------------
+# ALLINEAMENTO IMU / BMP
+# ---------------------------
+def _colonne_imu(df_imu):
+    colonne = [c for c, (grezza, _) in COLONNE_FISICHE.items() if c in df_imu.columns or grezza in df_imu.columns]
+    return colonne + [c for c in df_imu.columns if c.endswith('_filtered')]
+
+
+def _valori_imu(df_imu, colonna):
+    if colonna in COLONNE_FISICHE:
+        return valori_fisici(df_imu, colonna).astype(float)
+    return df_imu[colonna].to_numpy(dtype=float)
+
+
+def allinea(df_imu, df_bmp, fs=100, colonne_imu=None, colonne_bmp=None,
+            metodo_imu='media', metodo_bmp='lineare', t_inizio=None, t_fine=None, offset_bmp=None):
+    """
+    Porta IMU e BMP sulla stessa griglia uniforme a `fs` Hz, nel tratto di tempo comune.
+    Decoder.decode() fa partire il tempo BMP dal primo campione BMP, mentre quello IMU resta
+    il micros() del logger: i tempi IMU sono riportati sulla base BMP sottraendo `offset_bmp`,
+    e la griglia (come t_inizio e t_fine) è nella base dei tempi BMP.
+
+    :param df_imu: DataFrame IMU con 'timestamp_sec' (grezzo o in unità fisiche)
+    :param df_bmp: DataFrame BMP con 'timestamp_sec'
+    :param fs: Frequenza della griglia comune [Hz]
+    :param colonne_imu: Colonne IMU (default: accel/gyro in unità fisiche e colonne *_filtered)
+    :param colonne_bmp: Colonne BMP (default: tutte tranne 'timestamp_sec')
+    :param metodo_imu: Metodo per l'IMU (default 'media': decimazione senza aliasing del rumore)
+    :param metodo_bmp: Metodo per il BMP ('vicino'/'asof' per unire senza interpolare)
+    :param offset_bmp: Tempo micros() [s] del primo campione BMP (default: attrs['offset_tempo']
+                       di df_bmp, impostato da Decoder; 0 se manca)
+    :return: (DataFrame con 'timestamp_sec' e le colonne dei due flussi, {'imu': report, 'bmp': report})
+    """
+    if offset_bmp is None:
+        offset_bmp = df_bmp.attrs.get('offset_tempo', 0.0)
+    colonne_imu = _colonne_imu(df_imu) if colonne_imu is None else list(colonne_imu)
+    colonne_bmp = [c for c in df_bmp.columns if c != 'timestamp_sec'] if colonne_bmp is None else list(colonne_bmp)
+    flussi = {
+        'imu': (df_imu['timestamp_sec'].to_numpy(dtype=float) - offset_bmp,
+                np.column_stack([_valori_imu(df_imu, c) for c in colonne_imu]), colonne_imu, metodo_imu),
+        'bmp': (df_bmp['timestamp_sec'].to_numpy(dtype=float),
+                np.column_stack([df_bmp[c].to_numpy(dtype=float) for c in colonne_bmp]), colonne_bmp, metodo_bmp),
+    }
+    comune_inizio = max(tempi[0] for tempi, *_ in flussi.values())
+    comune_fine = min(tempi[-1] for tempi, *_ in flussi.values())
+    t_inizio = comune_inizio if t_inizio is None else max(t_inizio, comune_inizio)
+    t_fine = comune_fine if t_fine is None else min(t_fine, comune_fine)
+    if t_fine < t_inizio:
+        raise ValueError("IMU e BMP non hanno un tratto di tempo in comune")
+
+    colonne = {}
+    report = {}
+    for nome, (tempi, valori, nomi, metodo) in flussi.items():
+        griglia, ricampionati, report[nome] = ricampiona(tempi, valori, fs, metodo, t_inizio, t_fine)
+        colonne['timestamp_sec'] = griglia
+        for i, colonna in enumerate(nomi):
+            colonne[colonna] = ricampionati[:, i]
+    return pd.DataFrame(colonne), report
+
+
+def stampa_report(report):
+    """Riassunto a terminale dei report di allinea()."""
+    for nome, r in report.items():
+        errore = ', '.join(f"{e:.3g}" for e in r.get('errore_rms', []))
+        print(f"{nome.upper()}: {r['campioni']} campioni -> {r['punti']} punti "
+              f"(fs originale {r.get('fs_sorgente', float('nan')):.2f} Hz, jitter {r.get('jitter_dt', 0) * 1e3:.3f} ms, "
+              f"buco massimo {r.get('buco_massimo', 0):.3f} s, {r.get('punti_in_buco', 0)} punti in buchi, "
+              f"{r['scartati']} tempi scartati); errore RMS: {errore}")
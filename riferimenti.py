@@ -0,0 +1,231 @@
+import struct
+
+import numpy as np
+import pandas as pd
+from scipy.signal import butter, filtfilt
+
+from attitude import prodotto
+from decoder import BMP_DTYPE, HEADER, IMU_DTYPE, Decoder
+
+# Implementazioni originali o campione per campione, tenute come riferimento per i test
+# (tests/) e per gli speedup di benchmark.py
+
+
+# ---------------------------
+# DECODIFICA
+# ---------------------------
+CAMPI_IMU_ORIGINALI = ('accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z', 'mag_x', 'mag_y', 'mag_z',
+                       'temp', 'timestamp')
+TIPI_IMU = {nome: IMU_DTYPE[nome] for nome in IMU_DTYPE.names}
+TIPI_BMP = {nome: BMP_DTYPE[nome] for nome in BMP_DTYPE.names}
+
+
+def decode_struct(path, blocco=None):
+    """
+    Lettura di riferimento pacchetto per pacchetto (f.read + struct.unpack) con conversione
+    dei record in DataFrame, come il decoder originale. Restituisce (df_imu, df_bmp) grezzi.
+
+    :param blocco: se indicato, i record vengono convertiti in DataFrame (con i tipi del pacchetto)
+                   ogni `blocco` pacchetti invece che alla fine: il costo per pacchetto resta lo stesso,
+                   ma la memoria non cresce con le tuple Python (più di 4 GB per un log da 300 MB)
+    """
+    imu_records, bmp_records = [], []
+    imu_blocchi, bmp_blocchi = [], []
+    with open(path, 'rb') as f:
+        if f.read(4) != HEADER:
+            raise ValueError('Invalid log file header!')
+        while True:
+            marker = f.read(1)
+            if marker == b'I':
+                data = f.read(24)
+                if len(data) < 24:
+                    break
+                imu_records.append(struct.unpack('<10hI', data))
+                if len(imu_records) == blocco:
+                    imu_blocchi.append(pd.DataFrame(imu_records, columns=CAMPI_IMU_ORIGINALI).astype(TIPI_IMU))
+                    imu_records = []
+            elif marker == b'B':
+                data = f.read(8)
+                if len(data) < 8:
+                    break
+                bmp_records.append(struct.unpack('<fI', data))
+                if len(bmp_records) == blocco:
+                    bmp_blocchi.append(pd.DataFrame(bmp_records, columns=['altitude', 'timestamp']).astype(TIPI_BMP))
+                    bmp_records = []
+            else:
+                break
+    imu_blocchi.append(pd.DataFrame(imu_records, columns=CAMPI_IMU_ORIGINALI))
+    bmp_blocchi.append(pd.DataFrame(bmp_records, columns=['altitude', 'timestamp']))
+    if blocco:
+        imu_blocchi[-1], bmp_blocchi[-1] = imu_blocchi[-1].astype(TIPI_IMU), bmp_blocchi[-1].astype(TIPI_BMP)
+    return pd.concat(imu_blocchi, ignore_index=True), pd.concat(bmp_blocchi, ignore_index=True)
+
+
+def decode_originale(path, blocco=None):
+    """Decoder.decode originale completo: lettura struct, colonne fisiche, ordinamento e rimozione dei salti."""
+    df_imu, df_bmp = decode_struct(path, blocco)
+    for asse in 'xyz':
+        df_imu[f'accel_{asse}_g'] = df_imu[f'accel_{asse}'] * Decoder.ACCEL_SCALE
+    for asse in 'xyz':
+        df_imu[f'gyro_{asse}_dps'] = df_imu[f'gyro_{asse}'] * Decoder.GYRO_SCALE
+    df_imu['timestamp_sec'] = df_imu['timestamp'] / 1e6
+    df_imu.drop(columns=list(CAMPI_IMU_ORIGINALI[:-1]), inplace=True)
+
+    df_bmp['timestamp_sec'] = df_bmp['timestamp'] / 1e6
+    df_bmp = df_bmp.sort_values('timestamp')[['timestamp_sec', 'altitude']]
+    df_bmp['timestamp_sec'] = df_bmp['timestamp_sec'] - df_bmp['timestamp_sec'].iloc[0]
+    return df_imu, rimuovi_salti_loop(df_bmp)
+
+
+def rimuovi_salti_loop(df_bmp):
+    """Versione originale di decoder.rimuovi_salti (ciclo .iloc), tenuta come riferimento."""
+    diffs = df_bmp['timestamp_sec'].diff().fillna(0)
+    soglia_salto = 0.5
+    delta_corretto = 0.02
+
+    # Copia della colonna
+    corrected_ts = df_bmp['timestamp_sec'].copy()
+    correzione_cumulativa = 0.0
+
+    for i in range(1, len(corrected_ts)):
+        if diffs.iloc[i] > soglia_salto:
+            eccesso = diffs.iloc[i] - delta_corretto
+            correzione_cumulativa += eccesso
+        corrected_ts.iloc[i] -= correzione_cumulativa
+
+    df_bmp['timestamp_sec'] = corrected_ts
+    return df_bmp
+
+
+# ---------------------------
+# FILTRI
+# ---------------------------
+def kalman_filter_loop(imu_filter, data):
+    """Versione originale di IMUFilter.kalman_filter (ciclo per campione), tenuta come riferimento."""
+    x_est = 0
+    p_est = 1
+    filtered = []
+    for z in data:
+        p_est = p_est + imu_filter.kalman_q
+        k = p_est / (p_est + imu_filter.kalman_r)
+        x_est = x_est + k * (z - x_est)
+        p_est = (1 - k) * p_est
+        filtered.append(x_est)
+    return np.array(filtered)
+
+
+def filtro_kalman_loop(quota, q, r, x0, p0):
+    """Kalman scalare a passeggiata casuale campione per campione (il primo campione non predice)."""
+    x, p, filtrate = x0, p0, np.empty(len(quota))
+    for i, z in enumerate(quota):
+        p = p if i == 0 else p + q
+        k = p / (p + r)
+        x, p = x + k * (z - x), (1 - k) * p
+        filtrate[i] = x
+    return filtrate
+
+
+def smoother_kalman_loop(quota, q, r, x0, p0):
+    """Smoother RTS del Kalman scalare campione per campione: (medie, covarianze)."""
+    x, p = np.empty(len(quota)), np.empty(len(quota))
+    for i, z in enumerate(quota):
+        x_pred, p_pred = (x0, p0) if i == 0 else (x[i - 1], p[i - 1] + q)
+        k = p_pred / (p_pred + r)
+        x[i], p[i] = x_pred + k * (z - x_pred), (1 - k) * p_pred
+    xs, ps = x.copy(), p.copy()
+    for t in range(len(quota) - 2, -1, -1):
+        j = p[t] / (p[t] + q)
+        xs[t] = x[t] + j * (xs[t + 1] - x[t])
+        ps[t] = p[t] + j * j * (ps[t + 1] - p[t] - q)
+    return xs, ps
+
+
+def smoother_accelerazione_costante_loop(tempi, quota, q=100.0, r=0.0625, varianza_velocita=10.0,
+                                         varianza_accelerazione=100.0, smoother=True, controllo=None,
+                                         q_controllo=0.0):
+    """
+    Kalman ad accelerazione costante e smoother RTS con matrici 3x3, campione per campione:
+    (stati (n, 3), covarianze (n, 3, 3)). Stessi parametri di smoother_accelerazione_costante.
+    """
+    tempi = np.asarray(tempi, dtype=float)
+    quota = np.asarray(quota, dtype=float)
+    n = len(quota)
+    h = np.array([[1.0, 0.0, 0.0]])
+    x = np.array([quota[0], 0.0, 0.0]) if n else np.zeros(3)
+    p = np.diag([r, varianza_velocita, varianza_accelerazione])
+    filtrati, p_filtrate, transizioni, p_predette = np.empty((n, 3)), np.empty((n, 3, 3)), [], []
+    for i in range(n):
+        if i:
+            d = tempi[i] - tempi[i - 1]
+            f = np.array([[1.0, d, d * d / 2], [0.0, 1.0, d], [0.0, 0.0, 1.0]])
+            rumore = q * np.array([[d ** 5 / 20, d ** 4 / 8, d ** 3 / 6],
+                                   [d ** 4 / 8, d ** 3 / 3, d ** 2 / 2],
+                                   [d ** 3 / 6, d ** 2 / 2, d]])
+            rumore[:2, :2] += q_controllo * d * np.array([[d * d / 3, d / 2], [d / 2, 1.0]])
+            x = f @ x
+            if controllo is not None:
+                x[:2] += controllo[i]
+            p = f @ p @ f.T + rumore
+            transizioni.append(f)
+            p_predette.append(p)
+        k = p @ h.T / (h @ p @ h.T + r)
+        x = x + (k * (quota[i] - x[0])).ravel()
+        p = (np.eye(3) - k @ h) @ p
+        filtrati[i], p_filtrate[i] = x, p
+    if not smoother:
+        return filtrati, p_filtrate
+    stati, covarianze = filtrati.copy(), p_filtrate.copy()
+    for t in range(n - 2, -1, -1):
+        j = p_filtrate[t] @ transizioni[t].T @ np.linalg.inv(p_predette[t])
+        predetto = transizioni[t] @ filtrati[t] + (0 if controllo is None else np.r_[controllo[t + 1], 0.0])
+        stati[t] = filtrati[t] + j @ (stati[t + 1] - predetto)
+        covarianze[t] = p_filtrate[t] + j @ (covarianze[t + 1] - p_predette[t]) @ j.T
+    return stati, covarianze
+
+
+def process_per_colonna(imu_filter, df, axes=('accel_x_g', 'accel_y_g', 'accel_z_g')):
+    """IMUFilter.process originale: offset sottratti colonna per colonna e filtri asse per asse."""
+    df = imu_filter.calibrate_offsets(df)
+    b, a = butter(imu_filter.butter_order, imu_filter.cutoff / (0.5 * imu_filter.fs), btype='low')
+    for axis in axes:
+        df[f'{axis}_filtered'] = kalman_filter_loop(imu_filter, filtfilt(b, a, df[axis]))
+    return df
+
+
+def rimuovi_spike_loop(data, finestra=10, soglia=5):
+    """Versione originale dello STEP 1 di process_rocket_data (ciclo con np.median), tenuta come riferimento."""
+    data = np.array(data, dtype=float)
+    n = len(data)
+    spike_idx = []
+    for i in range(1, n - 1):
+        start = max(0, i - finestra)
+        end = min(n, i + finestra + 1)
+        neighbors = np.concatenate([data[start:i], data[i + 1:end]])
+        mediana_locale = np.median(neighbors)
+        if abs(data[i] - mediana_locale) > soglia:
+            data[i] = mediana_locale
+            spike_idx.append(i)
+    return data, spike_idx
+
+
+# ---------------------------
+# ALLINEAMENTO E ASSETTO
+# ---------------------------
+def allinea_pandas(df_imu, df_bmp, fs):
+    """Riferimento: reindex + interpolate per l'IMU e merge_asof per il BMP."""
+    griglia = pd.DataFrame({'timestamp_sec': np.arange(np.ceil(df_bmp['timestamp_sec'].iloc[0] * fs),
+                                                       np.floor(df_bmp['timestamp_sec'].iloc[-1] * fs) + 1) / fs})
+    imu = df_imu.set_index('timestamp_sec')
+    imu = imu.reindex(imu.index.union(griglia['timestamp_sec'])).interpolate('index').reindex(griglia['timestamp_sec'])
+    return pd.merge_asof(griglia, df_bmp, on='timestamp_sec').join(imu.reset_index(drop=True))
+
+
+def assetto_loop(tempi, quaternione, gyro_dps):
+    """Integrazione dei giroscopi campione per campione (ciclo Python), come riferimento."""
+    uscita = [quaternione]
+    for k in range(1, len(tempi)):
+        angoli = np.radians(gyro_dps[k - 1]) * (tempi[k] - tempi[k - 1])
+        modulo = np.linalg.norm(angoli)
+        rotazione = np.r_[np.cos(modulo / 2), angoli / modulo * np.sin(modulo / 2)] if modulo else np.r_[1.0, 0, 0, 0]
+        uscita.append(prodotto(uscita[-1], rotazione))
+    return np.array(uscita)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from decoder import BMP_DTYPE, HEADER, IMU_DTYPE
+from fusion import G0
+
+
+# ---------------------------
+# LOG BINARIO SINTETICO
+# ---------------------------
+def genera_log(path, secondi, imu_hz=1000, bmp_hz=100, seed=0, t0_us=1_000_000):
+    """
+    Scrive un log M510 sintetico con lo stesso formato del firmware:
+    `imu_hz / bmp_hz` pacchetti 'I' seguiti da un pacchetto 'B'.
+    """
+    rng = np.random.default_rng(seed)
+    per_gruppo = imu_hz // bmp_hz
+    n_gruppi = int(secondi * bmp_hz)
+
+    imu_packet = np.dtype([('marker', 'u1'), ('data', IMU_DTYPE)])
+    bmp_packet = np.dtype([('marker', 'u1'), ('data', BMP_DTYPE)])
+    gruppo = np.dtype([('imu', imu_packet, (per_gruppo,)), ('bmp', bmp_packet)])
+
+    dati = np.zeros(n_gruppi, dtype=gruppo)
+    dati['imu']['marker'] = ord('I')
+    for name in IMU_DTYPE.names[:-1]:
+        dati['imu']['data'][name] = rng.integers(-3000, 3000, (n_gruppi, per_gruppo))
+    t_us = t0_us + np.arange(n_gruppi * per_gruppo, dtype=np.int64).reshape(n_gruppi, per_gruppo) * (1_000_000 // imu_hz)
+    dati['imu']['data']['timestamp'] = t_us & 0xFFFFFFFF
+    dati['bmp']['marker'] = ord('B')
+    dati['bmp']['data']['altitude'] = rng.normal(0, 0.3, n_gruppi)
+    dati['bmp']['data']['timestamp'] = t_us[:, -1] & 0xFFFFFFFF
+
+    with open(path, 'wb') as f:
+        f.write(HEADER)
+        dati.tofile(f)
+    return path
+
+
+# ---------------------------
+# VOLI SINTETICI
+# ---------------------------
+def volo_sintetico(secondi=60, apogeo=60.0, durata=15.0, seed=0):
+    """Altitudine BMP a 100 Hz di un volo (arco di seno) con rumore e spike."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(secondi * 100)) / 100
+    decollo = secondi / 4
+    quota = np.where((t > decollo) & (t < decollo + durata), apogeo * np.sin(np.pi * (t - decollo) / durata), 0.0)
+    quota += rng.normal(0, 0.2, len(t))
+    quota[rng.choice(len(t), len(t) // 300, replace=False)] += rng.uniform(10, 40, len(t) // 300)
+    return pd.DataFrame({'timestamp_sec': t, 'altitude': quota})
+
+
+def volo_imu_sintetico(secondi, seed=0):
+    """
+    Volo con spinta (200 m/s² per 0.15 s) e caduta libera fino all'impatto: accelerazione
+    verticale a 1 kHz con bias e rumore, quota BMP a ~100 Hz con tempi irregolari.
+    Restituisce (tempi IMU, accelerazione, quota vera, velocità vera, tempi BMP, quota BMP).
+    """
+    rng = np.random.default_rng(seed)
+    tempi_imu = np.arange(int(secondi * 1000)) / 1000
+    decollo, spinta, a_spinta = secondi / 3, 0.15, 200.0
+    tau = tempi_imu - decollo
+    velocita = np.where(tau < 0, 0.0, np.where(tau < spinta, a_spinta * tau, a_spinta * spinta - G0 * (tau - spinta)))
+    quota = np.where(tau < 0, 0.0, np.where(tau < spinta, 0.5 * a_spinta * tau ** 2,
+                                            0.5 * a_spinta * spinta ** 2 + a_spinta * spinta * (tau - spinta)
+                                            - 0.5 * G0 * (tau - spinta) ** 2))
+    a_terra = quota < 0
+    quota[a_terra] = velocita[a_terra] = 0.0
+    accelerazione = np.gradient(velocita, tempi_imu) + 0.3 + rng.normal(0, 0.5, len(tempi_imu))
+    tempi_bmp = np.cumsum(rng.uniform(0.008, 0.012, int(secondi * 100)))
+    tempi_bmp = tempi_bmp[tempi_bmp < tempi_imu[-1]]
+    quota_bmp = np.interp(tempi_bmp, tempi_imu, quota) + rng.normal(0, 0.25, len(tempi_bmp))
+    return tempi_imu, accelerazione, quota, velocita, tempi_bmp, quota_bmp
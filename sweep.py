@@ -0,0 +1,261 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from Filter import filtra_colonne, finestra_savgol, progetto_butter, smoother_accelerazione_costante, sopprimi_spike
+from flight import intervallo_volo
+from fusion import accelerazione_verticale, asse_razzo, fondi
+
+# Modelli di altitudine e velocità confrontabili nello sweep (come le CONFIGURAZIONI di pipeline.py)
+MODELLI = ('catena', 'accelerazione_costante', 'fusione')
+# Parametri esplorabili, con i valori di plotter.py e delle CONFIGURAZIONI di pipeline.py
+PARAMETRI_PREDEFINITI = {
+    'modello': 'catena',
+    # catena di process_rocket_data
+    'cutoff_freq': 1.5,
+    'savgol_window_sec': 0.6,
+    'kalman_q': 0.05,
+    'kalman_r': 0.5,
+    'spike_finestra': 10,
+    'spike_soglia': 5,
+    'spike_sequenziale': True,
+    'kalman_smoother': False,
+    'tempo_iniziale': 1,
+    # smoother_accelerazione_costante (q) e fusion.fondi (q_bias, q_accelerazione); r per entrambi
+    'q': 100.0,
+    'r': 0.0625,
+    'q_bias': 0.01,
+    'q_accelerazione': 0.5,
+    'smoother': True,
+}
+# Parametri del taglio automatico del volo (get_flight_interval_strict) usati per le metriche
+TAGLIO_PREDEFINITO = {'threshold_start': 1.0, 'threshold_end': 0.5, 'margin': 3.0, 'centratura_hmax': True}
+METRICHE = ['hmax', 'delta', 'v_piu', 't_v_piu', 'v_meno', 't_v_meno', 'spike_altitudine', 'spike_velocita']
+
+
+def griglia_parametri(**valori):
+    """
+    Prodotto cartesiano dei valori: griglia_parametri(kalman_q=[0.01, 0.05], kalman_r=[0.5, 1])
+    restituisce 4 dizionari. I parametri non indicati restano quelli di PARAMETRI_PREDEFINITI.
+    """
+    nomi = list(valori)
+    return [dict(zip(nomi, combinazione)) for combinazione in itertools.product(*(valori[n] for n in nomi))]
+
+
+# ---------------------------
+# VALUTAZIONE DI UNA COMBINAZIONE
+# ---------------------------
+def prepara_volo(df_bmp):
+    """Tempi e quota come in process_rocket_data (senza duplicati né tempi non crescenti)."""
+    df = df_bmp.drop_duplicates(subset='timestamp_sec')
+    df = df[df['timestamp_sec'].diff() > 0]
+    return df['timestamp_sec'].to_numpy(dtype=float), df['altitude'].to_numpy(dtype=float)
+
+
+def valuta(tempi, quota, parametri, taglio=None, _spike_cache=None, imu=None):
+    """
+    Altitudine e velocità con il `modello` dei parametri e metriche nel tratto di volo tagliato
+    come get_flight_interval_strict: Hmax, Delta, V+ e V- con i loro tempi, numero di spike sostituiti.
+
+    - 'catena': process_rocket_data (altitudine filtrata, velocità derivata e filtrata con gli
+      stessi coefficienti)
+    - 'accelerazione_costante': smoother_accelerazione_costante (q, r) sulla quota senza spike e offset
+    - 'fusione': fusion.fondi (q_bias, q_accelerazione, r) con l'accelerometro, a 1 kHz
+
+    :param imu: (tempi IMU nella base BMP, accelerazione [g] lungo l'asse del razzo), per 'fusione'
+    """
+    p = {**PARAMETRI_PREDEFINITI, **parametri}
+    taglio = {**TAGLIO_PREDEFINITO, **(taglio or {})}
+    if p['modello'] not in MODELLI:
+        raise ValueError(f"Modello sconosciuto: {p['modello']!r} (disponibili: {', '.join(MODELLI)})")
+    finestra_offset = tempi <= p['tempo_iniziale']
+    spike = (p['spike_finestra'], p['spike_soglia'], p['spike_sequenziale'])
+
+    # L'anti-spike sulla quota non dipende dagli altri parametri: si riusa fra le combinazioni
+    chiave = spike
+    if _spike_cache is not None and chiave in _spike_cache:
+        quota_pulita, spike_quota = _spike_cache[chiave]
+    else:
+        quota_pulita, spike_quota = sopprimi_spike(quota, *spike)
+        if _spike_cache is not None:
+            _spike_cache[chiave] = quota_pulita, spike_quota
+
+    spike_velocita = 0
+    if p['modello'] == 'catena':
+        fs = 1 / np.diff(tempi).mean()
+        sos = progetto_butter(4, p['cutoff_freq'], fs)
+        window_length = finestra_savgol(p['savgol_window_sec'], fs)
+        kalman = (p['kalman_q'], p['kalman_r'])
+        dati = quota_pulita[:, np.newaxis].copy()
+        quota_kalman, _ = filtra_colonne(dati, finestra_offset, sos, window_length, *kalman,
+                                         None, kalman_smoother=p['kalman_smoother'])
+        velocita = np.gradient(quota_kalman[:, 0], tempi)[:, np.newaxis]
+        velocita_kalman, spike_v = filtra_colonne(velocita, finestra_offset, sos, window_length, *kalman,
+                                                  *spike, p['kalman_smoother'])
+        h, v = quota_kalman[:, 0], velocita_kalman[:, 0]
+        spike_velocita = len(spike_v[0])
+    else:
+        quota_offset = quota_pulita - quota_pulita[finestra_offset].mean()
+        if p['modello'] == 'accelerazione_costante':
+            stati, _ = smoother_accelerazione_costante(tempi, quota_offset, p['q'], p['r'], smoother=p['smoother'],
+                                                       deviazioni=False)
+        else:
+            if imu is None or not len(imu[0]):
+                raise ValueError("Il modello 'fusione' richiede i dati IMU del volo")
+            tempi_imu, asse = imu
+            accelerazione = accelerazione_verticale(tempi_imu, asse, p['tempo_iniziale'])
+            stati, _ = fondi(tempi_imu, accelerazione, tempi, quota_offset, p['q_bias'], p['q_accelerazione'],
+                             p['r'], p['smoother'])
+            # Come fusione_baro_imu: traccia a 1 kHz nel tratto comune ai due flussi
+            comune = (tempi_imu >= tempi[0]) & (tempi_imu <= tempi[-1])
+            tempi, stati = tempi_imu[comune], stati[comune]
+        h, v = stati[:, 0], stati[:, 1]
+
+    intervallo = intervallo_volo(tempi, h, **taglio)
+    t_start, t_end = intervallo if intervallo is not None else (tempi[0], tempi[-1])
+    dentro = (tempi >= t_start) & (tempi <= t_end)
+    t, h, v = tempi[dentro] - t_start, h[dentro], v[dentro]
+    i_piu, i_meno = np.argmax(v), np.argmin(v)
+    return {'hmax': h.max(), 'delta': h.max() - h.min(),
+            'v_piu': v[i_piu], 't_v_piu': t[i_piu], 'v_meno': v[i_meno], 't_v_meno': t[i_meno],
+            'spike_altitudine': len(spike_quota), 'spike_velocita': spike_velocita}
+
+
+# ---------------------------
+# MEMORIA CONDIVISA
+# ---------------------------
+_VOLI = {}  # nel processo di lavoro: nome -> (tempi, quota, (tempi IMU, asse IMU)) sulla memoria condivisa
+_MEMORIA = None
+
+
+def _collega(nome_memoria, disposizione):
+    """Inizializzatore dei processi: viste numpy sui voli nella memoria condivisa, senza copie."""
+    global _MEMORIA
+    _MEMORIA = shared_memory.SharedMemory(name=nome_memoria)
+    dati = np.ndarray((disposizione['totale'],), dtype=np.float64, buffer=_MEMORIA.buf)
+    for nome, (inizio, n, n_imu) in disposizione['voli'].items():
+        imu = inizio + 2 * n
+        _VOLI[nome] = (dati[inizio:inizio + n], dati[inizio + n:imu],
+                       (dati[imu:imu + n_imu], dati[imu + n_imu:imu + 2 * n_imu]))
+
+
+def _valuta_blocco(volo, combinazioni, taglio):
+    tempi, quota, imu = _VOLI[volo]
+    cache = {}
+    righe = []
+    for indice, parametri in combinazioni:
+        try:
+            riga = valuta(tempi, quota, parametri, taglio, cache, imu)
+        except Exception as e:
+            # Una combinazione non valida (es. cutoff oltre Nyquist) non ferma lo sweep
+            riga = {'errore': f"{type(e).__name__}: {e}"}
+        righe.append({'indice': indice, 'volo': volo, **parametri, **riga})
+    return righe
+
+
+def sweep(voli, griglia, taglio=None, workers=None, blocco=16, imu=None, colonna_accel='accel_z_g', assetto=False):
+    """
+    Valuta ogni combinazione di `griglia` su ogni volo in un pool di processi. Tempi e quota
+    dei voli (e tempi e accelerazione IMU, se indicati) stanno in un unico blocco di memoria
+    condivisa letto dai processi senza copie; ai processi arrivano solo i dizionari dei parametri.
+
+    :param voli: Dizionario nome -> DataFrame BMP ('timestamp_sec', 'altitude')
+    :param griglia: Lista di dizionari di parametri (vedi griglia_parametri e PARAMETRI_PREDEFINITI)
+    :param taglio: Parametri del taglio del volo (default: TAGLIO_PREDEFINITO)
+    :param workers: Numero di processi (default: numero di CPU; 0 = nel processo corrente)
+    :param blocco: Combinazioni per attività (le combinazioni dello stesso blocco
+                   riusano l'anti-spike sulla quota)
+    :param imu: Dizionario nome -> DataFrame IMU dei voli, per il modello 'fusione' (tempi riportati
+                sulla base BMP con attrs['offset_tempo'] del DataFrame BMP)
+    :param colonna_accel: Asse dell'accelerometro allineato al razzo, per 'fusione'
+    :param assetto: True per la verticale di attitude.integra_assetto invece di `colonna_accel`
+    :return: DataFrame con una riga per (volo, combinazione): parametri e METRICHE
+    """
+    preparati = {}
+    for nome, df in voli.items():
+        tempi, quota = prepara_volo(df)
+        tempi_imu, asse = np.empty(0), np.empty(0)
+        if imu is not None and nome in imu:
+            tempi_imu, asse = asse_razzo(imu[nome], df.attrs.get('offset_tempo', 0.0), colonna_accel,
+                                         PARAMETRI_PREDEFINITI['tempo_iniziale'], assetto)
+        preparati[nome] = (tempi, quota, tempi_imu, asse)
+    disposizione = {'voli': {}, 'totale': 0}
+    for nome, (tempi, _, tempi_imu, _) in preparati.items():
+        disposizione['voli'][nome] = (disposizione['totale'], len(tempi), len(tempi_imu))
+        disposizione['totale'] += 2 * len(tempi) + 2 * len(tempi_imu)
+
+    # Combinazioni con lo stesso anti-spike nello stesso blocco
+    ordinate = sorted(enumerate(griglia), key=lambda c: json.dumps(
+        [c[1].get(k, PARAMETRI_PREDEFINITI[k]) for k in ('spike_finestra', 'spike_soglia', 'spike_sequenziale')]))
+    attivita = [(volo, ordinate[i:i + blocco]) for volo in preparati for i in range(0, len(ordinate), blocco)]
+
+    memoria = shared_memory.SharedMemory(create=True, size=max(8, 8 * disposizione['totale']))
+    try:
+        dati = np.ndarray((disposizione['totale'],), dtype=np.float64, buffer=memoria.buf)
+        for nome, colonne in preparati.items():
+            inizio = disposizione['voli'][nome][0]
+            for colonna in colonne:
+                dati[inizio:inizio + len(colonna)] = colonna
+                inizio += len(colonna)
+        del dati
+
+        righe = []
+        if workers == 0:
+            _collega(memoria.name, disposizione)
+            try:
+                for volo, combinazioni in attivita:
+                    righe.extend(_valuta_blocco(volo, combinazioni, taglio))
+            finally:
+                _VOLI.clear()
+                _MEMORIA.close()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_collega,
+                                     initargs=(memoria.name, disposizione)) as pool:
+                futures = [pool.submit(_valuta_blocco, volo, combinazioni, taglio) for volo, combinazioni in attivita]
+                for future in as_completed(futures):
+                    righe.extend(future.result())
+    finally:
+        memoria.close()
+        memoria.unlink()
+
+    tabella = pd.DataFrame(righe).sort_values(['volo', 'indice'], kind='stable').reset_index(drop=True)
+    return tabella.drop(columns='indice')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep dei parametri dei filtri di altitudine e velocità')
+    parser.add_argument('log', nargs='+', help='Log dei voli')
+    parser.add_argument('--griglia', required=True,
+                        help='JSON nome -> lista di valori, es. \'{"kalman_q": [0.01, 0.05], "kalman_r": [0.5, 1]}\' '
+                             'o \'{"modello": ["fusione"], "q_bias": [0.01, 0.1], "r": [0.0625, 0.25]}\'')
+    parser.add_argument('--workers', type=int, default=None, help='Numero di processi')
+    parser.add_argument('--colonna-accel', default='accel_z_g', help="Asse dell'accelerometro per il modello 'fusione'")
+    parser.add_argument('--assetto', action='store_true',
+                        help="Modello 'fusione' con la verticale dai giroscopi invece di --colonna-accel")
+    parser.add_argument('--output', default='sweep.csv', help='CSV dei risultati')
+    args = parser.parse_args()
+
+    from decode_cache import DecodeCache
+    from decoder import Decoder
+    griglia = griglia_parametri(**json.loads(args.griglia))
+    # L'IMU serve (e va in memoria condivisa) solo se la griglia contiene la fusione
+    con_imu = any(c.get('modello') == 'fusione' for c in griglia)
+    voli, imu = {}, {}
+    for path in args.log:
+        decodificato = Decoder(path).decode(cache=DecodeCache())
+        voli[os.path.basename(path)] = decodificato[3]
+        if con_imu:
+            imu[os.path.basename(path)] = decodificato[2]
+    t = time.perf_counter()
+    tabella = sweep(voli, griglia, workers=args.workers, imu=imu if con_imu else None,
+                    colonna_accel=args.colonna_accel, assetto=args.assetto)
+    durata = time.perf_counter() - t
+    tabella.to_csv(args.output, index=False)
+    print(f"{len(tabella)} valutazioni ({len(griglia)} combinazioni × {len(voli)} voli) in {durata:.1f} s -> {args.output}")
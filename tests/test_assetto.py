@@ -0,0 +1,22 @@
+import numpy as np
+
+from attitude import integra_assetto
+from riferimenti import assetto_loop
+
+
+def test_integra_assetto_come_ciclo():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    tempi = np.arange(n) / 1000
+    # Sul pad inclinato di 5°, poi spinta e rotazioni casuali
+    accel = np.tile([0.0, np.sin(np.radians(5)), np.cos(np.radians(5))], (n, 1)) + rng.normal(0, 0.01, (n, 3))
+    lancio = n // 3
+    accel[lancio:lancio + 150] *= 6
+    gyro = rng.normal(0, 0.2, (n, 3))
+    gyro[lancio:] += rng.normal(0, 30, (n - lancio, 3))
+
+    quaternioni, _, _ = integra_assetto(tempi, accel, gyro)
+    tratto = slice(lancio - 1, n)
+    senza_bias = gyro[tratto] - gyro[tempi <= 1].mean(axis=0)
+    riferimento = assetto_loop(tempi[tratto], quaternioni[lancio - 1], senza_bias)
+    np.testing.assert_allclose(quaternioni[tratto], riferimento, rtol=0, atol=1e-9)
@@ -0,0 +1,31 @@
+import mmap
+
+import pandas as pd
+
+from decode_cache import DecodeCache
+from decoder import Decoder
+from sintetici import genera_log
+
+
+def _base(array):
+    while getattr(array, 'base', None) is not None and not isinstance(array, mmap.mmap):
+        array = array.base
+    return array
+
+
+def test_cache_mappata_senza_copie(tmp_path):
+    path = genera_log(str(tmp_path / 'log_1_RP1.bin'), 3, t0_us=2 ** 32 - 1_000_000)
+    cache = DecodeCache(str(tmp_path / 'cache'))
+    atteso = Decoder(path).decode()
+    for _ in range(2):  # scrittura della voce, poi lettura
+        _, _, df_imu, df_bmp = Decoder(path).decode(cache=cache)
+        pd.testing.assert_frame_equal(df_imu, atteso[2])
+        pd.testing.assert_frame_equal(df_bmp, atteso[3])
+        assert isinstance(_base(df_imu['accel_x'].to_numpy()), mmap.mmap)
+
+
+def test_indice_conserva_le_voci(tmp_path):
+    cache = DecodeCache(str(tmp_path / 'cache'))
+    cache.aggiorna_indice({'/a': [1, 2, 'x']})
+    DecodeCache(str(tmp_path / 'cache')).aggiorna_indice({'/b': [3, 4, 'y']})
+    assert set(cache._leggi_indice()) == {'/a', '/b'}
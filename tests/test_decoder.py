@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from decoder import COLONNE_FISICHE, IMU_DTYPE, BMP_DTYPE, Decoder, colonne_fisiche, leggi_log, rimuovi_salti
+from riferimenti import decode_originale, decode_struct, rimuovi_salti_loop
+from sintetici import genera_log
+
+# Log che attraversa il rollover di micros() dopo mezzo secondo
+T0_ROLLOVER = 2 ** 32 - 500_000
+
+
+@pytest.fixture
+def log_sintetico(tmp_path):
+    return genera_log(str(tmp_path / 'log_1_RP1.bin'), 5)
+
+
+@pytest.fixture
+def log_rollover(tmp_path):
+    return genera_log(str(tmp_path / 'log_2_RP2.bin'), 2, t0_us=T0_ROLLOVER)
+
+
+def test_leggi_log_come_struct(log_sintetico):
+    imu_data, bmp_data = leggi_log(log_sintetico)
+    imu_rif, bmp_rif = decode_struct(log_sintetico)
+    for nome in IMU_DTYPE.names:
+        np.testing.assert_array_equal(imu_data[nome], imu_rif[nome])
+    for nome in BMP_DTYPE.names:
+        np.testing.assert_array_equal(bmp_data[nome], bmp_rif[nome])
+
+
+def test_decode_come_originale(log_sintetico):
+    _, _, df_imu, df_bmp = Decoder(log_sintetico).decode()
+    imu_rif, bmp_rif = decode_originale(log_sintetico)
+    fisiche = colonne_fisiche(df_imu)
+    for colonna in COLONNE_FISICHE:
+        np.testing.assert_allclose(fisiche[colonna], imu_rif[colonna], rtol=1e-6)
+    np.testing.assert_allclose(df_imu['timestamp_sec'], imu_rif['timestamp_sec'], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(df_bmp['timestamp_sec'], bmp_rif['timestamp_sec'], rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(df_bmp['altitude'], bmp_rif['altitude'])
+
+
+@pytest.mark.parametrize('chunk_size, finestra', [(777, 4096), (100_000, 1 << 22)])
+def test_decode_chunks_come_decode(log_rollover, chunk_size, finestra):
+    decoder = Decoder(log_rollover)
+    _, _, df_imu, df_bmp = decoder.decode()
+    blocchi = {'imu': [], 'bmp': []}
+    for tipo, df in decoder.decode_chunks(chunk_size, finestra):
+        assert len(df) <= chunk_size
+        blocchi[tipo].append(df)
+    pd.testing.assert_frame_equal(pd.concat(blocchi['imu'], ignore_index=True), df_imu, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.concat(blocchi['bmp'], ignore_index=True), df_bmp, check_dtype=False)
+
+
+def test_imu_compatto(log_rollover):
+    df_imu = Decoder(log_rollover).decode()[2]
+    riferimento = decode_struct(log_rollover)[0].to_numpy(dtype=np.int64)
+    assert df_imu['accel_x'].dtype == np.int16 and 'accel_x_g' not in df_imu.columns
+    assert df_imu['timestamp'].dtype == np.int64 and df_imu['timestamp'].is_monotonic_increasing
+    fisiche = colonne_fisiche(df_imu)
+    for colonna, (grezza, scala) in COLONNE_FISICHE.items():
+        assert fisiche[colonna].dtype == np.float32
+        np.testing.assert_allclose(fisiche[colonna], riferimento[:, IMU_DTYPE.names.index(grezza)] * scala, rtol=1e-6)
+    assert colonne_fisiche(fisiche) is fisiche
+
+
+def test_rimuovi_salti_come_ciclo():
+    rng = np.random.default_rng(0)
+    ts = np.cumsum(rng.normal(0.01, 0.0005, 20_000))
+    for i in rng.choice(len(ts), 5, replace=False):
+        ts[i:] += rng.uniform(1, 30)
+    df = pd.DataFrame({'timestamp_sec': ts, 'altitude': rng.normal(0, 0.3, len(ts))})
+    np.testing.assert_array_equal(rimuovi_salti(df.copy())['timestamp_sec'],
+                                  rimuovi_salti_loop(df.copy())['timestamp_sec'])
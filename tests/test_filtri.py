@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Filter import (IMUFilter, _covarianze_kalman, filtro_kalman, smoother_accelerazione_costante, smoother_kalman,
+                    sopprimi_spike)
+from riferimenti import (filtro_kalman_loop, kalman_filter_loop, rimuovi_spike_loop, smoother_accelerazione_costante_loop,
+                         smoother_kalman_loop)
+from sintetici import volo_sintetico
+
+# Coppie (q, r) con guadagno stazionario che alterna fra due float vicini
+Q_R_OSCILLANTI = ((1.3187, 0.2079), (2.644040211040332, 1.532608810125392))
+Q_R = ((0.05, 0.5), (0.001, 0.01)) + Q_R_OSCILLANTI
+
+
+def quota_rumorosa(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(0, 0.05, n)) + rng.normal(0, 0.3, n)
+
+
+@pytest.mark.parametrize('q, r', Q_R)
+def test_filtro_kalman_come_ciclo(q, r):
+    quota = quota_rumorosa(20_000)
+    guadagni, _, _ = _covarianze_kalman(q, r, 1.0, len(quota))
+    assert len(guadagni) < 200
+    filtrate, _ = filtro_kalman(quota, q, r, quota[0], 1)
+    np.testing.assert_allclose(filtrate, filtro_kalman_loop(quota, q, r, quota[0], 1), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('q, r', Q_R)
+def test_smoother_kalman_come_ciclo(q, r):
+    quota = quota_rumorosa(5000, seed=1)
+    medie, covarianze = smoother_kalman(quota, q, r, quota[0], 1)
+    medie_rif, covarianze_rif = smoother_kalman_loop(quota, q, r, quota[0], 1)
+    np.testing.assert_allclose(medie, medie_rif, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(covarianze, covarianze_rif, rtol=0, atol=1e-9)
+
+
+def test_imu_kalman_filter_come_ciclo():
+    rng = np.random.default_rng(0)
+    dati = rng.normal(0, 0.05, (20_000, 3)).cumsum(axis=0) * 1e-2 + rng.normal(0, 0.2, (20_000, 3))
+    imu_filter = IMUFilter(sampling_rate=1000, kalman_q=0.001, kalman_r=0.01)
+    filtrati = imu_filter.kalman_filter(dati)
+    for asse in range(3):
+        np.testing.assert_allclose(filtrati[:, asse], kalman_filter_loop(imu_filter, dati[:, asse]), rtol=0, atol=1e-9)
+
+
+def test_sopprimi_spike_come_ciclo():
+    rng = np.random.default_rng(0)
+    dati = quota_rumorosa(20_000)
+    spike = rng.choice(len(dati), 40, replace=False)
+    dati[spike] += rng.choice([-1, 1], len(spike)) * rng.uniform(6, 40, len(spike))
+    dati[1000:1005] += 30
+    corretti, trovati = sopprimi_spike(dati)
+    riferimento, indici = rimuovi_spike_loop(dati)
+    np.testing.assert_array_equal(corretti, riferimento)
+    assert trovati.tolist() == indici
+
+
+def _volo_irregolare(secondi, seed=0):
+    df = volo_sintetico(secondi, seed=seed)
+    tempi = df['timestamp_sec'].to_numpy() + np.random.default_rng(seed + 1).uniform(-0.002, 0.002, len(df))
+    return tempi, df['altitude'].to_numpy()
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 65, 3000])
+@pytest.mark.parametrize('q, r, smoother', [(100.0, 0.0625, True), (0.01, 1.0, True), (100.0, 0.0625, False)])
+def test_accelerazione_costante_come_ciclo(n, q, r, smoother):
+    tempi, quota = _volo_irregolare(30)
+    tempi, quota = tempi[:n], quota[:n]
+    stati, deviazioni = smoother_accelerazione_costante(tempi, quota, q, r, smoother=smoother)
+    stati_rif, covarianze_rif = smoother_accelerazione_costante_loop(tempi, quota, q, r, smoother=smoother)
+    assert stati.shape == (n, 3)
+    scala = np.maximum(np.abs(stati_rif).max(axis=0, initial=0.0), 1.0)
+    np.testing.assert_allclose(stati / scala, stati_rif / scala, rtol=0, atol=1e-11)
+    np.testing.assert_allclose(deviazioni, np.sqrt(np.einsum('nii->ni', covarianze_rif)), rtol=1e-9, atol=1e-12)
+
+
+def test_accelerazione_costante_con_controllo_come_ciclo():
+    tempi, quota = _volo_irregolare(20)
+    controllo = np.random.default_rng(2).normal(0, 0.01, (len(tempi), 2))
+    stati, _ = smoother_accelerazione_costante(tempi, quota, 1.0, 0.0625, controllo=controllo, q_controllo=0.5)
+    stati_rif, _ = smoother_accelerazione_costante_loop(tempi, quota, 1.0, 0.0625, controllo=controllo,
+                                                        q_controllo=0.5)
+    np.testing.assert_allclose(stati, stati_rif, rtol=0, atol=1e-9)
+
+
+def test_accelerazione_costante_come_pykalman():
+    pykalman = pytest.importorskip('pykalman')
+    tempi, quota = _volo_irregolare(20)
+    q, r = 100.0, 0.0625
+    d = np.diff(tempi)[:, np.newaxis, np.newaxis]
+    uno, zero = np.ones_like(d), np.zeros_like(d)
+    f = np.block([[uno, d, d * d / 2], [zero, uno, d], [zero, zero, uno]])
+    rumore = q * np.block([[d ** 5 / 20, d ** 4 / 8, d ** 3 / 6], [d ** 4 / 8, d ** 3 / 3, d ** 2 / 2],
+                           [d ** 3 / 6, d ** 2 / 2, d]])
+    kf = pykalman.KalmanFilter(transition_matrices=f, transition_covariance=rumore, observation_matrices=[[1, 0, 0]],
+                               observation_covariance=r, initial_state_mean=[quota[0], 0, 0],
+                               initial_state_covariance=np.diag([r, 10, 100]))
+    np.testing.assert_allclose(smoother_accelerazione_costante(tempi, quota, q, r)[0], kf.smooth(quota)[0],
+                               rtol=0, atol=1e-8)
+
+
+def test_imu_process_float32():
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame({'timestamp_sec': np.arange(n) / 1000, **{c: rng.normal(0, 0.2, n) for c in IMUFilter.COLONNE}})
+    uscita = IMUFilter(sampling_rate=1000, kalman_q=0.001, kalman_r=0.01).process(df)
+    assert {f'{a}_filtered' for a in ('accel_x_g', 'accel_y_g', 'accel_z_g')} <= set(uscita.columns)
+    assert np.isfinite(uscita['accel_z_g_filtered']).all()
@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Filter import RocketDataStream
+from sintetici import volo_sintetico
+from test_filtri import Q_R_OSCILLANTI
+
+
+def _a_blocchi(flusso, df, blocco):
+    uscite = [flusso.process(df.iloc[i:i + blocco]) for i in range(0, len(df), blocco)]
+    return pd.concat(uscite + [flusso.flush()], ignore_index=True)
+
+
+def _array_a_blocchi(flusso, df, blocco):
+    tempi, quota = df['timestamp_sec'].to_numpy(), df['altitude'].to_numpy()
+    uscite = [flusso.process_array(tempi[i:i + blocco], quota[i:i + blocco]) for i in range(0, len(df), blocco)]
+    return flusso.frame(np.concatenate(uscite + [flusso.flush_array()]))
+
+
+@pytest.mark.parametrize('q, r', Q_R_OSCILLANTI)
+def test_flusso_convergenza(q, r):
+    """Transitorio breve e risultato indipendente dai blocchi anche per Q_R_OSCILLANTI."""
+    df = volo_sintetico(60)
+    t = time.perf_counter()
+    unico = _a_blocchi(RocketDataStream(kalman_q=q, kalman_r=r, fs=100), df, len(df))
+    assert time.perf_counter() - t < 1
+    blocchi = _a_blocchi(RocketDataStream(kalman_q=q, kalman_r=r, fs=100), df, 137)
+    np.testing.assert_allclose(unico['altitude_kalman'], blocchi['altitude_kalman'], rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('n', [0, 1, 2])
+def test_flusso_corto(n):
+    """Con 0, 1 o 2 righe (la prima è scartata) flush() dà un DataFrame vuoto con le colonne."""
+    df = pd.DataFrame({'timestamp_sec': np.arange(n) / 100, 'altitude': np.zeros(n)})
+    uscita = _a_blocchi(RocketDataStream(), df, max(n, 1))
+    assert uscita.empty and 'altitude_kalman' in uscita
+
+
+@pytest.mark.parametrize('blocco, blocco_minimo', [(10, 1), (10, 100), (7, 1000), (1000, 1), (3, 50_000)])
+def test_flusso_array_come_blocco_unico(blocco, blocco_minimo):
+    df = volo_sintetico(40)
+    unico = _a_blocchi(RocketDataStream(), df, len(df))
+    pd.testing.assert_frame_equal(_array_a_blocchi(RocketDataStream(blocco_minimo=blocco_minimo), df, blocco), unico)
+    pd.testing.assert_frame_equal(_a_blocchi(RocketDataStream(blocco_minimo=blocco_minimo), df, blocco), unico)